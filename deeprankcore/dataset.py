@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import copy
 import logging
+import operator
 import os
 import re
 import sys
 import warnings
-from ast import literal_eval
-from typing import Dict, List, Optional, Tuple, Union
+import weakref
+from functools import partial
+from multiprocessing import Pool
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import h5py
 import matplotlib.pyplot as plt
@@ -21,10 +25,33 @@ from deeprankcore.domain import edgestorage as Efeat
 from deeprankcore.domain import gridstorage
 from deeprankcore.domain import nodestorage as Nfeat
 from deeprankcore.domain import targetstorage as targets
+from deeprankcore.utils.catalogue import (EntryCatalogue, get_catalogue,
+                                         get_catalogues)
+from deeprankcore.utils.datacache import DataCache
+from deeprankcore.utils.featurelayout import (get_column_count,
+                                              get_schema_feature_columns,
+                                              get_standardization_vectors)
+from deeprankcore.utils.featurestats import compute_feature_stats
+from deeprankcore.utils.grid import read_grid_feature
+from deeprankcore.utils.hdf5files import (close_hdf5_file, get_hdf5_file,
+                                          release_hdf5_files, use_hdf5_files)
+from deeprankcore.utils.packedgraphs import PackedGraphs
 
 _log = logging.getLogger(__name__)
 
 
+# A target filter condition is one or more comparisons like "<=10.5", joined by "and" or "&".
+TARGET_CONDITION_PATTERN = re.compile(r"^\s*(<=|>=|==|!=|<|>)\s*([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*$")
+TARGET_CONDITION_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
 class DeeprankDataset(Dataset):
     def __init__(self, # pylint: disable=too-many-arguments
                  hdf5_path: Union[str, List[str]],
@@ -35,7 +62,9 @@ class DeeprankDataset(Dataset):
                  use_tqdm: bool,
                  root_directory_path: str,
                  target_filter: Union[Dict[str, str], None],
-                 check_integrity: bool
+                 check_integrity: bool,
+                 max_open_files: int,
+                 cache: Optional[DataCache]
     ):
         """Parent class of :class:`GridDataset` and :class:`GraphDataset` which inherits from :class:`torch_geometric.data.dataset.Dataset`.
 
@@ -59,7 +88,10 @@ class DeeprankDataset(Dataset):
         self.subset = subset
 
         self.target_filter = target_filter
-        
+
+        # the catalogues of all files, read concurrently, serve the integrity and feature checks and the indexing
+        self._catalogues = dict(zip(self.hdf5_paths, get_catalogues(self.hdf5_paths)))
+
         if check_integrity:
             self._check_hdf5_files()
 
@@ -77,21 +109,159 @@ class DeeprankDataset(Dataset):
         # get the device
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+        # read-only file handles, kept open between items in a pool of the process, shared with other datasets
+        if max_open_files < 1:
+            raise ValueError(f"max_open_files must be at least 1, got {max_open_files}")
+        self.max_open_files = max_open_files
+        self._use_hdf5_files()
+
+        self.cache = cache
+
+    def _use_hdf5_files(self):
+        "registers the dataset as a user of its files' handles, which are closed once no dataset uses them"
+
+        use_hdf5_files(self.hdf5_paths)
+        weakref.finalize(self, release_hdf5_files, list(self.hdf5_paths), os.getpid())
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # the catalogues are read again when needed, from their sidecar files
+        state["_catalogues"] = {}
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._use_hdf5_files()
+
+    def select_entries(self, indices: Union[List[int], np.ndarray]) -> DeeprankDataset:
+        """Makes a lightweight view on some of the dataset's entries.
+
+        The view is a shallow copy, that shares the features, statistics, data frame and cache with this dataset,
+        but has its own index and file handles.
+
+        Args:
+            indices (Union[List[int], np.ndarray]): The indices of the entries, in the order the view should have them.
+
+        Returns:
+            :class:`DeeprankDataset`: The view, of the same class as this dataset.
+        """
+
+        view = copy.copy(self)
+        view.index_entries = [self.index_entries[idx] for idx in indices]
+        return view
+
+    def _get_hdf5_file(self, hdf5_path: str) -> h5py.File:
+        """Gets a read-only handle to the .HDF5 file, opening it if needed.
+
+        Handles are reused between items, and shared with the other datasets of the process, up to max_open_files of them
+        (see :mod:`deeprankcore.utils.hdf5files`).
+
+        Args:
+            hdf5_path (str): .HDF5 file name.
+
+        Returns:
+            :class:`h5py.File`: The opened file.
+        """
+
+        return get_hdf5_file(hdf5_path, self.max_open_files)
+
+    def close_hdf5_files(self):
+        """Closes the read-only handles to the dataset's .HDF5 files, also those that other datasets of the process use.
+
+        Call this before writing to the dataset's files from the same process.
+        """
+
+        for hdf5_path in self.hdf5_paths:
+            close_hdf5_file(hdf5_path)
+
+    def preload_cache(self):
+        """Loads items into the dataset's cache, in index order, until its memory budget is used up.
+
+        With a shared cache, call this before creating the DataLoader, so that all workers use the loaded items.
+        """
+
+        if self.cache is None:
+            raise ValueError("The dataset has no cache to preload")
+
+        for idx in range(len(self)):
+            evictions = self.cache.evictions
+            self.get(idx)
+
+            if self.index_entries[idx] not in self.cache or self.cache.evictions > evictions:
+                break
+
+        _log.info(f"cached {len(self.cache)} of {len(self)} items, using {self.cache.nbytes} bytes")
+
+    def _get_catalogue(self, hdf5_path: str) -> EntryCatalogue:
+        "the catalogue of one of the dataset's files, read once"
+
+        catalogue = self._catalogues.get(hdf5_path)
+        if catalogue is None:
+            catalogue = get_catalogue(hdf5_path)
+            self._catalogues[hdf5_path] = catalogue
+
+        return catalogue
+
+    def _get_schemas(self) -> Dict[str, Dict[str, Dict[str, List[int]]]]:
+        """Gets the feature schema of every file that has entries.
+
+        Raises:
+            ValueError: If none of the files has entries.
+        """
+
+        schemas = {}
+        for hdf5_path in self.hdf5_paths:
+            catalogue = self._catalogues.get(hdf5_path)
+            if catalogue is not None and len(catalogue) > 0:
+                schemas[hdf5_path] = catalogue.schema
+
+        if len(schemas) == 0:
+            raise ValueError(f"No entries found in {self.hdf5_paths}")
+
+        return schemas
+
+    def _check_schemas(self, group_name: str, feature_names: List[str], schemas: Dict[str, Dict[str, Dict[str, List[int]]]]):
+        """Checks that the first entry of every file has the features, with the same shapes as in the first file.
+
+        Args:
+            group_name (str): The features' group, e.g. node_features.
+            feature_names (List[str]): The features.
+            schemas (Dict[str, Dict[str, Dict[str, List[int]]]]): From :meth:`_get_schemas`.
+
+        Raises:
+            ValueError: If any file lacks a feature, or has it in another shape.
+        """
+
+        reference_path, reference_schema = next(iter(schemas.items()))
+        reference_shapes = reference_schema.get(group_name, {})
+
+        mismatches = []
+        for hdf5_path, schema in schemas.items():
+            shapes = schema.get(group_name, {})
+
+            missing_features = [name for name in feature_names if name not in shapes]
+            if len(missing_features) > 0:
+                mismatches.append(f"{hdf5_path} lacks {missing_features}")
+
+            reshaped_features = [name for name in feature_names if name in shapes and shapes[name] != reference_shapes.get(name)]
+            if len(reshaped_features) > 0:
+                mismatches.append(f"{hdf5_path} has other shapes of {reshaped_features} than {reference_path}")
+
+        if len(mismatches) > 0:
+            raise ValueError(f"The .HDF5 files don't all have the same {group_name}:\n" + "\n".join(mismatches))
+
     def _check_hdf5_files(self):
         """Checks if the data contained in the .HDF5 file is valid."""
         _log.info("\nChecking dataset Integrity...")
         to_be_removed = []
         for hdf5_path in self.hdf5_paths:
-            try:
-                with h5py.File(hdf5_path, "r") as f5:
-                    entry_names = list(f5.keys())
-                    if len(entry_names) == 0:
-                        _log.info(f"    -> {hdf5_path} is empty ")
-                        to_be_removed.append(hdf5_path)
-            except Exception as e:
-                _log.error(e)
+            catalogue = self._catalogues.get(hdf5_path)
+            if catalogue is None:
                 _log.info(f"    -> {hdf5_path} is corrupted ")
                 to_be_removed.append(hdf5_path)
+            elif len(catalogue) == 0:
+                _log.info(f"    -> {hdf5_path} is empty ")
+                to_be_removed.append(hdf5_path)
 
         for hdf5_path in to_be_removed:
             self.hdf5_paths.remove(hdf5_path)
@@ -147,68 +317,101 @@ class DeeprankDataset(Dataset):
             hdf5_path_iterator = self.hdf5_paths
         sys.stdout.flush()
 
+        subset = None if self.subset is None else set(self.subset)
+        target_conditions = self._compile_target_filter()
+
         for hdf5_path in hdf5_path_iterator:
             if self.use_tqdm:
                 hdf5_path_iterator.set_postfix(entry_name=os.path.basename(hdf5_path))
             try:
-                with h5py.File(hdf5_path, "r") as hdf5_file:
-                    if self.subset is None:
-                        entry_names = list(hdf5_file.keys())
-                    else:
-                        entry_names = [entry_name for entry_name in self.subset if entry_name in list(hdf5_file.keys())]
-                    
-                    #skip self._filter_targets when target_filter is None, improve performance using list comprehension.
-                    if self.target_filter is None:
-                        self.index_entries += [(hdf5_path, entry_name) for entry_name in entry_names]
-                    else:
-                        self.index_entries += [(hdf5_path, entry_name) for entry_name in entry_names \
-                        if self._filter_targets(hdf5_file[entry_name])]
-                        
+                # the entries and their targets come from the file's catalogue, so the file itself isn't opened
+                catalogue = self._get_catalogue(hdf5_path)
+                if subset is None:
+                    entry_indices = np.arange(len(catalogue))
+                else:
+                    catalogue_indices = {entry_name: entry_index for entry_index, entry_name in enumerate(catalogue.entry_names)}
+                    entry_indices = np.array([catalogue_indices[entry_name] for entry_name in self.subset
+                                              if entry_name in catalogue_indices], dtype=np.int64)
+
+                if len(target_conditions) > 0:
+                    entry_indices = entry_indices[self._filter_targets(catalogue, entry_indices, target_conditions)]
+
+                self.index_entries += [(hdf5_path, catalogue.entry_names[entry_index]) for entry_index in entry_indices]
+
             except Exception:
                 _log.exception(f"on {hdf5_path}")
 
-    def _filter_targets(self, entry_group: h5py.Group) -> bool:
-        """Filters the entry according to a dictionary.
+    def _compile_target_filter(self) -> List[Tuple[str, Callable[[np.ndarray], np.ndarray]]]:
+        """Compiles the conditions of self.target_filter, a dictionary of the form { target_name : target_condition } or None.
 
-        The filter is based on the attribute self.target_filter that must be either
-        of the form: { target_name : target_condition } or None.
-
-        Args:
-            entry_group (:class:`h5py.Group`): The entry group in the .HDF5 file.
+        A condition is a comparison like "<10" or "==1", or several joined by "and" or "&", like ">=1 and <5".
 
         Returns:
-            bool: True if we keep the entry False otherwise.
+            List[Tuple[str, Callable[[np.ndarray], np.ndarray]]]: Per target name, a function that tells which values of an array
+                meet its condition.
 
         Raises:
             ValueError: If an unsuported condition is provided.
         """
 
         if self.target_filter is None:
-            return True
+            return []
 
+        compiled_conditions = []
         for target_name, target_condition in self.target_filter.items():
+            if target_condition is None:
+                continue
 
-            present_target_names = list(entry_group[targets.VALUES].keys())
+            if not isinstance(target_condition, str):
+                raise ValueError("Conditions not supported", target_condition)
 
-            if target_name in present_target_names:
+            comparisons = []
+            for comparison in re.split(r"\band\b|&", target_condition):
+                match = TARGET_CONDITION_PATTERN.match(comparison)
+                if match is None:
+                    raise ValueError("Conditions not supported", target_condition)
 
-                # If we have a given target_condition, see if it's met.
-                if isinstance(target_condition, str):
+                comparisons.append((TARGET_CONDITION_OPERATORS[match.group(1)], float(match.group(2))))
 
-                    operation = target_condition
-                    for operator_string in [">", "<", "==", "<=", ">=", "!="]:
-                        operation = operation.replace(operator_string, "target_value" + operator_string)
+            def condition(values: np.ndarray, comparisons=comparisons) -> np.ndarray:
+                return np.logical_and.reduce([compare(values, threshold) for compare, threshold in comparisons])
 
-                    if not literal_eval(operation):
-                        return False
+            compiled_conditions.append((target_name, condition))
 
-                elif target_condition is not None:
-                    raise ValueError("Conditions not supported", target_condition)
+        return compiled_conditions
 
-            else:
-                _log.warning(f"   :Filter {target_name} not found for entry {entry_group}\n"
-                             f"   :Filter options are: {present_target_names}")
-        return True
+    def _filter_targets(
+        self,
+        catalogue: EntryCatalogue,
+        entry_indices: np.ndarray,
+        target_conditions: List[Tuple[str, Callable[[np.ndarray], np.ndarray]]]
+    ) -> np.ndarray:
+        """Filters entries of a file on their target values, all at once.
+
+        Entries that lack a filtered target are kept.
+
+        Args:
+            catalogue (:class:`EntryCatalogue`): The catalogue of the file.
+            entry_indices (np.ndarray): The indices of the entries in the catalogue.
+            target_conditions (List[Tuple[str, Callable[[np.ndarray], np.ndarray]]]): From :meth:`_compile_target_filter`.
+
+        Returns:
+            np.ndarray: Boolean mask, True for the entries to keep.
+        """
+
+        keep = np.ones(len(entry_indices), dtype=bool)
+        for target_name, condition in target_conditions:
+            values = catalogue.get_target_column(target_name)[entry_indices]
+
+            missing = np.isnan(values)
+            if np.any(missing):
+                _log.warning(f"   :Filter {target_name} not found for {np.count_nonzero(missing)} entries\n"
+                             f"   :Filter options are: {catalogue.target_names}")
+
+            with np.errstate(invalid="ignore"):
+                keep &= missing | condition(values)
+
+        return keep
 
     def len(self) -> int:
         """Gets the length of the dataset, either :class:`GridDataset` or :class:`GraphDataset` object.
@@ -218,50 +421,138 @@ class DeeprankDataset(Dataset):
         """
         return len(self.index_entries)
 
-    def hdf5_to_pandas( # noqa: MC0001, pylint: disable=too-many-locals
-        self
+    def _get_catalogue_rows(self) -> List[Tuple[EntryCatalogue, np.ndarray, np.ndarray]]:
+        """Locates the dataset's entries in the catalogues of the .HDF5 files.
+
+        Returns:
+            List[Tuple[EntryCatalogue, np.ndarray, np.ndarray]]: Per file, its catalogue, the dataset indices of its entries
+                and their rows in the catalogue.
+        """
+
+        file_entries = {}
+        for idx, (hdf5_path, entry_name) in enumerate(self.index_entries):
+            file_entries.setdefault(hdf5_path, ([], []))
+            file_entries[hdf5_path][0].append(idx)
+            file_entries[hdf5_path][1].append(entry_name)
+
+        catalogue_rows = []
+        for hdf5_path, (indices, entry_names) in file_entries.items():
+            catalogue = self._get_catalogue(hdf5_path)
+            rows = {name: row for row, name in enumerate(catalogue.entry_names)}
+            catalogue_rows.append((catalogue,
+                                   np.array(indices, dtype=np.int64),
+                                   np.array([rows[entry_name] for entry_name in entry_names], dtype=np.int64)))
+
+        return catalogue_rows
+
+    def get_entry_sizes(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Gets the number of nodes and edges of every entry, from the catalogues of the .HDF5 files.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The node counts and edge counts, in index order. Edges are counted in both
+                directions, like in the loaded graphs.
+        """
+
+        node_counts = np.empty(len(self.index_entries), dtype=np.int64)
+        edge_counts = np.empty(len(self.index_entries), dtype=np.int64)
+        for catalogue, indices, rows in self._get_catalogue_rows():
+            node_counts[indices] = catalogue.node_counts[rows]
+            edge_counts[indices] = 2 * catalogue.edge_counts[rows]
+
+        return node_counts, edge_counts
+
+    def get_target_values(self) -> np.ndarray:
+        """Gets the (untransformed) target value of every entry, from the catalogues of the .HDF5 files.
+
+        Returns:
+            np.ndarray: The target values, in index order, NaN for entries that lack the target.
+        """
+
+        if self.target is None:
+            raise ValueError("The dataset has no target")
+
+        target_values = np.full(len(self.index_entries), np.nan)
+        for catalogue, indices, rows in self._get_catalogue_rows():
+            target_values[indices] = catalogue.get_target_column(self.target)[rows]
+
+        return target_values
+
+    def hdf5_to_pandas(
+        self,
+        features: Optional[List[str]] = None,
+        cpu_count: int = 1
     ) -> pd.DataFrame:
         """Loads features data from the HDF5 files into a Pandas DataFrame in the attribute `df` of the class.
 
+        Each feature is read once per entry, into one flat array per column. The DataFrame's cells of
+        node and edge features are views on these arrays.
+
+        Args:
+            features (Optional[List[str]], optional): Names of the features (or targets) to load. Defaults to None (meaning all selected ones).
+            cpu_count (int, optional): How many files to read simultaneously, in separate processes. Defaults to 1.
+
         Returns:
             :class:`pd.DataFrame`: Pandas DataFrame containing the selected features as columns per all data points in
                 hdf5_path files.   
         """
 
-        df_final = pd.DataFrame()
+        features_dict = self._get_features_dict(features)
+        read_function = partial(_read_feature_columns, features_dict=features_dict, subset=self.subset)
+
+        if cpu_count > 1 and len(self.hdf5_paths) > 1:
+            with Pool(min(cpu_count, len(self.hdf5_paths))) as pool:
+                file_columns = pool.map(read_function, self.hdf5_paths)
+        else:
+            file_columns = [read_function(fname) for fname in self.hdf5_paths]
+
+        df_final = pd.concat([_columns_to_pandas(*columns) for columns in file_columns])
+
+        df_final.reset_index(drop=True, inplace=True)
+        self.df = df_final
+
+        return df_final
+
+    def iter_hdf5_chunks(
+        self,
+        chunk_size: int = 1000,
+        features: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """Iterates over the features data of the HDF5 files, in DataFrames of at most chunk_size entries.
+
+        Unlike :meth:`hdf5_to_pandas`, this never holds more than one chunk in memory.
+
+        Args:
+            chunk_size (int, optional): Maximum number of entries per chunk. Defaults to 1000.
+            features (Optional[List[str]], optional): Names of the features (or targets) to load. Defaults to None (meaning all selected ones).
+
+        Yields:
+            :class:`pd.DataFrame`: The chunks, with the same columns as given by :meth:`hdf5_to_pandas`.
+        """
+
+        features_dict = self._get_features_dict(features)
+        subset = None if self.subset is None else set(self.subset)
 
         for fname in self.hdf5_paths:
             with h5py.File(fname, 'r') as f:
+                entry_names = [entry_name for entry_name in f.keys() if subset is None or entry_name in subset]
 
-                entry_name = list(f.keys())[0]
-                
-                if self.subset is not None:
-                    entry_names = [entry for entry, _ in f.items() if entry in self.subset]
-                else:
-                    entry_names = [entry for entry, _ in f.items()]
+            for chunk_start in range(0, len(entry_names), chunk_size):
+                yield _columns_to_pandas(*_read_feature_columns(fname, features_dict, entry_names[chunk_start:chunk_start + chunk_size]))
 
-                df_dict = {}
-                df_dict['id'] = entry_names
+    def _get_features_dict(self, features: Optional[List[str]]) -> Dict[str, List[str]]:
+        "the selected features per group, restricted to the given names"
 
-                for feat_type in self.features_dict:
-                    for feat in self.features_dict[feat_type]:
-                        if f[entry_name][feat_type][feat][()].ndim == 2:
-                            for i in range(f[entry_name][feat_type][feat][:].shape[1]):
-                                df_dict[feat + '_' + str(i)] = [f[entry_name][feat_type][feat][:][:,i] for entry_name in entry_names]
-                        else:
-                            df_dict[feat] = [
-                                f[entry_name][feat_type][feat][:]
-                                if f[entry_name][feat_type][feat][()].ndim == 1
-                                else f[entry_name][feat_type][feat][()] for entry_name in entry_names]
+        if features is None:
+            return self.features_dict
 
-                df = pd.DataFrame(data=df_dict)
+        features_dict = {feat_type: [feat for feat in self.features_dict[feat_type] if feat in features]
+                         for feat_type in self.features_dict}
 
-            df_final = pd.concat([df_final, df])
+        unknown_features = set(features) - {feat for feats in features_dict.values() for feat in feats}
+        if len(unknown_features) > 0:
+            raise ValueError(f"Features {unknown_features} are not selected in the dataset")
 
-        df_final.reset_index(drop=True, inplace=True)
-        self.df = df_final
-
-        return df_final
+        return features_dict
 
     def save_hist( # pylint: disable=too-many-arguments, too-many-branches, useless-suppression
             self,
@@ -352,15 +643,15 @@ class DeeprankDataset(Dataset):
         plt.close(fig)
     
     def _compute_mean_std(self):
+        """Computes the means and standard deviations of the features, per channel, by streaming over the .HDF5 files.
+
+        The statistics of each file are cached next to it (see `deeprankcore.utils.featurestats`).
+        """
+
+        stats = compute_feature_stats(self.hdf5_paths, self.features_dict, self.subset)
 
-        means = {col: round(np.concatenate(self.df[col].values).mean(), 1) if isinstance(self.df[col].values[0], np.ndarray) \
-            else round(self.df[col].values.mean(), 1) \
-            for col in self.df.columns[1:]}
-        devs = {col: round(np.concatenate(self.df[col].values).std(), 1) if isinstance(self.df[col].values[0], np.ndarray) \
-            else round(self.df[col].values.std(), 1) \
-            for col in self.df.columns[1:]}
-        self.means = means
-        self.devs = devs
+        self.means = {col: round(col_stats.mean, 1) for col, col_stats in stats.items()}
+        self.devs = {col: round(col_stats.std, 1) for col, col_stats in stats.items()}
 
 
 # Grid features are stored per dimension and named accordingly.
@@ -369,6 +660,82 @@ class DeeprankDataset(Dataset):
 GRID_PARTIAL_FEATURE_NAME_PATTERN = re.compile(r"^([a-zA-Z_]+)_([0-9]{3})$")
 
 
+def _read_feature_columns(
+    hdf5_path: str,
+    features_dict: Dict[str, List[str]],
+    subset: Optional[List[str]] = None
+) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, List[Tuple[int, ...]]]]:
+    """Reads features of one .HDF5 file into flat columns, reading each entry's feature once.
+
+    Args:
+        hdf5_path (str): The .HDF5 file.
+        features_dict (Dict[str, List[str]]): The feature names, per group.
+        subset (Optional[List[str]], optional): Entries to include. Defaults to None (meaning include all).
+
+    Returns:
+        Tuple[List[str], Dict[str, np.ndarray], Dict[str, List[Tuple[int, ...]]]]: The entry names, the flat array of each column
+            and the shape of each entry's part of it. Columns are named after their feature, or name_channel for features with more
+            than one channel.
+    """
+
+    column_parts = {}
+    column_shapes = {}
+
+    with h5py.File(hdf5_path, 'r') as f:
+        if subset is None:
+            entry_names = list(f.keys())
+        else:
+            subset = set(subset)
+            entry_names = [entry_name for entry_name in f.keys() if entry_name in subset]
+
+        for entry_name in entry_names:
+            entry_group = f[entry_name]
+            for feat_type, feat_names in features_dict.items():
+                for feat in feat_names:
+                    if feat_type == gridstorage.MAPPED_FEATURES:
+                        # grid features may be stored in sparse format
+                        channel_values = {feat: read_grid_feature(entry_group[feat_type][feat])}
+                    else:
+                        values = entry_group[feat_type][feat][()]
+                        if np.ndim(values) == 2:
+                            channel_values = {f"{feat}_{channel}": values[:, channel] for channel in range(values.shape[1])}
+                        else:
+                            channel_values = {feat: values}
+
+                    for column_name, values in channel_values.items():
+                        column_parts.setdefault(column_name, []).append(np.ravel(values))
+                        column_shapes.setdefault(column_name, []).append(np.shape(values))
+
+    columns = {column_name: np.concatenate(parts) for column_name, parts in column_parts.items()}
+
+    return entry_names, columns, column_shapes
+
+
+def _columns_to_pandas(
+    entry_names: List[str],
+    columns: Dict[str, np.ndarray],
+    column_shapes: Dict[str, List[Tuple[int, ...]]]
+) -> pd.DataFrame:
+    """Puts flat columns in a DataFrame with one row per entry.
+
+    Columns with one value per entry become numeric columns, the others hold each entry's array, as a view on the flat column.
+    """
+
+    df_dict = {'id': entry_names}
+    for column_name, values in columns.items():
+        shapes = column_shapes[column_name]
+        if all(len(shape) == 0 for shape in shapes):
+            df_dict[column_name] = values
+        else:
+            offsets = np.cumsum([0] + [int(np.prod(shape)) for shape in shapes])
+            cells = np.empty(len(shapes), dtype=object)
+            for index, shape in enumerate(shapes):
+                cells[index] = values[offsets[index]:offsets[index + 1]].reshape(shape)
+            df_dict[column_name] = cells
+
+    return pd.DataFrame(data=df_dict)
+
+
 class GridDataset(DeeprankDataset):
     def __init__( # pylint: disable=too-many-arguments
         self,
@@ -383,7 +750,9 @@ class GridDataset(DeeprankDataset):
         standardize: bool = False,
         target_transform: Optional[bool] = False,
         target_filter: Optional[Dict[str, str]] = None,
-        check_integrity: bool = True
+        check_integrity: bool = True,
+        max_open_files: int = 8,
+        cache: Optional[DataCache] = None
     ):
         """Class to load the .HDF5 files data into grids.
 
@@ -417,8 +786,13 @@ class GridDataset(DeeprankDataset):
                 Note that the you can filter on a different target than the one selected as the dataset target. Defaults to None.
             check_integrity (bool, optional): Whether to check the integrity of the hdf5 files.
                 Defaults to True.
+            max_open_files (int, optional): Maximum number of .HDF5 files that each process keeps open for reading.
+                Defaults to 8.
+            cache (Optional[:class:`DataCache`], optional): Keeps loaded items in memory, to serve them from there in later epochs.
+                Defaults to None.
         """
-        super().__init__(hdf5_path, subset, target, task, classes, tqdm, root, target_filter, check_integrity)
+        super().__init__(hdf5_path, subset, target, task, classes, tqdm, root, target_filter, check_integrity,
+                         max_open_files, cache)
 
         self.features = features
 
@@ -436,46 +810,44 @@ class GridDataset(DeeprankDataset):
                 self.features_dict[targets.VALUES] = self.target
 
         if self._standardize:
-            self.hdf5_to_pandas()
             self._compute_mean_std()
 
     def _check_features(self):
         """Checks if the required features exist"""
 
-        hdf5_path = self.hdf5_paths[0]
+        # read available features, from the first file's catalogue
+        schemas = self._get_schemas()
+        hdf5_path, schema = next(iter(schemas.items()))
+        entry_name = self._get_catalogue(hdf5_path).entry_names[0]
 
-        # read available features
-        with h5py.File(hdf5_path, "r") as hdf5_file:
-            entry_name = list(hdf5_file.keys())[0]
+        hdf5_all_feature_names = list(schema.get(gridstorage.MAPPED_FEATURES, {}))
 
-            hdf5_all_feature_names = list(hdf5_file[f"{entry_name}/{gridstorage.MAPPED_FEATURES}"].keys())
+        hdf5_matching_feature_names = []  # feature names that match with the requested list of names
+        unpartial_feature_names = []  # feature names without their dimension number suffix
 
-            hdf5_matching_feature_names = []  # feature names that match with the requested list of names
-            unpartial_feature_names = []  # feature names without their dimension number suffix
+        for feature_name in hdf5_all_feature_names:
 
-            for feature_name in hdf5_all_feature_names:
+            if feature_name.startswith("_"):
+                continue  # ignore metafeatures
 
-                if feature_name.startswith("_"):
-                    continue  # ignore metafeatures
+            partial_feature_match = GRID_PARTIAL_FEATURE_NAME_PATTERN.match(feature_name)
+            if partial_feature_match is not None:  # there's a dimension number in the feature name
 
-                partial_feature_match = GRID_PARTIAL_FEATURE_NAME_PATTERN.match(feature_name)
-                if partial_feature_match is not None:  # there's a dimension number in the feature name
+                unpartial_feature_name = partial_feature_match.group(1)
 
-                    unpartial_feature_name = partial_feature_match.group(1)
+                if self.features == "all" or isinstance(self.features, list) and unpartial_feature_name in self.features:
 
-                    if self.features == "all" or isinstance(self.features, list) and unpartial_feature_name in self.features:
+                    hdf5_matching_feature_names.append(feature_name)
 
-                        hdf5_matching_feature_names.append(feature_name)
+                unpartial_feature_names.append(unpartial_feature_name)
 
-                    unpartial_feature_names.append(unpartial_feature_name)
+            else:  # no numbers, it's a one-dimensional feature name
 
-                else:  # no numbers, it's a one-dimensional feature name
+                if self.features == "all" or isinstance(self.features, list) and feature_name in self.features:
 
-                    if self.features == "all" or isinstance(self.features, list) and feature_name in self.features:
+                    hdf5_matching_feature_names.append(feature_name)
 
-                        hdf5_matching_feature_names.append(feature_name)
-
-                    unpartial_feature_names.append(feature_name)
+                unpartial_feature_names.append(feature_name)
 
         # check for the requested features
         missing_features = []
@@ -500,6 +872,8 @@ class GridDataset(DeeprankDataset):
                     \nProbably, the feature wasn't generated during the preprocessing step. \
                     Available features: {hdf5_all_feature_names}")
 
+        self._check_schemas(gridstorage.MAPPED_FEATURES, self.features, schemas)
+
     def get(self, idx: int) -> Data:
         """Gets one grid item from its unique index.
 
@@ -511,7 +885,10 @@ class GridDataset(DeeprankDataset):
         """
 
         file_path, entry_name = self.index_entries[idx]
-        return self.load_one_grid(file_path, entry_name)
+        if self.cache is None:
+            return self.load_one_grid(file_path, entry_name)
+
+        return self.cache.get_or_load((file_path, entry_name), self.load_one_grid)
 
     def load_one_grid(self, hdf5_path: str, entry_name: str) -> Data:
         """Loads one grid.
@@ -524,21 +901,25 @@ class GridDataset(DeeprankDataset):
             :class:`torch_geometric.data.data.Data`: item with tensors x, y if present, entry_names.
         """
 
-        feature_data = []
+        feature_data = None
         target_value = None
 
-        with h5py.File(hdf5_path, 'r') as hdf5_file:
-            entry_group = hdf5_file[entry_name]
+        entry_group = self._get_hdf5_file(hdf5_path)[entry_name]
 
-            mapped_features_group = entry_group[gridstorage.MAPPED_FEATURES]
-            for feature_name in self.features:
-                feature_data.append(mapped_features_group[feature_name][:])
+        # features may be stored in a lower precision, they're converted to float32 here
+        mapped_features_group = entry_group[gridstorage.MAPPED_FEATURES]
+        for feature_index, feature_name in enumerate(self.features):
+            values = read_grid_feature(mapped_features_group[feature_name])
+            if feature_data is None:
+                feature_data = np.empty((len(self.features),) + values.shape, dtype=np.float32)
+            feature_data[feature_index] = values
 
-            target_value = entry_group[targets.VALUES][self.target][()]
+        if self.target is not None:
+            target_value = torch.tensor([entry_group[targets.VALUES][self.target][()]], dtype=torch.float)
 
         # Wrap up the data in this object, for the collate_fn to handle it properly:
-        data = Data(x=torch.tensor([feature_data], dtype=torch.float),
-                    y=torch.tensor([target_value], dtype=torch.float))
+        data = Data(x=torch.from_numpy(feature_data).unsqueeze(0),
+                    y=target_value)
 
         data.entry_names = entry_name
 
@@ -563,7 +944,10 @@ class GraphDataset(DeeprankDataset):
         target_filter: Optional[Dict[str, str]] = None,
         check_integrity: bool = True,
         train: bool = True,
-        dataset_train: GraphDataset = None
+        dataset_train: GraphDataset = None,
+        max_open_files: int = 8,
+        cache: Optional[DataCache] = None,
+        packed_path: Optional[str] = None
     ):
         """Class to load the .HDF5 files data into graphs.
 
@@ -625,8 +1009,17 @@ class GraphDataset(DeeprankDataset):
             dataset_train: (class:`GraphDataset`, optional): if train is True, assign here the training set. This parameter is considered only if standardize
                 flag is set to True.
                 Defaults to None.
+
+            max_open_files (int, optional): Maximum number of .HDF5 files that each process keeps open for reading.
+                Defaults to 8.
+            cache (Optional[:class:`DataCache`], optional): Keeps loaded items in memory, to serve them from there in later epochs.
+                Defaults to None.
+            packed_path (Optional[str], optional): Directory with the same graphs in packed format (see `deeprankcore.utils.packedgraphs`).
+                If given, the graphs are read from there instead of from the .HDF5 files, which remain in use for indexing and statistics.
+                Defaults to None.
         """
-        super().__init__(hdf5_path, subset, target, task, classes, tqdm, root, target_filter, check_integrity)
+        super().__init__(hdf5_path, subset, target, task, classes, tqdm, root, target_filter, check_integrity,
+                         max_open_files, cache)
 
         self.node_features = node_features
         self.edge_features = edge_features
@@ -636,6 +1029,12 @@ class GraphDataset(DeeprankDataset):
         self.target_transform = target_transform
 
         self._check_features()
+        self._set_feature_columns()
+
+        self._packed_graphs = None
+        if packed_path is not None:
+            self._packed_graphs = PackedGraphs(packed_path)
+            self._check_packed_features()
 
         self.features_dict = {}
         self.features_dict[Nfeat.NODE] = self.node_features
@@ -663,13 +1062,9 @@ class GraphDataset(DeeprankDataset):
             
             if train:
                 if self.means or self.devs is None:
-                    if self.df is None:
-                        self.hdf5_to_pandas()
                     self._compute_mean_std()
             else:
                 if (dataset_train.means or dataset_train.devs) is None:
-                    if dataset_train.df is None:
-                        dataset_train.hdf5_to_pandas()
                     dataset_train._compute_mean_std()
                 self.means = dataset_train.means
                 self.devs = dataset_train.devs
@@ -687,7 +1082,10 @@ class GraphDataset(DeeprankDataset):
         """
 
         fname, mol = self.index_entries[idx]
-        return self.load_one_graph(fname, mol)
+        if self.cache is None:
+            return self.load_one_graph(fname, mol)
+
+        return self.cache.get_or_load((fname, mol), self.load_one_graph)
 
     def load_one_graph(self, fname: str, entry_name: str)  -> Data: # pylint: disable = too-many-locals # noqa: MC0001
         """Loads one graph.
@@ -700,100 +1098,86 @@ class GraphDataset(DeeprankDataset):
             :class:`torch_geometric.data.data.Data`: item with tensors x, y if present, edge_index, edge_attr, pos, entry_names.
         """
 
-        with h5py.File(fname, 'r') as f5:
-            grp = f5[entry_name]
+        if self._packed_graphs is not None:
+            packed_index = self._packed_graphs.get_entry_index(fname, entry_name)
+            if packed_index is not None:
+                return self._load_packed_graph(packed_index, fname, entry_name)
 
-            # node features
-            node_data = ()
-            for feat in self.node_features:
-                if feat[0] != '_':  # ignore metafeatures
-                    vals = grp[f"{Nfeat.NODE}/{feat}"][()]
-                    if vals.ndim == 1: # features with only one channel
-                        vals = vals.reshape(-1, 1)
-                        if self._standardize:
-                            vals = (vals-self.means[feat])/self.devs[feat]
-                    else:
-                        if self._standardize:
-                            reshaped_mean = [mean_value for mean_key, mean_value in self.means.items() if feat in mean_key]
-                            reshaped_dev = [dev_value for dev_key, dev_value in self.devs.items() if feat in dev_key]
-                            vals = (vals - reshaped_mean)/reshaped_dev
-                    node_data += (vals,)
-            x = torch.tensor(np.hstack(node_data), dtype=torch.float)
-
-            # edge index,
-            # we have to have all the edges i.e : (i,j) and (j,i)
-            if Efeat.INDEX in grp[Efeat.EDGE]:
-                ind = grp[f"{Efeat.EDGE}/{Efeat.INDEX}"][()]
-                if ind.ndim == 2:
-                    ind = np.vstack((ind, np.flip(ind, 1))).T
-                edge_index = torch.tensor(ind, dtype=torch.long).contiguous()
-            else:
-                edge_index = torch.empty((2, 0), dtype=torch.long)
-
-            # edge feature
-            # we have to have all the edges i.e : (i,j) and (j,i)
-            if (self.edge_features is not None 
-                    and len(self.edge_features) > 0 
-                    and Efeat.EDGE in grp):
-                edge_data = ()
-                for feat in self.edge_features:
-                    if feat[0] != '_':   # ignore metafeatures
-                        vals = grp[f"{Efeat.EDGE}/{feat}"][()]
-                        if vals.ndim == 1:
-                            vals = vals.reshape(-1, 1)
-                            if self._standardize:
-                                vals = (vals-self.means[feat])/self.devs[feat]
-                        else:
-                            if self._standardize:
-                                reshaped_mean = [mean_value for mean_key, mean_value in self.means.items() if feat in mean_key]
-                                reshaped_dev = [dev_value for dev_key, dev_value in self.devs.items() if feat in dev_key]
-                                vals = (vals - reshaped_mean)/reshaped_dev
-                        edge_data += (vals,)
-                edge_data = np.hstack(edge_data)
-                edge_data = np.vstack((edge_data, edge_data))
-                edge_attr = torch.tensor(edge_data, dtype=torch.float).contiguous()
-            else:
-                edge_attr = torch.empty((edge_index.shape[1], 0), dtype=torch.float).contiguous()
+        f5 = self._get_hdf5_file(fname)
+        grp = f5[entry_name]
 
-            # target
-            if self.target is None:
-                y = None
-            else:
-                if targets.VALUES in grp and self.target in grp[targets.VALUES]:
-                    y = torch.tensor([grp[f"{targets.VALUES}/{self.target}"][()]], dtype=torch.float).contiguous()
+        # node features, side by side in preallocated columns
+        node_count = grp[f"{Nfeat.NODE}/{Nfeat.POSITION}"].shape[0]
+        node_data = np.empty((node_count, get_column_count(self._node_columns)), dtype=np.float32)
+        for feat, (column_start, column_end) in self._node_columns.items():
+            node_data[:, column_start:column_end] = grp[f"{Nfeat.NODE}/{feat}"][()].reshape(node_count, -1)
+        if self._standardize:
+            node_means, node_devs, _, _ = self._get_standardization_vectors()
+            node_data -= node_means
+            node_data /= node_devs
+        x = torch.from_numpy(node_data)
+
+        # edge index,
+        # we have to have all the edges i.e : (i,j) and (j,i)
+        if Efeat.INDEX in grp[Efeat.EDGE]:
+            ind = grp[f"{Efeat.EDGE}/{Efeat.INDEX}"][()]
+            if ind.ndim == 2:
+                ind = np.vstack((ind, np.flip(ind, 1))).T
+            edge_index = torch.tensor(ind, dtype=torch.long).contiguous()
+        else:
+            edge_index = torch.empty((2, 0), dtype=torch.long)
+
+        # edge feature
+        # we have to have all the edges i.e : (i,j) and (j,i)
+        if len(self._edge_columns) > 0 and Efeat.EDGE in grp:
+            edge_count = grp[f"{Efeat.EDGE}/{next(iter(self._edge_columns))}"].shape[0]
+            edge_data = np.empty((2 * edge_count, get_column_count(self._edge_columns)), dtype=np.float32)
+            for feat, (column_start, column_end) in self._edge_columns.items():
+                edge_data[:edge_count, column_start:column_end] = grp[f"{Efeat.EDGE}/{feat}"][()].reshape(edge_count, -1)
+            if self._standardize:
+                _, _, edge_means, edge_devs = self._get_standardization_vectors()
+                edge_data[:edge_count] -= edge_means
+                edge_data[:edge_count] /= edge_devs
+            edge_data[edge_count:] = edge_data[:edge_count]
+            edge_attr = torch.from_numpy(edge_data)
+        else:
+            edge_attr = torch.empty((edge_index.shape[1], 0), dtype=torch.float).contiguous()
 
-                    if self.task == targets.REGRESS and self.target_transform is True:
-                        y = torch.sigmoid(torch.log(y))
-                    elif self.task is not targets.REGRESS and self.target_transform is True:
-                        raise ValueError(f"Task is set to {self.task}. Please set it to regress to transform the target with a sigmoid.")
+        # target
+        if self.target is None:
+            y = None
+        else:
+            if targets.VALUES in grp and self.target in grp[targets.VALUES]:
+                y = self._transform_target(
+                    torch.tensor([grp[f"{targets.VALUES}/{self.target}"][()]], dtype=torch.float).contiguous())
 
-                else:
-                    possible_targets = grp[targets.VALUES].keys()
-                    raise ValueError(f"Target {self.target} missing in entry {entry_name} in file {fname}, possible targets are {possible_targets}." +
-                                     "\n Use the query class to add more target values to input data.")
-
-            # positions
-            pos = torch.tensor(grp[f"{Nfeat.NODE}/{Nfeat.POSITION}/"][()], dtype=torch.float).contiguous()
-
-            # cluster
-            cluster0 = None
-            cluster1 = None
-            if self.clustering_method is not None:
-                if 'clustering' in grp.keys():
-                    if self.clustering_method in grp["clustering"].keys():
-                        if (
-                            "depth_0" in grp[f"clustering/{self.clustering_method}"].keys() and
-                            "depth_1" in grp[f"clustering/{self.clustering_method}"].keys()
-                            ):
-
-                            cluster0 = torch.tensor(
-                                grp["clustering/" + self.clustering_method + "/depth_0"][()], dtype=torch.long)
-                            cluster1 = torch.tensor(
-                                grp["clustering/" + self.clustering_method + "/depth_1"][()], dtype=torch.long)
-                        else:
-                            _log.warning("no clusters detected")
+            else:
+                possible_targets = grp[targets.VALUES].keys()
+                raise ValueError(f"Target {self.target} missing in entry {entry_name} in file {fname}, possible targets are {possible_targets}." +
+                                 "\n Use the query class to add more target values to input data.")
+
+        # positions
+        pos = torch.tensor(grp[f"{Nfeat.NODE}/{Nfeat.POSITION}/"][()], dtype=torch.float).contiguous()
+
+        # cluster
+        cluster0 = None
+        cluster1 = None
+        if self.clustering_method is not None:
+            if 'clustering' in grp.keys():
+                if self.clustering_method in grp["clustering"].keys():
+                    if (
+                        "depth_0" in grp[f"clustering/{self.clustering_method}"].keys() and
+                        "depth_1" in grp[f"clustering/{self.clustering_method}"].keys()
+                        ):
+
+                        cluster0 = torch.tensor(
+                            grp["clustering/" + self.clustering_method + "/depth_0"][()], dtype=torch.long)
+                        cluster1 = torch.tensor(
+                            grp["clustering/" + self.clustering_method + "/depth_1"][()], dtype=torch.long)
                     else:
-                        _log.warning(f"no clustering/{self.clustering_method} detected")
+                        _log.warning("no clusters detected")
+                else:
+                    _log.warning(f"no clustering/{self.clustering_method} detected")
 
         # load
         data = Data(x=x, edge_index=edge_index, edge_attr=edge_attr, y=y, pos=pos)
@@ -805,21 +1189,132 @@ class GraphDataset(DeeprankDataset):
 
         return data
 
+    def _transform_target(self, y: torch.Tensor) -> torch.Tensor:
+        if self.task == targets.REGRESS and self.target_transform is True:
+            y = torch.sigmoid(torch.log(y))
+        elif self.task is not targets.REGRESS and self.target_transform is True:
+            raise ValueError(f"Task is set to {self.task}. Please set it to regress to transform the target with a sigmoid.")
+
+        return y
+
+    def _load_packed_graph(self, packed_index: int, fname: str, entry_name: str) -> Data:
+        """Loads one graph from the packed arrays, in the same form as from the .HDF5 file."""
+
+        node_values, positions = self._packed_graphs.get_nodes(packed_index)
+        edge_indices, edge_values = self._packed_graphs.get_edges(packed_index)
+
+        node_means, node_devs, edge_means, edge_devs = self._get_standardization_vectors() if self._standardize else (None,) * 4
+
+        x = torch.from_numpy(self._select_packed_columns(node_values, self._packed_graphs.node_columns, self._node_columns,
+                                                         node_means, node_devs))
+
+        # we have to have all the edges i.e : (i,j) and (j,i)
+        edge_index = torch.from_numpy(np.vstack((edge_indices, np.flip(edge_indices, 1))).T).contiguous()
+
+        if len(self._edge_columns) > 0:
+            edge_data = self._select_packed_columns(edge_values, self._packed_graphs.edge_columns, self._edge_columns,
+                                                    edge_means, edge_devs)
+            edge_attr = torch.from_numpy(np.vstack((edge_data, edge_data)))
+        else:
+            edge_attr = torch.empty((edge_index.shape[1], 0), dtype=torch.float).contiguous()
+
+        if self.target is None:
+            y = None
+        else:
+            target_value = self._packed_graphs.get_target_value(packed_index, self.target)
+            if target_value is None:
+                raise ValueError(f"Target {self.target} missing in entry {entry_name} in file {fname}, " +
+                                 f"possible targets are {self._packed_graphs.target_names}.")
+            y = self._transform_target(torch.tensor([target_value], dtype=torch.float))
+
+        data = Data(x=x, edge_index=edge_index, edge_attr=edge_attr, y=y, pos=torch.from_numpy(positions))
+
+        data.cluster0 = None
+        data.cluster1 = None
+
+        data.entry_names = entry_name
+
+        return data
+
+    @staticmethod
+    def _select_packed_columns( # pylint: disable=too-many-arguments
+        values: np.ndarray,
+        packed_columns: Dict[str, Tuple[int, int]],
+        columns: Dict[str, Tuple[int, int]],
+        means: Optional[np.ndarray],
+        devs: Optional[np.ndarray],
+    ) -> np.ndarray:
+        """Takes the columns of the selected features from packed values and standardizes them."""
+
+        selected_values = np.empty((values.shape[0], get_column_count(columns)), dtype=np.float32)
+        for feat, (column_start, column_end) in columns.items():
+            packed_start, packed_end = packed_columns[feat]
+            selected_values[:, column_start:column_end] = values[:, packed_start:packed_end]
+
+        if means is not None:
+            selected_values -= means
+            selected_values /= devs
+
+        return selected_values
+
+    def _set_feature_columns(self):
+        """Lays out the selected node and edge features in columns, as found in the first file's catalogue."""
+
+        schema = next(iter(self._get_schemas().values()))
+        self._node_columns = get_schema_feature_columns(schema.get(Nfeat.NODE, {}),
+                                                        [feat for feat in self.node_features if feat[0] != '_'])
+        self._edge_columns = get_schema_feature_columns(schema.get(Efeat.EDGE, {}),
+                                                        [feat for feat in self.edge_features if feat[0] != '_'])
+
+        self._standardization_vectors = None
+        self._standardization_source = None
+
+    def _get_standardization_vectors(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Gets the means and standard deviations of the node and edge feature columns.
+
+        They are built from the means and devs dictionaries once, and again only when these are replaced.
+        """
+
+        if self._standardization_source is None or \
+                self._standardization_source[0] is not self.means or self._standardization_source[1] is not self.devs:
+
+            self._standardization_vectors = \
+                get_standardization_vectors(self._node_columns, self.means, self.devs) + \
+                get_standardization_vectors(self._edge_columns, self.means, self.devs)
+            self._standardization_source = (self.means, self.devs)
+
+        return self._standardization_vectors
+
+    def _check_packed_features(self):
+        """Checks if the packed graphs hold the required features"""
+
+        if self.clustering_method is not None:
+            raise ValueError("Clusters are not stored in the packed format, use the .HDF5 files for clustering_method")
+
+        # the metafeatures aren't loaded as features, as in load_one_graph
+        missing_node_features = [feat for feat in self.node_features
+                                 if feat[0] != '_' and feat not in self._packed_graphs.node_columns]
+        missing_edge_features = [feat for feat in self.edge_features
+                                 if feat[0] != '_' and feat not in self._packed_graphs.edge_columns]
+        if missing_node_features + missing_edge_features:
+            raise ValueError(f"Features missing in the packed graphs at {self._packed_graphs.packed_path}: "
+                             f"{missing_node_features + missing_edge_features}, pack them from the .HDF5 files again")
+
     def _check_features(self):
         """Checks if the required features exist"""
-        f = h5py.File(self.hdf5_paths[0], "r")
-        mol_key = list(f.keys())[0]
+
+        # read available features, from the first file's catalogue
+        schemas = self._get_schemas()
+        hdf5_path, schema = next(iter(schemas.items()))
 
         # read available node features
-        self.available_node_features = list(f[f"{mol_key}/{Nfeat.NODE}/"].keys())
+        self.available_node_features = list(schema.get(Nfeat.NODE, {}))
         self.available_node_features = [key for key in self.available_node_features if key[0] != '_']  # ignore metafeatures
 
         # read available edge features
-        self.available_edge_features = list(f[f"{mol_key}/{Efeat.EDGE}/"].keys())
+        self.available_edge_features = list(schema.get(Efeat.EDGE, {}))
         self.available_edge_features = [key for key in self.available_edge_features if key[0] != '_']  # ignore metafeatures
 
-        f.close()
-
         # check node features
         missing_node_features = []
         if self.node_features == "all":
@@ -829,7 +1324,7 @@ class GraphDataset(DeeprankDataset):
                 self.node_features = [self.node_features]
             for feat in self.node_features:
                 if feat not in self.available_node_features:
-                    _log.info(f"The node feature _{feat}_ was not found in the file {self.hdf5_paths[0]}.")
+                    _log.info(f"The node feature _{feat}_ was not found in the file {hdf5_path}.")
                     missing_node_features.append(feat)
 
         # check edge features
@@ -841,7 +1336,7 @@ class GraphDataset(DeeprankDataset):
                 self.edge_features = [self.edge_features]
             for feat in self.edge_features:
                 if feat not in self.available_edge_features:
-                    _log.info(f"The edge feature _{feat}_ was not found in the file {self.hdf5_paths[0]}.")
+                    _log.info(f"The edge feature _{feat}_ was not found in the file {hdf5_path}.")
                     missing_edge_features.append(feat)
 
         # raise error if any features are missing
@@ -858,11 +1353,31 @@ class GraphDataset(DeeprankDataset):
                 miss_edge_error = f"\nMissing edge features: {missing_edge_features} \
                                     \nAvailable edge features: {self.available_edge_features}"
             raise ValueError(
-                f"Not all features could be found in the file {self.hdf5_paths[0]}.\
+                f"Not all features could be found in the file {hdf5_path}.\
                     \nCheck feature_modules passed to the preprocess function. \
                     \nProbably, the feature wasn't generated during the preprocessing step. \
                     {miss_node_error}{miss_edge_error}")
 
+        self._check_schemas(Nfeat.NODE, self.node_features, schemas)
+        self._check_schemas(Efeat.EDGE, self.edge_features, schemas)
+
+
+def hdf5_worker_init_fn(worker_id: int): # pylint: disable=unused-argument
+    """Makes a DataLoader worker open its own .HDF5 file handles.
+
+    Pass it as `worker_init_fn` to a :class:`torch_geometric.loader.DataLoader` over a :class:`GraphDataset` or :class:`GridDataset`.
+
+    Args:
+        worker_id (int): Index of the worker, as given by the DataLoader.
+    """
+
+    dataset = torch.utils.data.get_worker_info().dataset
+    if isinstance(dataset, torch.utils.data.Subset):
+        dataset = dataset.dataset
+
+    if isinstance(dataset, DeeprankDataset):
+        dataset.close_hdf5_files()
+
 
 def save_hdf5_keys(
     f_src_path: str,
@@ -1,3 +1,6 @@
-
-
 MAPPED_FEATURES = "mapped_features"
+
+## sparse (COO) storage of a mapped feature
+SPARSE_INDICES = "indices" # int array of shape (n, 3), x, y, z indices of the nonzero grid points
+SPARSE_VALUES = "values" # float array of shape (n,), values at these grid points
+SPARSE_SHAPE = "shape" # attribute holding the dense x, y, z shape of the grid
@@ -53,7 +53,7 @@ class CnnRegression(torch.nn.Module):
 
     def forward(self, data):
         x = self._forward_features(data.x)
-        x = x.view(x.size(0), -1)
+        x = x.reshape(x.size(0), -1)
         x = F.relu(self.fclayer_000(x))
         x = self.fclayer_001(x)
         return x
@@ -105,7 +105,7 @@ class CnnClassification(torch.nn.Module):
 
     def forward(self, data):
         x = self._forward_features(data.x)
-        x = x.view(x.size(0), -1)
+        x = x.reshape(x.size(0), -1)
         x = F.relu(self.fclayer_000(x))
         x = self.fclayer_001(x)
         return x
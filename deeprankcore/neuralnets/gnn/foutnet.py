@@ -1,13 +1,15 @@
+from typing import Optional
+
 import torch
 import torch.nn.functional as F
-from torch import nn
+from torch import Tensor
 from torch.nn import Parameter
 from torch_geometric.nn import max_pool_x
 from torch_geometric.nn.inits import uniform
 from torch_scatter import scatter_mean
 
-from deeprankcore.utils.community_pooling import (community_pooling,
-                                                  get_preloaded_cluster)
+from deeprankcore.utils.community_pooling import (get_preloaded_cluster,
+                                                  pool_clusters)
 
 
 class FoutLayer(torch.nn.Module):
@@ -59,11 +61,7 @@ class FoutLayer(torch.nn.Module):
         beta = torch.mm(x, self.wn)
 
         # gamma_i = 1/Ni Sum_j x_j * Wn
-        # there might be a better way than looping over the nodes
-        gamma = torch.zeros(num_node, self.out_channels).to(alpha.device)
-        for n in range(num_node):
-            index = edge_index[:, edge_index[0, :] == n][1, :]
-            gamma[n, :] = torch.mean(beta[index, :], dim=0)
+        gamma = scatter_mean(beta[edge_index[1]], edge_index[0], dim=0, dim_size=num_node)
 
         # alpha = alpha + gamma
         alpha = alpha + gamma
@@ -90,24 +88,39 @@ class FoutNet(torch.nn.Module):
 
         self.clustering = "mcl"
 
+    @torch.jit.unused
     def forward(self, data):
-
-        act = nn.Tanhshrink()
+        return self.forward_tensors(data.x, data.edge_index, data.edge_attr, data.batch, data.cluster0, data.cluster1)
+
+    @torch.jit.export
+    def forward_tensors( # pylint: disable=too-many-arguments
+        self,
+        x: Tensor,
+        edge_index: Tensor,
+        edge_attr: Tensor,
+        batch: Tensor,
+        cluster0: Optional[Tensor] = None,
+        cluster1: Optional[Tensor] = None,
+    ) -> Tensor:
+        "the forward pass on the tensors of a batch, which leaves them unchanged and can be compiled with TorchScript"
+
+        assert cluster0 is not None and cluster1 is not None, "FoutNet requires the clusters of the nodes"
         act = F.relu
-        # act = nn.LeakyReLU(0.25)
+        graph_count = int(batch.max()) + 1
 
         # first conv block
-        data.x = act(self.conv1(data.x, data.edge_index))
-        cluster = get_preloaded_cluster(data.cluster0, data.batch)
-        data = community_pooling(cluster, data)
+        x = act(self.conv1(x, edge_index))
+        cluster = get_preloaded_cluster(cluster0, batch)
+        x, edge_index, edge_attr, batch = pool_clusters(cluster, x, edge_index, edge_attr, batch)
 
         # second conv block
-        data.x = act(self.conv2(data.x, data.edge_index))
-        cluster = get_preloaded_cluster(data.cluster1, data.batch)
-        x, batch = max_pool_x(cluster, data.x, data.batch)
+        x = act(self.conv2(x, edge_index))
+        cluster = get_preloaded_cluster(cluster1, batch)
+        x, batch_pool = max_pool_x(cluster, x, batch)
+        assert batch_pool is not None
 
         # FC
-        x = scatter_mean(x, batch, dim=0)
+        x = scatter_mean(x, batch_pool, dim=0, dim_size=graph_count)
         x = act(self.fc1(x))
         x = self.fc2(x)
         # x = F.dropout(x, training=self.training)
@@ -1,12 +1,14 @@
+from typing import Optional
+
 import torch
 import torch.nn.functional as F
-from torch import nn
+from torch import Tensor, nn
 from torch_geometric.nn import max_pool_x
 from torch_geometric.nn.inits import uniform
 from torch_scatter import scatter_mean, scatter_sum
 
-from deeprankcore.utils.community_pooling import (community_pooling,
-                                                  get_preloaded_cluster)
+from deeprankcore.utils.community_pooling import (get_preloaded_cluster,
+                                                  pool_clusters)
 
 
 class GINetConvLayer(torch.nn.Module):
@@ -35,7 +37,7 @@ class GINetConvLayer(torch.nn.Module):
 
     def forward(self, x, edge_index, edge_attr):
 
-        row, col = edge_index
+        row, col = edge_index[0], edge_index[1]
         num_node = len(x)
         edge_attr = edge_attr.unsqueeze(-1) if edge_attr.dim() == 1 else edge_attr
 
@@ -51,7 +53,7 @@ class GINetConvLayer(torch.nn.Module):
         alpha = F.softmax(alpha, dim=1)
         h = alpha * xcol
 
-        out = torch.zeros(num_node, self.out_channels).to(alpha.device)
+        out = torch.zeros(num_node, self.out_channels, dtype=h.dtype).to(alpha.device)
         z = scatter_sum(h, row, dim=0, out=out)
 
         return z
@@ -77,39 +79,53 @@ class GINet(torch.nn.Module):
         self.clustering = "mcl"
         self.dropout = 0.4
 
+    @torch.jit.unused
     def forward(self, data):
+        return self.forward_tensors(data.x, data.edge_index, data.edge_attr, data.batch, data.cluster0, data.cluster1)
+
+    @torch.jit.export
+    def forward_tensors( # pylint: disable=too-many-arguments, too-many-locals
+        self,
+        x: Tensor,
+        edge_index: Tensor,
+        edge_attr: Tensor,
+        batch: Tensor,
+        cluster0: Optional[Tensor] = None,
+        cluster1: Optional[Tensor] = None,
+    ) -> Tensor:
+        "the forward pass on the tensors of a batch, which leaves them unchanged and can be compiled with TorchScript"
+
+        assert cluster0 is not None and cluster1 is not None, "GINet requires the clusters of the nodes"
         act = F.relu
-        data_ext = data.clone()
+        graph_count = int(batch.max()) + 1
 
         # EXTERNAL INTERACTION GRAPH
         # first conv block
-        data.x = act(self.conv1(data.x, data.edge_index, data.edge_attr))
-        cluster = get_preloaded_cluster(data.cluster0, data.batch)
-        data = community_pooling(cluster, data)
+        x_pool = act(self.conv1(x, edge_index, edge_attr))
+        cluster = get_preloaded_cluster(cluster0, batch)
+        x_pool, edge_index_pool, edge_attr_pool, batch_pool = pool_clusters(cluster, x_pool, edge_index, edge_attr, batch)
 
         # second conv block
-        data.x = act(self.conv2(data.x, data.edge_index, data.edge_attr))
-        cluster = get_preloaded_cluster(data.cluster1, data.batch)
-        x, batch = max_pool_x(cluster, data.x, data.batch)
+        x_pool = act(self.conv2(x_pool, edge_index_pool, edge_attr_pool))
+        cluster = get_preloaded_cluster(cluster1, batch_pool)
+        x_int, batch_int = max_pool_x(cluster, x_pool, batch_pool)
+        assert batch_int is not None
 
         # INTERNAL INTERACTION GRAPH
         # first conv block
-        data_ext.x = act(
-            self.conv1_ext(data_ext.x, data_ext.edge_index, data_ext.edge_attr)
-        )
-        cluster = get_preloaded_cluster(data_ext.cluster0, data_ext.batch)
-        data_ext = community_pooling(cluster, data_ext)
+        x_pool = act(self.conv1_ext(x, edge_index, edge_attr))
+        cluster = get_preloaded_cluster(cluster0, batch)
+        x_pool, edge_index_pool, edge_attr_pool, batch_pool = pool_clusters(cluster, x_pool, edge_index, edge_attr, batch)
 
         # second conv block
-        data_ext.x = act(
-            self.conv2_ext(data_ext.x, data_ext.edge_index, data_ext.edge_attr)
-        )
-        cluster = get_preloaded_cluster(data_ext.cluster1, data_ext.batch)
-        x_ext, batch_ext = max_pool_x(cluster, data_ext.x, data_ext.batch)
+        x_pool = act(self.conv2_ext(x_pool, edge_index_pool, edge_attr_pool))
+        cluster = get_preloaded_cluster(cluster1, batch_pool)
+        x_ext, batch_ext = max_pool_x(cluster, x_pool, batch_pool)
+        assert batch_ext is not None
 
         # FC
-        x = scatter_mean(x, batch, dim=0)
-        x_ext = scatter_mean(x_ext, batch_ext, dim=0)
+        x = scatter_mean(x_int, batch_int, dim=0, dim_size=graph_count)
+        x_ext = scatter_mean(x_ext, batch_ext, dim=0, dim_size=graph_count)
 
         x = torch.cat([x, x_ext], dim=1)
         x = act(self.fc1(x))
@@ -1,6 +1,9 @@
 # Example of network that doesn't require clusters.  
 
+from typing import Optional
+
 import torch
+from torch import Tensor
 from torch.nn import Linear, Module, ReLU, Sequential
 from torch_scatter import scatter_mean, scatter_sum
 
@@ -17,13 +20,13 @@ class NaiveConvolutionalLayer(Module):
 
     def forward(self, node_features, edge_node_indices, edge_features):
         # generate messages over edges
-        node0_indices, node1_indices = edge_node_indices
+        node0_indices, node1_indices = edge_node_indices[0], edge_node_indices[1]
         node0_features = node_features[node0_indices]
         node1_features = node_features[node1_indices]
         message_input = torch.cat([node0_features, node1_features, edge_features], dim=1)
         messages_per_neighbour = self._edge_mlp(message_input)
         # aggregate messages
-        out = torch.zeros(node_features.shape[0], messages_per_neighbour.shape[1]).to(node_features.device)
+        out = torch.zeros(node_features.shape[0], messages_per_neighbour.shape[1], dtype=messages_per_neighbour.dtype).to(node_features.device)
         message_sums_per_node = scatter_sum(messages_per_neighbour, node0_indices, dim=0, out=out)
         # update nodes
         node_input = torch.cat([node_features, message_sums_per_node], dim=1)
@@ -45,10 +48,25 @@ class NaiveNetwork(Module):
         hidden_size = 128
         self._graph_mlp = Sequential(Linear(input_shape, hidden_size), ReLU(), Linear(hidden_size, output_shape))
 
+    @torch.jit.unused
     def forward(self, data):
-        external_updated1_node_features = self._external1(data.x, data.edge_index, data.edge_attr)
-        external_updated2_node_features = self._external2(external_updated1_node_features, data.edge_index, data.edge_attr)
-        means_per_graph_external = scatter_mean(external_updated2_node_features, data.batch, dim=0)
+        return self.forward_tensors(data.x, data.edge_index, data.edge_attr, data.batch)
+
+    @torch.jit.export
+    def forward_tensors( # pylint: disable=too-many-arguments, unused-argument
+        self,
+        x: Tensor,
+        edge_index: Tensor,
+        edge_attr: Tensor,
+        batch: Tensor,
+        cluster0: Optional[Tensor] = None,
+        cluster1: Optional[Tensor] = None,
+    ) -> Tensor:
+        "the forward pass on the tensors of a batch, which can be compiled with TorchScript; it doesn't use clusters"
+
+        external_updated1_node_features = self._external1(x, edge_index, edge_attr)
+        external_updated2_node_features = self._external2(external_updated1_node_features, edge_index, edge_attr)
+        means_per_graph_external = scatter_mean(external_updated2_node_features, batch, dim=0)
         graph_input = means_per_graph_external
         z = self._graph_mlp(graph_input)
         return z
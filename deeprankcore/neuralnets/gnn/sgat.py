@@ -1,13 +1,15 @@
+from typing import Optional
+
 import torch
 import torch.nn.functional as F
-from torch import nn
+from torch import Tensor
 from torch.nn import Parameter
 from torch_geometric.nn import max_pool_x
 from torch_geometric.nn.inits import uniform
 from torch_scatter import scatter_mean
 
-from deeprankcore.utils.community_pooling import (community_pooling,
-                                                  get_preloaded_cluster)
+from deeprankcore.utils.community_pooling import (get_preloaded_cluster,
+                                                  pool_clusters)
 
 
 class SGraphAttentionLayer(torch.nn.Module):
@@ -50,7 +52,7 @@ class SGraphAttentionLayer(torch.nn.Module):
 
     def forward(self, x, edge_index, edge_attr):
 
-        row, col = edge_index
+        row, col = edge_index[0], edge_index[1]
         num_node = len(x)
         edge_attr = edge_attr.unsqueeze(-1) if edge_attr.dim() == 1 else edge_attr
 
@@ -64,7 +66,7 @@ class SGraphAttentionLayer(torch.nn.Module):
         alpha = edge_attr * alpha
 
         # scatter the resulting edge feature to get node features
-        out = torch.zeros(num_node, self.out_channels).to(alpha.device)
+        out = torch.zeros(num_node, self.out_channels, dtype=alpha.dtype).to(alpha.device)
         out = scatter_mean(alpha, row, dim=0, out=out)
 
         # if the graph is undirected and (i,j) and (j,i) are both in
@@ -95,24 +97,39 @@ class SGAT(torch.nn.Module):
 
         self.clustering = "mcl"
 
+    @torch.jit.unused
     def forward(self, data):
-
-        act = nn.Tanhshrink()
+        return self.forward_tensors(data.x, data.edge_index, data.edge_attr, data.batch, data.cluster0, data.cluster1)
+
+    @torch.jit.export
+    def forward_tensors( # pylint: disable=too-many-arguments
+        self,
+        x: Tensor,
+        edge_index: Tensor,
+        edge_attr: Tensor,
+        batch: Tensor,
+        cluster0: Optional[Tensor] = None,
+        cluster1: Optional[Tensor] = None,
+    ) -> Tensor:
+        "the forward pass on the tensors of a batch, which leaves them unchanged and can be compiled with TorchScript"
+
+        assert cluster0 is not None and cluster1 is not None, "SGAT requires the clusters of the nodes"
         act = F.relu
-        # act = nn.LeakyReLU(0.25)
+        graph_count = int(batch.max()) + 1
 
         # first conv block
-        data.x = act(self.conv1(data.x, data.edge_index, data.edge_attr))
-        cluster = get_preloaded_cluster(data.cluster0, data.batch)
-        data = community_pooling(cluster, data)
+        x = act(self.conv1(x, edge_index, edge_attr))
+        cluster = get_preloaded_cluster(cluster0, batch)
+        x, edge_index, edge_attr, batch = pool_clusters(cluster, x, edge_index, edge_attr, batch)
 
         # second conv block
-        data.x = act(self.conv2(data.x, data.edge_index, data.edge_attr))
-        cluster = get_preloaded_cluster(data.cluster1, data.batch)
-        x, batch = max_pool_x(cluster, data.x, data.batch)
+        x = act(self.conv2(x, edge_index, edge_attr))
+        cluster = get_preloaded_cluster(cluster1, batch)
+        x, batch_pool = max_pool_x(cluster, x, batch)
+        assert batch_pool is not None
 
         # FC
-        x = scatter_mean(x, batch, dim=0)
+        x = scatter_mean(x, batch_pool, dim=0, dim_size=graph_count)
         x = act(self.fc1(x))
         x = self.fc2(x)
         # x = F.dropout(x, training=self.training)
@@ -24,9 +24,11 @@ from deeprankcore.molstruct.variant import SingleResidueVariant
 from deeprankcore.utils.buildgraph import (add_hydrogens, get_contact_atoms,
                                            get_structure,
                                            get_surrounding_residues)
+from deeprankcore.utils.catalogue import write_catalogue
 from deeprankcore.utils.graph import (Graph, build_atomic_graph,
                                       build_residue_graph)
 from deeprankcore.utils.grid import Augmentation, GridSettings, MapMethod
+from deeprankcore.utils.hdf5files import close_hdf5_file
 from deeprankcore.utils.parsing.pssm import parse_pssm
 
 _log = logging.getLogger(__name__)
@@ -289,13 +291,18 @@ class QueryCollection:
         output_paths = glob(f"{prefix}-*.hdf5")
 
         if combine_output:
+            close_hdf5_file(f"{prefix}.hdf5")
             for output_path in output_paths:
                 with h5py.File(f"{prefix}.hdf5",'a') as f_dest, h5py.File(output_path,'r') as f_src:
                     for key, value in f_src.items():
                         _log.debug(f"copy {key} from {output_path} to {prefix}.hdf5")
                         f_src.copy(value, f_dest)
                 os.remove(output_path)
-            return glob(f"{prefix}.hdf5")
+            output_paths = glob(f"{prefix}.hdf5")
+
+        # catalogue the entries, so that datasets don't need to traverse the files to index them
+        for output_path in output_paths:
+            write_catalogue(output_path)
 
         return output_paths
 
@@ -7,6 +7,7 @@ import numpy as np
 from pdb2sql import StructureSimilarity
 
 from deeprankcore.domain import targetstorage as targets
+from deeprankcore.utils.hdf5files import close_hdf5_file
 
 
 def add_target(graph_path: Union[str, List[str]], target_name: str, target_list: str, sep: str = " "):
@@ -51,6 +52,7 @@ def add_target(graph_path: Union[str, List[str]], target_name: str, target_list:
     for hdf5 in graphs:
         print(hdf5)
         try:
+            close_hdf5_file(hdf5)
             f5 = h5py.File(hdf5, "a")
 
             for model, _ in target_dict.items():
@@ -1,24 +1,35 @@
-import copy
+import json
 import logging
+import random
+from contextlib import nullcontext
 from time import time
-from typing import List, Optional, Tuple, Union
+from typing import Callable, Hashable, List, Optional, Tuple, Union
 
-import h5py
 import numpy as np
 import torch
 import torch.nn.functional as F
 from torch import nn
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data.distributed import DistributedSampler
 from torch_geometric.loader import DataLoader
-from tqdm import tqdm
 
-from deeprankcore.dataset import GraphDataset, GridDataset
+from deeprankcore.dataset import (GraphDataset, GridDataset,
+                                  hdf5_worker_init_fn)
 from deeprankcore.domain import losstypes as losses
 from deeprankcore.domain import targetstorage as targets
-from deeprankcore.utils.community_pooling import (community_detection,
-                                                  community_pooling)
+from deeprankcore.utils.batchsampler import SizeBatchSampler
+from deeprankcore.utils.checkpointing import CheckpointWriter, save_checkpoint
+from deeprankcore.utils.community_pooling import precluster_dataset
+from deeprankcore.utils.distributed import (gather_objects,
+                                            get_padding_count,
+                                            init_distributed, is_distributed,
+                                            is_main_process, merge_shards)
 from deeprankcore.utils.earlystopping import EarlyStopping
 from deeprankcore.utils.exporters import (HDF5OutputExporter, OutputExporter,
                                           OutputExporterCollection)
+from deeprankcore.utils.profiling import PassProfile
+from deeprankcore.utils.scripting import script_model
+from deeprankcore.utils.splits import split_indices
 
 _log = logging.getLogger(__name__)
 
@@ -37,6 +48,14 @@ class Trainer():
                 cuda: bool = False,
                 ngpu: int = 0,
                 output_exporters: Optional[List[OutputExporter]] = None,
+                stratify: bool = False,
+                group_by: Optional[Callable[[str], Hashable]] = None,
+                precision: str = "float32",
+                channels_last: bool = False,
+                num_threads: Optional[int] = None,
+                num_interop_threads: Optional[int] = None,
+                profile: bool = False,
+                precluster: bool = True,
             ):
         """Class from which the network is trained, evaluated and tested.
 
@@ -63,15 +82,45 @@ class Trainer():
             output_exporters (Optional[List[OutputExporter]], optional): The output exporters to use for saving/exploring/plotting predictions/targets/losses
                 over the epochs. If None, defaults to :class:`HDF5OutputExporter`, which saves all the results in an .HDF5 file stored in ./output directory.
                 Defaults to None.
+            stratify (bool, optional): Whether the val_size and test_size splits keep the proportions of the classes. For classification
+                only. Defaults to False.
+            group_by (Optional[Callable[[str], Hashable]], optional): Maps an entry name to a group, e.g. its PDB ID, that the val_size and test_size
+                splits keep together on one side. Can't be combined with stratify. Defaults to None.
+            precision (str, optional): "float32", or "bfloat16" to run the model's forward passes under bfloat16 autocast, which speeds up
+                training on cpus with bfloat16 support (e.g. Xeons with AVX-512 BF16 or AMX) and on recent gpus. The parameters, the gradients
+                and the losses stay in float32. Defaults to "float32".
+            channels_last (bool, optional): Whether to keep the weights and input grids of a CNN in channels-last (NDHWC) memory format,
+                which oneDNN's 3D convolutions are fastest with on cpu. For :class:`GridDataset` only. Defaults to False.
+            num_threads (Optional[int], optional): Number of threads that torch uses within an operation (intra-op parallelism), e.g. the
+                number of physical cores of the socket. Applies to the whole process. Defaults to None, which keeps torch's setting.
+            num_interop_threads (Optional[int], optional): Number of threads that torch runs independent operations on (inter-op parallelism).
+                Torch accepts it only once per process, before any parallel work. Defaults to None, which keeps torch's setting.
+            profile (bool, optional): Whether to time the stages of every pass over the data (loading, transfer to the device, forward,
+                loss, backward, optimizer step and export) and record the throughput, graph sizes and peak memory (see
+                :class:`deeprankcore.utils.profiling.PassProfile`). The metrics are logged and handed to the output exporters'
+                `process_profile`, e.g. to :class:`deeprankcore.utils.exporters.TensorboardProfileExporter`. On a gpu, the stages wait for their kernels,
+                which slows training down a little. Defaults to False.
+            precluster (bool, optional): Whether to detect the clusters of the graphs, for datasets with a clustering_method, and store them
+                in the .HDF5 files. Set it to False when the clusters are already stored, e.g. by an earlier Trainer on the same files, to
+                skip the detection and the writes. Defaults to True.
         """
         self.batch_size_train = None
         self.batch_size_test = None
         self.shuffle = None
 
+        # the model wrapped for distributed training, during a distributed run of train
+        self._ddp_model = None
+        # the torch profiler that is stepped every training batch, during train
+        self._torch_profiler = None
+        self.profile = profile
+
         self._init_output_exporters(output_exporters)
 
         self.neuralnet = neuralnet
 
+        self.stratify = stratify
+        self.group_by = group_by
+
         self._init_datasets(dataset_train, dataset_val, dataset_test,
                             val_size, test_size)
 
@@ -119,6 +168,11 @@ class Trainer():
             _log.info(f"CUDA device name is {torch.cuda.get_device_name(0)}.")
             _log.info(f"Number of GPUs set to {self.ngpu}.")
 
+        self._init_compute_settings(precision, channels_last, num_threads, num_interop_threads)
+
+        # class index of every integer target value, built from classes_to_index when first needed
+        self._class_lookup = None
+
         if pretrained_model is None:
             if self.dataset_train is None:
                 raise ValueError("No training data specified. Training data is required if there is no pretrained model.")
@@ -140,17 +194,19 @@ class Trainer():
             # clustering the datasets
             if self.clustering_method is not None:
                 if self.clustering_method in ('mcl', 'louvain'):
-                    _log.info("Loading clusters")
-                    self._precluster(self.dataset_train)
+                    if precluster:
+                        _log.info("Loading clusters")
+                        self._precluster(self.dataset_train)
 
                     if self.dataset_val is not None:
-                        self._precluster(self.dataset_val)
+                        if precluster:
+                            self._precluster(self.dataset_val)
                     else:
                         _log.warning("No validation dataset given. Randomly splitting training set in training set and validation set.")
                         self.dataset_train, self.dataset_val = _divide_dataset(
-                            self.dataset_train, splitsize=self.val_size)
+                            self.dataset_train, splitsize=self.val_size, stratify=self.stratify, group_by=self.group_by)
 
-                    if self.dataset_test is not None:
+                    if self.dataset_test is not None and precluster:
                         self._precluster(self.dataset_test)
                 else:
                     raise ValueError(
@@ -175,6 +231,33 @@ class Trainer():
             self._load_params()
             self._load_pretrained_model()
 
+    def _init_compute_settings(
+        self,
+        precision: str,
+        channels_last: bool,
+        num_threads: Optional[int],
+        num_interop_threads: Optional[int],
+    ):
+
+        if precision not in ("float32", "bfloat16"):
+            raise ValueError(f"Invalid precision: {precision}\n\tPlease set precision to 'float32' or 'bfloat16'.")
+        self.precision = precision
+        self.channels_last = channels_last
+
+        self.num_threads = num_threads
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self.num_interop_threads = num_interop_threads
+        if num_interop_threads is not None and num_interop_threads != torch.get_num_interop_threads():
+            try:
+                torch.set_num_interop_threads(num_interop_threads)
+            except RuntimeError as e:
+                _log.warning(f"Could not set the number of inter-op threads to {num_interop_threads}: {e}")
+
+        _log.info(f"Precision set to {self.precision}, using {torch.get_num_threads()} intra-op " +
+                  f"and {torch.get_num_interop_threads()} inter-op threads.")
+
     def _init_output_exporters(self, output_exporters: Optional[List[OutputExporter]]):
 
         if output_exporters is not None:
@@ -200,13 +283,15 @@ class Trainer():
         # Divide datasets where necessary.
         if test_size is not None:
             if dataset_test is None:
-                self.dataset_train, self.dataset_test = _divide_dataset(dataset_train, test_size)
+                self.dataset_train, self.dataset_test = _divide_dataset(
+                    self.dataset_train, test_size, stratify=self.stratify, group_by=self.group_by)
             else:
                 _log.warning("Test dataset was provided to Trainer; test_size parameter is ignored.")
 
         if val_size is not None:
             if dataset_val is None:
-                self.dataset_train, self.dataset_val = _divide_dataset(dataset_train, val_size)
+                self.dataset_train, self.dataset_val = _divide_dataset(
+                    self.dataset_train, val_size, stratify=self.stratify, group_by=self.group_by)
             else:
                 _log.warning("Validation dataset was provided to Trainer; val_size parameter is ignored.")
 
@@ -309,8 +394,9 @@ class Trainer():
         self._put_model_to_device(self.dataset_test)
 
         # load the model and the optimizer state
-        self.optimizer.load_state_dict(self.opt_loaded_state_dict)
         self.model.load_state_dict(self.model_load_state_dict)
+        self.configure_optimizers(self._optimizer_class, self.lr, self.weight_decay)
+        self.optimizer.load_state_dict(self.opt_loaded_state_dict)
 
     def _precluster(self, dataset: GraphDataset):
         """Pre-clusters nodes of the graphs
@@ -318,38 +404,7 @@ class Trainer():
         Args:
             dataset (:class:`GraphDataset`)
         """
-        for fname, mol in tqdm(dataset.index_entries):
-            data = dataset.load_one_graph(fname, mol)
-
-            if data is None:
-                f5 = h5py.File(fname, "a")
-                try:
-                    _log.info(f"deleting {mol}")
-                    del f5[mol]
-                except BaseException:
-                    _log.info(f"{mol} not found")
-                f5.close()
-                continue
-
-            f5 = h5py.File(fname, "a")
-            grp = f5[mol]
-            clust_grp = grp.require_group("clustering")
-
-            if self.clustering_method.lower() in clust_grp:
-                del clust_grp[self.clustering_method.lower()]
-
-            method_grp = clust_grp.create_group(self.clustering_method.lower())
-            cluster = community_detection(
-                data.edge_index, data.num_nodes, method=self.clustering_method
-            )
-            method_grp.create_dataset("depth_0", data=cluster.cpu())
-            data = community_pooling(cluster, data)
-            cluster = community_detection(
-                data.edge_index, data.num_nodes, method=self.clustering_method
-            )
-            method_grp.create_dataset("depth_1", data=cluster.cpu())
-
-            f5.close()
+        precluster_dataset(dataset, self.clustering_method)
 
     def _put_model_to_device(self, dataset: Union[GraphDataset, GridDataset]):
         """
@@ -377,6 +432,8 @@ class Trainer():
             target_shape = None
 
         if isinstance(dataset, GraphDataset):
+            if self.channels_last:
+                raise ValueError("channels_last applies to the grids of a GridDataset only.")
 
             num_node_features = dataset.get(0).num_features
             num_edge_features = len(dataset.edge_features)
@@ -393,6 +450,8 @@ class Trainer():
             self.model = self.neuralnet(num_features,
                                         (box_width, box_height, box_depth)
             ).to(self.device)
+            if self.channels_last:
+                self.model = self.model.to(memory_format=torch.channels_last_3d)
         else:
             raise TypeError(type(dataset))
 
@@ -520,6 +579,14 @@ class Trainer():
         num_workers: int = 0,
         save_best_model: Optional[bool] = True,
         output_prefix: Optional[str] = None,
+        max_batch_nodes: Optional[int] = None,
+        max_batch_edges: Optional[int] = None,
+        eval_batch_size: Optional[int] = None,
+        distributed: bool = False,
+        checkpoint_every: Optional[int] = None,
+        keep_checkpoints: Optional[int] = 3,
+        resume_from: Optional[str] = None,
+        torch_profiler: Optional[torch.profiler.profile] = None,
     ):
         """
         Performs the training of the model.
@@ -548,27 +615,48 @@ class Trainer():
                         Defaults to True.
             output_prefix (Optional[str], optional): Name under which the model is saved. A description of the model settings is appended to the prefix.
                         Defaults to None.
+            max_batch_nodes (Optional[int], optional): If set, batches are formed under this budget of nodes, by a :class:`SizeBatchSampler`,
+                        and batch_size only limits the number of entries per batch. Entries of similar sizes are batched together.
+                        Defaults to None.
+            max_batch_edges (Optional[int], optional): Like max_batch_nodes, for the number of edges. Both budgets can be combined.
+                        Defaults to None.
+            eval_batch_size (Optional[int], optional): Sets the size of the batch for validation, which keeps no gradients and
+                        can therefore use larger batches. Defaults to None, which takes batch_size.
+            distributed (bool, optional): Train with distributed data parallelism, in a process started by torchrun (see `deeprankcore.utils.distributed`).
+                        Every process trains on its own shard of the training and validation sets, the gradients are averaged over the processes,
+                        and only the process with rank 0 exports outputs and saves the model. All processes must be given the same datasets,
+                        so pass a validation set rather than letting the trainer split one off at random.
+                        Defaults to False.
+            checkpoint_every (Optional[int], optional): If set, a checkpoint to resume the training from is saved every this number of epochs,
+                        as output_prefix followed by _checkpoint_e<epoch>.pth.tar. Models and checkpoints are copied to cpu memory and written
+                        to disk in the background, while the training goes on. Defaults to None.
+            keep_checkpoints (Optional[int], optional): Number of most recent checkpoints to keep, the older ones are removed.
+                        None keeps all checkpoints. Defaults to 3.
+            resume_from (Optional[str], optional): Checkpoint to resume the training from. The training continues after the epoch of the checkpoint,
+                        with its model, optimizer, early stopping, losses and random number generator states, up to nepoch.
+                        In a distributed run, the random number generator states are those of the process with rank 0.
+                        Defaults to None.
+            torch_profiler (Optional[torch.profiler.profile], optional): A :mod:`torch.profiler` profiler, e.g. with a schedule and
+                        `torch.profiler.tensorboard_trace_handler`, to trace the training. The trainer starts it, steps it after every
+                        training batch and stops it at the end of the training. The stages of the trainer's profile (see the profile
+                        option of :class:`Trainer`) are labelled in the traces. Defaults to None.
         """
         self.batch_size_train = batch_size
         self.shuffle = shuffle
 
-        self.train_loader = DataLoader(
-            self.dataset_train,
-            batch_size=self.batch_size_train,
-            shuffle=self.shuffle,
-            num_workers=num_workers,
-            pin_memory=self.cuda
-        )
+        if distributed:
+            if self.ngpu > 1:
+                raise ValueError("Distributed training can't be combined with multiple gpus per process (ngpu > 1).")
+            init_distributed()
+
+        self.train_loader = self._create_loader(
+            self.dataset_train, self.batch_size_train, self.shuffle, num_workers, max_batch_nodes, max_batch_edges, distributed)
         _log.info("Training set loaded\n")
 
         if self.dataset_val is not None:
-            self.valid_loader = DataLoader(
-                self.dataset_val,
-                batch_size=self.batch_size_train,
-                shuffle=self.shuffle,
-                num_workers=num_workers,
-                pin_memory=self.cuda
-            )
+            self.valid_loader = self._create_loader(
+                self.dataset_val, eval_batch_size or self.batch_size_train, self.shuffle, num_workers, max_batch_nodes, max_batch_edges,
+                distributed)
             _log.info("Validation set loaded\n")
         else:
             self.valid_loader = None
@@ -576,13 +664,10 @@ class Trainer():
 
         # Assign weights to each class
         if self.task == targets.CLASSIF and self.class_weights:
-            targets_all = []
-            for batch in self.train_loader:
-                targets_all.append(batch.y)
-
-            targets_all = torch.cat(targets_all).squeeze().tolist()
+            # count the classes in the stored target values, rather than loading the training set
+            targets_all = self.dataset_train.get_target_values()
             self.weights = torch.tensor(
-                [targets_all.count(i) for i in self.classes], dtype=torch.float32
+                [np.count_nonzero(targets_all == i) for i in self.classes], dtype=torch.float32
             )
             _log.info(f"class occurences: {self.weights}")
             self.weights = 1.0 / self.weights
@@ -611,20 +696,38 @@ class Trainer():
             output_prefix = 'model'
         output_file = output_prefix + f'_t{self.task}_y{self.target}_b{str(self.batch_size_train)}_e{str(nepoch)}_lr{str(self.lr)}_{str(nepoch)}.pth.tar'
 
-        with self._output_exporters:
+        if validate and self.valid_loader is None:
+            raise ValueError("No validation dataset provided.")
+
+        if resume_from is not None:
+            start_epoch = self._resume(resume_from, train_losses, valid_losses, early_stopping) + 1
+        else:
+            start_epoch = 1
+
+        # the wrapper averages the gradients over the processes, it starts off all processes with the parameters of rank 0
+        self._ddp_model = DistributedDataParallel(self.model) if distributed else None
+
+        self._torch_profiler = torch_profiler
+
+        with self._output_exporters, CheckpointWriter(keep_checkpoints) as checkpoint_writer, \
+                torch_profiler if torch_profiler is not None else nullcontext():
             # Number of epochs
             self.nepoch = nepoch
-            _log.info('Epoch 0:')
-            self._eval(self.train_loader, 0, "training")
-            if validate:
-                if self.valid_loader is None:
-                    raise ValueError("No validation dataset provided.")
-                self._eval(self.valid_loader, 0, "validation")
+            if resume_from is None:
+                _log.info('Epoch 0:')
+                self._eval(self.train_loader, 0, "training")
+                if validate:
+                    self._eval(self.valid_loader, 0, "validation")
 
             # Loop over epochs
-            for epoch in range(1, nepoch + 1):
+            epoch = start_epoch - 1
+            for epoch in range(start_epoch, nepoch + 1):
                 _log.info(f'Epoch {epoch}:')
 
+                # reshuffle the shards
+                if isinstance(self.train_loader.sampler, DistributedSampler):
+                    self.train_loader.sampler.set_epoch(epoch)
+
                 # Set the module in training mode
                 self.model.train()
                 loss_ = self._epoch(epoch, "training")
@@ -636,7 +739,7 @@ class Trainer():
                     valid_losses.append(loss_)
                     if save_best_model:
                         if min(valid_losses) == loss_:
-                            self.save_model(output_file)
+                            self._write_model(checkpoint_writer, output_file)
                             self.epoch_saved_model = epoch
                             _log.info(f'Best model saved at epoch # {self.epoch_saved_model}.')
                 else:
@@ -646,22 +749,138 @@ class Trainer():
                             _log.warning(
                                 "Training data is used both for learning and model selection, which will to overfitting." +
                                 "\n\tIt is preferable to use an independent training and validation data sets.")
-                            self.save_model(output_file)
+                            self._write_model(checkpoint_writer, output_file)
                             self.epoch_saved_model = epoch
                             _log.info(f'Best model saved at epoch # {self.epoch_saved_model}.')
                 
                 # check early stopping criteria
                 if early_stopping:
                     early_stopping(epoch, loss_, min(train_losses))
-                    if early_stopping.early_stop:
-                        break
+
+                if checkpoint_every is not None and epoch % checkpoint_every == 0:
+                    self._write_model(
+                        checkpoint_writer, output_prefix + f'_checkpoint_e{epoch}.pth.tar',
+                        self._get_training_state(epoch, train_losses, valid_losses, early_stopping), rotate=True)
+
+                if early_stopping and early_stopping.early_stop:
+                    break
 
             # Save the last model
             if save_best_model is False:
-                self.save_model(output_file)
+                self._write_model(checkpoint_writer, output_file)
                 self.epoch_saved_model = epoch
                 _log.info(f'Last model saved at epoch # {self.epoch_saved_model}.')
 
+        self._ddp_model = None
+        self._torch_profiler = None
+
+    def _get_training_state(
+        self,
+        epoch: int,
+        train_losses: List[float],
+        valid_losses: List[float],
+        early_stopping: Optional[EarlyStopping],
+    ) -> dict:
+        "the progress of the training, to resume it from a checkpoint"
+
+        return {
+            "epoch": epoch,
+            "train_losses": list(train_losses),
+            "valid_losses": list(valid_losses),
+            "epoch_saved_model": self.epoch_saved_model,
+            "early_stopping": early_stopping.state_dict() if early_stopping else None,
+            "torch_rng_state": torch.get_rng_state(),
+            "cuda_rng_states": torch.cuda.get_rng_state_all() if self.cuda else None,
+            "numpy_rng_state": np.random.get_state(),
+            "python_rng_state": random.getstate(),
+        }
+
+    def _resume(
+        self,
+        checkpoint_path: str,
+        train_losses: List[float],
+        valid_losses: List[float],
+        early_stopping: Optional[EarlyStopping],
+    ) -> int:
+        """
+        Restores the model, optimizer, losses, early stopping and random number generators from a checkpoint.
+
+        Returns:
+            int: The epoch of the checkpoint.
+        """
+
+        # the checkpoint, written by save_model, holds the optimizer class, loss function and random number generator states
+        state = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+        if "training_state" not in state:
+            raise ValueError(f"{checkpoint_path} is a model, not a checkpoint to resume the training from.")
+
+        self.model.load_state_dict(state["model_state"])
+        self.optimizer.load_state_dict(state["optimizer_state"])
+
+        training_state = state["training_state"]
+        train_losses[:] = training_state["train_losses"]
+        valid_losses[:] = training_state["valid_losses"]
+        self.epoch_saved_model = training_state["epoch_saved_model"]
+        if early_stopping and training_state["early_stopping"] is not None:
+            early_stopping.load_state_dict(training_state["early_stopping"])
+
+        torch.set_rng_state(training_state["torch_rng_state"].cpu())
+        if self.cuda and training_state["cuda_rng_states"] is not None:
+            torch.cuda.set_rng_state_all([rng_state.cpu() for rng_state in training_state["cuda_rng_states"]])
+        np.random.set_state(training_state["numpy_rng_state"])
+        random.setstate(training_state["python_rng_state"])
+
+        _log.info(f"Resuming the training after epoch # {training_state['epoch']}.")
+        return training_state["epoch"]
+
+    def _create_loader( # pylint: disable=too-many-arguments
+        self,
+        dataset: Union[GraphDataset, GridDataset],
+        batch_size: int,
+        shuffle: bool,
+        num_workers: int,
+        max_batch_nodes: Optional[int],
+        max_batch_edges: Optional[int],
+        distributed: bool = False,
+    ) -> DataLoader:
+        """Creates a loader with batches of batch_size entries or, with a node or edge budget, of similarly sized entries.
+
+        A distributed loader gives each process its own shard of the dataset.
+        """
+
+        if distributed:
+            if max_batch_nodes is not None or max_batch_edges is not None:
+                raise ValueError("Batches under a node or edge budget are not supported in distributed training.")
+
+            return DataLoader(
+                dataset,
+                batch_size=batch_size,
+                sampler=DistributedSampler(dataset, shuffle=shuffle),
+                num_workers=num_workers,
+                worker_init_fn=hdf5_worker_init_fn,
+                pin_memory=self.cuda
+            )
+
+        if max_batch_nodes is None and max_batch_edges is None:
+            return DataLoader(
+                dataset,
+                batch_size=batch_size,
+                shuffle=shuffle,
+                num_workers=num_workers,
+                worker_init_fn=hdf5_worker_init_fn,
+                pin_memory=self.cuda
+            )
+
+        batch_sampler = SizeBatchSampler.from_dataset(
+            dataset, max_nodes=max_batch_nodes, max_edges=max_batch_edges, max_batch_size=batch_size, shuffle=shuffle)
+        return DataLoader(
+            dataset,
+            batch_sampler=batch_sampler,
+            num_workers=num_workers,
+            worker_init_fn=hdf5_worker_init_fn,
+            pin_memory=self.cuda
+        )
+
     def _epoch(self, epoch_number: int, pass_name: str) -> float:
         """
         Runs a single epoch
@@ -674,37 +893,57 @@ class Trainer():
             Running loss.
         """
 
+        model = self.model if self._ddp_model is None else self._ddp_model
+
         sum_of_losses = 0
         count_predictions = 0
-        target_vals = []
-        outputs = []
-        entry_names = []
+        output_chunks = _OutputChunks(self._get_chunk_exporter(pass_name, epoch_number), self.train_loader)
+        shard_padding = _ShardPadding(self.train_loader)
+        profile = self._create_profile()
         t0 = time()
-        for data_batch in self.train_loader:
+        profile.start()
+        for data_batch in profile.iterate(self.train_loader):
+            profile.add_batch(data_batch)
             if self.cuda:
-                data_batch = data_batch.to(self.device, non_blocking=True)
+                with profile.stage("transfer"):
+                    data_batch = data_batch.to(self.device, non_blocking=True)
             self.optimizer.zero_grad()
-            pred = self.model(data_batch)
-            pred, data_batch.y = self._format_output(pred, data_batch.y)
-            loss_ = self.lossfunction(pred, data_batch.y)
-            loss_.backward()
-            self.optimizer.step()
-            count_predictions += pred.shape[0]
-
-            # convert mean back to sum
-            sum_of_losses += loss_.detach().item() * pred.detach().shape[0]
-            target_vals += data_batch.y.detach().cpu().numpy().tolist()
+            with profile.stage("forward"):
+                pred = self._forward(model, data_batch)
+                pred, data_batch.y = self._format_output(pred, data_batch.y)
+            with profile.stage("loss"):
+                loss_ = self.lossfunction(pred, data_batch.y)
+            with profile.stage("backward"):
+                loss_.backward()
+            with profile.stage("optimizer"):
+                self.optimizer.step()
+            kept_count = shard_padding.take(pred.shape[0])
+            count_predictions += kept_count
+
+            # convert mean back to sum, over the entries that aren't padding
+            if kept_count == pred.shape[0]:
+                sum_of_losses += loss_.detach().item() * kept_count
+            elif kept_count > 0:
+                with torch.no_grad():
+                    sum_of_losses += self.lossfunction(pred.detach()[:kept_count], data_batch.y[:kept_count]).item() * kept_count
 
             # Get the outputs for export
             # Remember that non-linear activation is automatically applied in CrossEntropyLoss
-            if self.task == targets.CLASSIF:
-                pred = F.softmax(pred.detach(), dim=1)
-            else:
-                pred = pred.detach().reshape(-1)
-            outputs += pred.cpu().numpy().tolist()
+            with profile.stage("export"):
+                if self.task == targets.CLASSIF:
+                    pred = F.softmax(pred.detach(), dim=1)
+                else:
+                    pred = pred.detach().reshape(-1)
+                output_chunks.add(data_batch.entry_names, pred, data_batch.y.detach())
+
+            if self._torch_profiler is not None:
+                self._torch_profiler.step()
 
-            # Get the name
-            entry_names += data_batch.entry_names
+        with profile.stage("export"):
+            output_chunks.flush()
+
+        if isinstance(self.train_loader.sampler, DistributedSampler):
+            sum_of_losses, count_predictions = self._gather_losses(sum_of_losses, count_predictions)
 
         dt = time() - t0
         if count_predictions > 0:
@@ -712,13 +951,28 @@ class Trainer():
         else:
             epoch_loss = 0.0
 
-        self._output_exporters.process(
-            pass_name, epoch_number, entry_names, outputs, target_vals, epoch_loss)
+        with profile.stage("export"):
+            self._output_exporters.end_pass(pass_name, epoch_number, epoch_loss)
+        profile.stop()
         self._log_epoch_data(pass_name, epoch_loss, dt)
+        self._report_profile(pass_name, epoch_number, profile)
 
         return epoch_loss
 
-    def _eval( # pylint: disable=too-many-locals
+    def _forward(self, model: nn.Module, data_batch) -> torch.Tensor:
+        "runs the model on a batch, in the trainer's precision and memory format, and returns its output in float32"
+
+        if self.channels_last and data_batch.x.dim() == 5:
+            data_batch.x = data_batch.x.contiguous(memory_format=torch.channels_last_3d)
+
+        if self.precision == "bfloat16":
+            with torch.autocast(self.device.type, dtype=torch.bfloat16):
+                pred = model(data_batch)
+            return pred.float()
+
+        return model(data_batch)
+
+    def _eval(
             self,
             loader: DataLoader,
             epoch_number: int,
@@ -737,50 +991,211 @@ class Trainer():
             Running loss.
         """
 
+        profile = self._create_profile()
+        t0 = time()
+        profile.start()
+        sum_of_losses, count_targets = self._infer(loader, self._get_chunk_exporter(pass_name, epoch_number), profile)
+
+        if isinstance(loader.sampler, DistributedSampler):
+            sum_of_losses, count_targets = self._gather_losses(sum_of_losses, count_targets)
+        dt = time() - t0
+
+        eval_loss = sum_of_losses / count_targets if count_targets > 0 else 0.0
+
+        with profile.stage("export"):
+            self._output_exporters.end_pass(pass_name, epoch_number, eval_loss)
+        profile.stop()
+        self._log_epoch_data(pass_name, eval_loss, dt)
+        self._report_profile(pass_name, epoch_number, profile)
+
+        return eval_loss
+
+    def _create_profile(self) -> PassProfile:
+        "a profile for a pass over the data, which records nothing unless profiling is enabled"
+
+        return PassProfile(self.profile, self.device, record_functions=self._torch_profiler is not None)
+
+    def _report_profile(self, pass_name: str, epoch_number: int, profile: PassProfile):
+        "logs the metrics of a pass's profile, as json, and hands them to the output exporters"
+
+        if not profile.enabled:
+            return
+
+        metrics = profile.summary()
+        _log.info(f"{pass_name} profile {json.dumps(metrics, sort_keys=True)}",
+                  extra={"pass_name": pass_name, "epoch_number": epoch_number, "profile": metrics})
+        self._output_exporters.process_profile(pass_name, epoch_number, metrics)
+
+    def _get_chunk_exporter(self, pass_name: str, epoch_number: int) -> Callable[[List[str], torch.Tensor, Optional[torch.Tensor]], None]:
+        "a function that hands chunks of outputs to the output exporters"
+
+        def _export_chunk(entry_names: List[str], outputs: torch.Tensor, target_vals: Optional[torch.Tensor]):
+            self._output_exporters.process_chunk(
+                pass_name, epoch_number, entry_names, outputs.tolist(), [] if target_vals is None else target_vals.tolist())
+
+        return _export_chunk
+
+    @staticmethod
+    def _gather_losses(sum_of_losses: float, count: int) -> Tuple[float, int]:
+        """Sums the losses of all processes of a distributed run.
+
+        Returns:
+            Tuple[float, int]: The sum of the losses and the number of entries they were summed over.
+        """
+
+        sums = gather_objects((sum_of_losses, count))
+        return sum(shard_sum[0] for shard_sum in sums), sum(shard_sum[1] for shard_sum in sums)
+
+    def _infer(
+        self,
+        loader: DataLoader,
+        process_chunk: Callable[[List[str], torch.Tensor, Optional[torch.Tensor]], None],
+        profile: Optional[PassProfile] = None,
+    ) -> Tuple[float, int]:
+        """
+        Runs the model on the data of a loader, without building autograd graphs.
+
+        The outputs and targets are gathered in buffers on the device, and handed over in chunks (see :class:`_OutputChunks`).
+
+        Args:
+            loader (Dataloader): Data to evaluate on.
+            process_chunk (Callable[[List[str], torch.Tensor, Optional[torch.Tensor]], None]): Takes the entry names, the outputs
+                (probabilities per class for classification) and the targets (None if the data has none) of every chunk, on the cpu.
+            profile (Optional[PassProfile], optional): Profile to time the stages in. Defaults to None.
+
+        Returns:
+            Tuple[float, int]: The sum of the losses and the number of entries with targets they were summed over.
+        """
+
         # Sets the module in evaluation mode
         self.model.eval()
-        loss_func = self.lossfunction
-        target_vals = []
-        outputs = []
+
+        if profile is None:
+            profile = PassProfile(enabled=False)
+
+        output_chunks = _OutputChunks(process_chunk, loader)
+        shard_padding = _ShardPadding(loader)
+        sum_of_losses = torch.zeros((), device=self.device)
+        count_targets = 0
+
+        with torch.inference_mode():
+            for data_batch in profile.iterate(loader):
+                profile.add_batch(data_batch)
+                if self.cuda:
+                    with profile.stage("transfer"):
+                        data_batch = data_batch.to(self.device, non_blocking=True)
+                with profile.stage("forward"):
+                    pred = self._forward(self.model, data_batch)
+                    pred, y = self._format_output(pred, data_batch.y)
+                kept_count = shard_padding.take(pred.shape[0])
+
+                # Check if a target value was provided (i.e. benchmarck scenario)
+                if y is not None and kept_count > 0:
+                    with profile.stage("loss"):
+                        sum_of_losses += self.lossfunction(pred[:kept_count], y[:kept_count]) * kept_count
+                    count_targets += kept_count
+
+                # Get the outputs for export
+                # Remember that non-linear activation is automatically applied in CrossEntropyLoss
+                with profile.stage("export"):
+                    if self.task == targets.CLASSIF:
+                        pred = F.softmax(pred, dim=1)
+                    else:
+                        pred = pred.reshape(-1)
+
+                    output_chunks.add(data_batch.entry_names, pred, y)
+
+            with profile.stage("export"):
+                output_chunks.flush()
+
+        return sum_of_losses.item(), count_targets
+
+    def predict(
+        self,
+        dataset: Optional[Union[GraphDataset, GridDataset, str, List[str]]] = None,
+        batch_size: int = 32,
+        num_workers: int = 0,
+    ) -> Tuple[List[str], np.ndarray, Optional[np.ndarray]]:
+        """
+        Scores data with the model, without exporting the results.
+
+        Args:
+            dataset (Optional[Union[:class:`GraphDataset`, :class:`GridDataset`, str, List[str]]], optional): The data to score.
+                        Either a dataset, or .HDF5 file(s) that are loaded like the training dataset (or the testing dataset, for a pretrained model),
+                        with the same features and standardization but without targets.
+                        Defaults to None, which scores the testing dataset.
+            batch_size (int, optional): Sets the size of the batch. Since no gradients are kept, it can be larger than in training.
+                        Defaults to 32.
+            num_workers (int, optional): How many subprocesses to use for data loading. 0 means that the data will be loaded in the main process.
+                        Defaults to 0.
+
+        Returns:
+            Tuple[List[str], np.ndarray, Optional[np.ndarray]]: The entry names, the outputs (probabilities per class for classification) and
+                the targets (None if the data has none).
+        """
+
+        if dataset is None:
+            if self.dataset_test is None:
+                raise ValueError("No dataset to predict on: pass one, or provide a test dataset.")
+            dataset = self.dataset_test
+
+        elif isinstance(dataset, (str, list)):
+            dataset = self._create_prediction_dataset(dataset)
+
+        loader = DataLoader(
+            dataset,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            worker_init_fn=hdf5_worker_init_fn,
+            pin_memory=self.cuda
+        )
+
         entry_names = []
-        sum_of_losses = 0
-        count_predictions = 0
-        t0 = time()
-        for data_batch in loader:
-            if self.cuda:
-                data_batch = data_batch.to(self.device, non_blocking=True)
-            pred = self.model(data_batch)
-            pred, y = self._format_output(pred, data_batch.y)
+        outputs = []
+        target_vals = []
 
-            # Check if a target value was provided (i.e. benchmarck scenario)
-            if y is not None:
-                target_vals += y.cpu().numpy().tolist()
-                loss_ = loss_func(pred, y)
-                count_predictions += pred.shape[0]
-                sum_of_losses += loss_.detach().item() * pred.shape[0]
+        def _collect_chunk(chunk_entry_names: List[str], chunk_outputs: torch.Tensor, chunk_target_vals: Optional[torch.Tensor]):
+            entry_names.extend(chunk_entry_names)
+            outputs.append(chunk_outputs.numpy())
+            if chunk_target_vals is not None:
+                target_vals.append(chunk_target_vals.numpy())
 
-            # Get the outputs for export
-            # Remember that non-linear activation is automatically applied in CrossEntropyLoss
-            if self.task == targets.CLASSIF:
-                pred = F.softmax(pred.detach(), dim=1)
-            else:
-                pred = pred.detach().reshape(-1)
-            outputs += pred.cpu().numpy().tolist()
+        self._infer(loader, _collect_chunk)
 
-            # get the name
-            entry_names += data_batch.entry_names
+        if len(outputs) == 0:
+            return entry_names, np.empty(0), None
 
-        dt = time() - t0
-        if count_predictions > 0:
-            eval_loss = sum_of_losses / count_predictions
-        else:
-            eval_loss = 0.0
+        return entry_names, np.concatenate(outputs), np.concatenate(target_vals) if len(target_vals) > 0 else None
 
-        self._output_exporters.process(
-            pass_name, epoch_number, entry_names, outputs, target_vals, eval_loss)
-        self._log_epoch_data(pass_name, eval_loss, dt)
+    def _create_prediction_dataset(self, hdf5_path: Union[str, List[str]]) -> Union[GraphDataset, GridDataset]:
+        """Loads .HDF5 files like the dataset that the trainer was set up with."""
 
-        return eval_loss
+        reference = self.dataset_train if self.dataset_train is not None else self.dataset_test
+
+        if isinstance(reference, GraphDataset):
+            dataset = GraphDataset(
+                hdf5_path,
+                node_features=reference.node_features,
+                edge_features=reference.edge_features,
+                clustering_method=reference.clustering_method,
+                classes=reference.classes,
+                tqdm=False,
+                standardize=reference._standardize, # pylint: disable=protected-access
+                train=not reference._standardize, # pylint: disable=protected-access
+                dataset_train=reference if reference._standardize else None, # pylint: disable=protected-access
+            )
+            if dataset.clustering_method is not None:
+                self._precluster(dataset)
+        else:
+            dataset = GridDataset(
+                hdf5_path,
+                features=reference.features,
+                classes=reference.classes,
+                tqdm=False,
+                standardize=reference._standardize, # pylint: disable=protected-access
+            )
+
+        return dataset
 
     @staticmethod
     def _log_epoch_data(stage: str, loss: float, time: float):
@@ -803,9 +1218,12 @@ class Trainer():
         if (self.task == targets.CLASSIF) and (target is not None):
             # For categorical cross entropy, the target must be a one-dimensional tensor
             # of class indices with type long and the output should have raw, unnormalized values
-            target = torch.tensor(
-                [self.classes_to_index[x] if isinstance(x, str) else self.classes_to_index[int(x)] for x in target]
-            )
+            if isinstance(target, torch.Tensor):
+                target = self._get_class_indices(target)
+            else:
+                target = torch.tensor(
+                    [self.classes_to_index[x] if isinstance(x, str) else self.classes_to_index[int(x)] for x in target]
+                )
             if isinstance(self.lossfunction, (nn.BCELoss, nn.BCEWithLogitsLoss)):
                 # # pred must be in (0,1) range and target must be float with same shape as pred
                 # pred = F.softmax(pred)
@@ -828,10 +1246,41 @@ class Trainer():
 
         return pred, target
 
+    def _get_class_indices(self, target: torch.Tensor) -> torch.Tensor:
+        """Converts the target values of a batch to class indices, as classes_to_index does, all at once.
+
+        Raises:
+            ValueError: If any target value isn't a class.
+        """
+
+        if self._class_lookup is None or self._class_lookup[0] is not self.classes_to_index:
+            class_values = {int(class_): index for class_, index in self.classes_to_index.items() if not isinstance(class_, str)}
+            offset = min(class_values, default=0)
+            lookup = torch.full((max(class_values, default=offset) - offset + 1,), -1, dtype=torch.long)
+            for class_value, index in class_values.items():
+                lookup[class_value - offset] = index
+            self._class_lookup = (self.classes_to_index, offset, lookup)
+
+        _, offset, lookup = self._class_lookup
+        if lookup.device != target.device:
+            lookup = lookup.to(target.device)
+            self._class_lookup = (self.classes_to_index, offset, lookup)
+
+        positions = target.reshape(-1).long() - offset
+        class_indices = lookup[positions.clamp(0, lookup.shape[0] - 1)]
+        is_class = (positions >= 0) & (positions < lookup.shape[0]) & (class_indices >= 0)
+        if not bool(torch.all(is_class)):
+            unknown_values = target.reshape(-1)[~is_class].unique().tolist()
+            raise ValueError(f"Target values {unknown_values} are not in the classes {list(self.classes_to_index)}")
+
+        return class_indices
+
     def test(
         self,
         batch_size: int = 32,
-        num_workers: int = 0):
+        num_workers: int = 0,
+        max_batch_nodes: Optional[int] = None,
+        max_batch_edges: Optional[int] = None):
         """
         Performs the testing of the model.
 
@@ -840,18 +1289,19 @@ class Trainer():
                         Defaults to 32.
             num_workers (int, optional): How many subprocesses to use for data loading. 0 means that the data will be loaded in the main process.
                         Defaults to 0.
+            max_batch_nodes (Optional[int], optional): If set, batches are formed under this budget of nodes, see :meth:`train`.
+                        Defaults to None.
+            max_batch_edges (Optional[int], optional): If set, batches are formed under this budget of edges, see :meth:`train`.
+                        Defaults to None.
         """
         self.batch_size_test = batch_size
 
         if self.dataset_test is not None:
             _log.info("Loading independent testing dataset...")
 
-            self.test_loader = DataLoader(
-                self.dataset_test,
-                batch_size=self.batch_size_test,
-                num_workers=num_workers,
-                pin_memory=self.cuda
-            )
+            # in a distributed run, every process tests on its own shard
+            self.test_loader = self._create_loader(
+                self.dataset_test, self.batch_size_test, False, num_workers, max_batch_nodes, max_batch_edges, is_distributed())
             _log.info("Testing set loaded\n")
         else:
             _log.error("No test dataset provided.")
@@ -867,7 +1317,8 @@ class Trainer():
         Loads the parameters of a pretrained model
         """
 
-        state = torch.load(self.pretrained_model_path)
+        # the model, written by save_model, holds the optimizer class and loss function
+        state = torch.load(self.pretrained_model_path, weights_only=False)
 
         self.target = state["target"]
         self.batch_size_train = state["batch_size_train"]
@@ -881,7 +1332,9 @@ class Trainer():
         self.task = state["task"]
         self.classes = state["classes"]
         self.shuffle = state["shuffle"]
-        self.optimizer = state["optimizer"]
+        # the optimizer is created again for the model; earlier versions saved the optimizer itself, rather than its class
+        optimizer = state["optimizer"]
+        self._optimizer_class = optimizer if isinstance(optimizer, type) else type(optimizer)
         self.opt_loaded_state_dict = state["optimizer_state"]
         self.lossfunction = state["lossfunction"]
         self.model_load_state_dict = state["model_state"]
@@ -892,16 +1345,53 @@ class Trainer():
         self.cuda = state["cuda"]
         self.ngpu = state["ngpu"]
 
-    def save_model(self, filename='model.pth.tar'):
+    def save_model(self, filename='model.pth.tar', scripted_filename: Optional[str] = None):
         """
         Saves the model to a file.
 
+        The file is written under a temporary name first, so that an interrupted save leaves no truncated file.
+        In a distributed run, only the process with rank 0 saves it.
+
         Args:
             filename (str, optional): Name of the file. Defaults to 'model.pth.tar'.
+            scripted_filename (Optional[str], optional): If set, the model is also compiled with TorchScript, for inference, and saved
+                to this file. The file can be loaded with `torch.jit.load` without deeprankcore, see `deeprankcore.utils.scripting`.
+                For the graph neural networks in `deeprankcore.neuralnets.gnn`, or others with a forward_tensors method.
+                Defaults to None.
         """
-        state = {
+        if not is_main_process():
+            return
+
+        save_checkpoint(self._get_state(), filename)
+
+        if scripted_filename is not None:
+            torch.jit.save(script_model(self.model, self.task == targets.CLASSIF), scripted_filename)
+
+    def _write_model(
+        self,
+        checkpoint_writer: CheckpointWriter,
+        filename: str,
+        training_state: Optional[dict] = None,
+        rotate: bool = False,
+    ):
+        "snapshots the model, with the training state of a checkpoint, to be written by the checkpoint writer"
+
+        if not is_main_process():
+            return
+
+        state = self._get_state()
+        if training_state is not None:
+            state["training_state"] = training_state
+
+        checkpoint_writer.write(state, filename, rotate)
+
+    def _get_state(self) -> dict:
+        "the model and its settings, as saved by :meth:`save_model`"
+
+        return {
             "model_state": self.model.state_dict(),
-            "optimizer": self.optimizer,
+            # the class only, the optimizer holds the model's parameters
+            "optimizer": type(self.optimizer),
             "optimizer_state": self.optimizer.state_dict(),
             "lossfunction": self.lossfunction,
             "target": self.target,
@@ -924,20 +1414,142 @@ class Trainer():
             "ngpu": self.ngpu
         }
 
-        torch.save(state, filename)
 
+_EXPORT_CHUNK_SIZE = 4096
+
+
+class _OutputChunks:
+    """Gathers the outputs and targets of batches in buffers on the device, and hands them over in chunks of about
+    _EXPORT_CHUNK_SIZE entries, each copied to the cpu at once.
+
+    This bounds the memory taken by the outputs of a pass, whatever the size of the dataset. In a distributed run, the chunks
+    of all processes are gathered and put in sampling order, and every process hands over the same chunks.
+    """
+
+    def __init__(
+        self,
+        process_chunk: Callable[[List[str], torch.Tensor, Optional[torch.Tensor]], None],
+        loader: DataLoader,
+    ):
+        self._process_chunk = process_chunk
+
+        self._entry_names = []
+        self._outputs = None
+        self._targets = None
+        self._count = 0
+
+        # the entries of the dataset that are still to come, to drop the padding of the distributed shards
+        self._distributed = isinstance(loader.sampler, DistributedSampler)
+        self._remaining_count = len(loader.dataset)
+
+    def add(self, entry_names: List[str], outputs: torch.Tensor, targets: Optional[torch.Tensor]):
+        "adds the outputs and targets (None if the data has none) of a batch"
+
+        batch_size = outputs.shape[0]
+        if self._count > 0 and self._count + batch_size > _EXPORT_CHUNK_SIZE:
+            self.flush()
+
+        self._outputs = _reserve(self._outputs, self._count + batch_size, _EXPORT_CHUNK_SIZE, outputs)
+        self._outputs[self._count:self._count + batch_size] = outputs
+        if targets is not None:
+            self._targets = _reserve(self._targets, self._count + batch_size, _EXPORT_CHUNK_SIZE, targets)
+            self._targets[self._count:self._count + batch_size] = targets
+
+        self._entry_names += entry_names
+        self._count += batch_size
 
-def _divide_dataset(dataset: Union[GraphDataset, GridDataset], splitsize: Optional[Union[float, int]] = None) -> \
-        Union[Tuple[GraphDataset, GraphDataset], Tuple[GridDataset, GridDataset]]:
+    def flush(self):
+        "hands over the gathered outputs and targets"
+
+        if self._count == 0:
+            return
+
+        entry_names = self._entry_names
+        outputs = self._outputs[:self._count].to("cpu", copy=True)
+        targets = None if self._targets is None else self._targets[:self._count].to("cpu", copy=True)
+
+        self._entry_names = []
+        self._count = 0
+
+        if self._distributed:
+            shards = gather_objects((entry_names, outputs, targets))
+            entry_names = merge_shards([shard[0] for shard in shards], self._remaining_count)
+            outputs = torch.stack(merge_shards([list(shard[1]) for shard in shards], self._remaining_count))
+            if targets is not None:
+                targets = torch.stack(merge_shards([list(shard[2]) for shard in shards], self._remaining_count))
+
+        self._remaining_count -= len(entry_names)
+
+        self._process_chunk(entry_names, outputs, targets)
+
+
+class _ShardPadding:
+    """Counts the entries of the batches of a loader that aren't padding.
+
+    In a distributed run, the sampler pads the shards of some processes with a repeated entry at their end. Like the
+    exports (see :class:`_OutputChunks`), the losses leave it out.
+    """
+
+    def __init__(self, loader: DataLoader):
+        self._unpadded_count = None
+        if isinstance(loader.sampler, DistributedSampler):
+            self._unpadded_count = len(loader.sampler) - get_padding_count(loader.sampler)
+
+    def take(self, batch_size: int) -> int:
+        "the number of entries of the next batch that aren't padding"
+
+        if self._unpadded_count is None:
+            return batch_size
+
+        kept_count = min(batch_size, self._unpadded_count)
+        self._unpadded_count -= kept_count
+        return kept_count
+
+
+def _reserve(buffer: Optional[torch.Tensor], size: int, capacity: int, like: torch.Tensor) -> torch.Tensor:
+    """Makes sure that a buffer of rows like a batch has room for size rows.
+
+    It's allocated for capacity rows at first, and doubled when more are needed.
+    """
+
+    if buffer is None:
+        return torch.empty((max(capacity, size),) + like.shape[1:], dtype=like.dtype, device=like.device)
+
+    if size > buffer.shape[0]:
+        grown_buffer = torch.empty((max(2 * buffer.shape[0], size),) + buffer.shape[1:], dtype=buffer.dtype, device=buffer.device)
+        grown_buffer[:buffer.shape[0]] = buffer
+        return grown_buffer
+
+    return buffer
+
+
+def _divide_dataset(
+    dataset: Union[GraphDataset, GridDataset],
+    splitsize: Optional[Union[float, int]] = None,
+    stratify: bool = False,
+    group_by: Optional[Callable[[str], Hashable]] = None,
+) -> Union[Tuple[GraphDataset, GraphDataset], Tuple[GridDataset, GridDataset]]:
 
     """Divides the dataset into a training set and an evaluation set
 
+    Both sets are views on the dataset's entries (see :meth:`deeprankcore.dataset.DeeprankDataset.select_entries`).
+
     Args:
         dataset (Union[:class:`GraphDataset`, :class:`GridDataset`]): Input dataset to be split into training and validation data.
         splitsize (Optional[Union[float, int]], optional): Fraction of dataset (if float) or number of datapoints (if int) to use for validation. 
             Defaults to None.
+        stratify (bool, optional): Keep the proportions of the classes, taken from the catalogues, in both sets. For classification
+            only. Defaults to False.
+        group_by (Optional[Callable[[str], Hashable]], optional): Maps an entry name to its group, which is kept together in one set.
+            Defaults to None.
+
+    Raises:
+        ValueError: If stratify is set for a regression, where every target value would be a stratum of its own.
     """
 
+    if stratify and dataset.task != targets.CLASSIF:
+        raise ValueError(f"stratify requires a classification task, the dataset's task is {dataset.task}")
+
     if splitsize is None:
         splitsize = 0.25
     full_size = len(dataset)
@@ -959,13 +1571,11 @@ def _divide_dataset(dataset: Union[GraphDataset, GridDataset], splitsize: Option
         dataset_main = dataset
         dataset_split = None
     else:
-        indices = np.arange(full_size)
-        np.random.shuffle(indices)
-
-        dataset_main = copy.deepcopy(dataset)
-        dataset_main.index_entries = [dataset.index_entries[i] for i in indices[n_split:]]
+        labels = dataset.get_target_values() if stratify else None
+        groups = [group_by(entry_name) for _, entry_name in dataset.index_entries] if group_by is not None else None
+        main_indices, split_off_indices = split_indices(full_size, n_split, labels, groups)
 
-        dataset_split = copy.deepcopy(dataset)
-        dataset_split.index_entries = [dataset.index_entries[i] for i in indices[:n_split]]
+        dataset_main = dataset.select_entries(main_indices)
+        dataset_split = dataset.select_entries(split_off_indices)
 
     return dataset_main, dataset_split
@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+from typing import Callable
+
+_log = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    def __init__(self, max_pending: int = 2, name: str = "background-worker"):
+        """
+        Runs tasks, in the order they are submitted, in a background thread.
+
+        Use it as a context manager, which waits for the pending tasks on exit. An error in a task is raised again
+        by the next call to :meth:`submit`, :meth:`flush` or :meth:`close`.
+
+        Args:
+            max_pending (int, optional): How many tasks can wait to be run, before :meth:`submit` waits for
+                the thread to catch up. This bounds the memory taken by the tasks' arguments. Defaults to 2.
+            name (str, optional): Name of the thread, used in error messages. Defaults to "background-worker".
+        """
+
+        if max_pending < 1:
+            raise ValueError(f"max_pending must be at least 1, got {max_pending}")
+
+        self.name = name
+
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+
+                function, args = task
+                if self._error is None:
+                    function(*args)
+
+            except Exception as error: # pylint: disable=broad-except
+                _log.exception(f"task of {self.name} failed")
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise RuntimeError(f"A task of {self.name} failed") from error
+
+    def submit(self, function: Callable, *args):
+        """Queues a task.
+
+        After a task failed, the tasks that were already queued are skipped.
+
+        Args:
+            function (Callable): The task.
+            *args: The task's arguments.
+        """
+
+        if self._thread is None:
+            raise RuntimeError(f"{self.name} is not started, use it in a with statement")
+
+        self._raise_error()
+        self._queue.put((function, args))
+
+    def flush(self):
+        "waits until all queued tasks are run"
+
+        if self._thread is not None:
+            self._queue.join()
+
+        self._raise_error()
+
+    def close(self):
+        "runs the queued tasks and stops the thread"
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+        self._raise_error()
@@ -0,0 +1,164 @@
+import logging
+from typing import Iterator, List, Optional
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+_log = logging.getLogger(__name__)
+
+
+class SizeBatchSampler(Sampler):
+    def __init__( # pylint: disable=too-many-arguments
+        self,
+        node_counts: np.ndarray,
+        edge_counts: Optional[np.ndarray] = None,
+        max_nodes: Optional[int] = None,
+        max_edges: Optional[int] = None,
+        max_batch_size: Optional[int] = None,
+        shuffle: bool = False,
+        bucket_size: int = 1024,
+        seed: Optional[int] = None,
+    ):
+        """
+        Forms batches of entries under a budget of nodes and/or edges, instead of a fixed number of entries.
+
+        The entries are bucketed by size: each bucket of bucket_size consecutive (optionally shuffled) entries is
+        sorted by size before it's cut into batches, so that a batch holds entries of similar sizes. An entry that
+        exceeds the budget on its own gets a batch of its own.
+
+        Pass it to a DataLoader as batch_sampler.
+
+        Args:
+            node_counts (np.ndarray): Number of nodes of every entry, in dataset index order.
+            edge_counts (Optional[np.ndarray], optional): Number of edges of every entry. Required with max_edges.
+                Defaults to None.
+            max_nodes (Optional[int], optional): Maximum number of nodes in a batch. Defaults to None (no maximum).
+            max_edges (Optional[int], optional): Maximum number of edges in a batch. Defaults to None (no maximum).
+            max_batch_size (Optional[int], optional): Maximum number of entries in a batch. Defaults to None (no maximum).
+            shuffle (bool, optional): Whether to shuffle the entries, and the order of the batches, every epoch.
+                Defaults to False.
+            bucket_size (int, optional): Number of entries sorted by size together. Larger buckets give batches of more
+                similar sizes, smaller buckets mix the entries more. Defaults to 1024.
+            seed (Optional[int], optional): Seed of the shuffling. Defaults to None, which draws it from torch's
+                random number generator, like the DataLoader's own shuffling.
+        """
+
+        if max_nodes is None and max_edges is None and max_batch_size is None:
+            raise ValueError("Set at least one of max_nodes, max_edges and max_batch_size")
+
+        for name, value in (("max_nodes", max_nodes), ("max_edges", max_edges),
+                            ("max_batch_size", max_batch_size), ("bucket_size", bucket_size)):
+            if value is not None and value < 1:
+                raise ValueError(f"{name} must be at least 1, got {value}")
+
+        if max_edges is not None and edge_counts is None:
+            raise ValueError("max_edges requires edge_counts")
+
+        self.node_counts = np.asarray(node_counts, dtype=np.int64)
+        self.edge_counts = None if edge_counts is None else np.asarray(edge_counts, dtype=np.int64)
+        if self.edge_counts is not None and len(self.edge_counts) != len(self.node_counts):
+            raise ValueError(f"Got {len(self.node_counts)} node counts, but {len(self.edge_counts)} edge counts")
+
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.max_batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        self.seed = seed
+
+        self._epoch = 0
+        self._next_batches = None
+
+    @classmethod
+    def from_dataset(cls, dataset, **kwargs) -> "SizeBatchSampler":
+        """Creates a sampler for a dataset, with the node and edge counts from its .HDF5 files' catalogues.
+
+        Args:
+            dataset (:class:`deeprankcore.dataset.DeeprankDataset`): The dataset.
+            **kwargs: The other arguments of :class:`SizeBatchSampler`.
+        """
+
+        node_counts, edge_counts = dataset.get_entry_sizes()
+        return cls(node_counts, edge_counts, **kwargs)
+
+    def _get_sort_sizes(self) -> np.ndarray:
+        "the size to sort the entries on: that of the tightest budget"
+
+        if self.max_edges is not None and (self.max_nodes is None or
+                                           self.edge_counts.sum() / self.max_edges > self.node_counts.sum() / self.max_nodes):
+            return self.edge_counts
+        return self.node_counts
+
+    def _fits(self, batch_nodes: int, batch_edges: int, batch_size: int) -> bool:
+        return ((self.max_nodes is None or batch_nodes <= self.max_nodes) and
+                (self.max_edges is None or batch_edges <= self.max_edges) and
+                (self.max_batch_size is None or batch_size <= self.max_batch_size))
+
+    def _create_batches(self) -> List[List[int]]:
+        "forms the batches of one epoch"
+
+        if self.shuffle:
+            seed = self.seed + self._epoch if self.seed is not None else int(torch.empty((), dtype=torch.int64).random_().item())
+            generator = np.random.default_rng(seed)
+            indices = generator.permutation(len(self.node_counts))
+        else:
+            generator = None
+            indices = np.arange(len(self.node_counts))
+
+        sort_sizes = self._get_sort_sizes()
+        edge_counts = self.edge_counts if self.edge_counts is not None else np.zeros_like(self.node_counts)
+
+        batches = []
+        oversized_count = 0
+        for bucket_start in range(0, len(indices), self.bucket_size):
+            bucket = indices[bucket_start:bucket_start + self.bucket_size]
+            bucket = bucket[np.argsort(sort_sizes[bucket], kind="stable")]
+
+            batch = []
+            batch_nodes = 0
+            batch_edges = 0
+            for index in bucket.tolist():
+                nodes = self.node_counts[index]
+                edges = edge_counts[index]
+
+                if len(batch) > 0 and not self._fits(batch_nodes + nodes, batch_edges + edges, len(batch) + 1):
+                    batches.append(batch)
+                    batch = []
+                    batch_nodes = 0
+                    batch_edges = 0
+
+                if not self._fits(nodes, edges, 1):
+                    oversized_count += 1
+
+                batch.append(index)
+                batch_nodes += nodes
+                batch_edges += edges
+
+            if len(batch) > 0:
+                batches.append(batch)
+
+        if oversized_count > 0:
+            _log.warning(f"{oversized_count} entries exceed the batch budget on their own, they are batched alone")
+
+        if generator is not None:
+            batches = [batches[i] for i in generator.permutation(len(batches))]
+
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        if self._next_batches is None:
+            self._next_batches = self._create_batches()
+
+        batches = self._next_batches
+        self._next_batches = None
+        self._epoch += 1
+
+        return iter(batches)
+
+    def __len__(self) -> int:
+        # the batches depend on the shuffling, so form the next epoch's batches already to count them
+        if self._next_batches is None:
+            self._next_batches = self._create_batches()
+
+        return len(self._next_batches)
@@ -0,0 +1,317 @@
+"""Catalogues of the entries in .HDF5 files, so that datasets can be indexed without traversing the files.
+
+A catalogue holds, per entry, its name, target values and node and edge counts, and the feature schema of the file.
+It's stored in a sidecar file, next to the .HDF5 file, written at preprocessing time, and rebuilt when the .HDF5 file
+has changed since. Sidecar files are written in the directory named by the DEEPRANKCORE_SIDECAR_DIR environment
+variable instead, when it's set, e.g. for .HDF5 files in a read-only directory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import h5py
+import numpy as np
+
+from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import gridstorage
+from deeprankcore.domain import nodestorage as Nfeat
+from deeprankcore.domain import targetstorage as targets
+
+_log = logging.getLogger(__name__)
+
+
+CATALOGUE_FILE_SUFFIX = ".catalogue.npz"
+
+# catalogues of another version are rebuilt
+CATALOGUE_VERSION = 2
+
+SIDECAR_DIRECTORY_VARIABLE = "DEEPRANKCORE_SIDECAR_DIR"
+
+
+def get_sidecar_path(hdf5_path: str, suffix: str) -> str:
+    """Gets the path of a sidecar file of an .HDF5 file, like its catalogue.
+
+    It's the .HDF5 file's path followed by the suffix, or, when the DEEPRANKCORE_SIDECAR_DIR environment variable is set,
+    a file in that directory named after the .HDF5 file and a hash of its path.
+
+    Args:
+        hdf5_path (str): The .HDF5 file.
+        suffix (str): The sidecar's suffix, e.g. ".catalogue.npz".
+
+    Returns:
+        str: The sidecar's path.
+    """
+
+    sidecar_directory = os.environ.get(SIDECAR_DIRECTORY_VARIABLE)
+    if not sidecar_directory:
+        return hdf5_path + suffix
+
+    real_path = os.path.realpath(hdf5_path)
+    path_hash = hashlib.sha1(real_path.encode("utf-8")).hexdigest()[:16]
+    os.makedirs(sidecar_directory, exist_ok=True)
+    return os.path.join(sidecar_directory, f"{os.path.basename(real_path)}.{path_hash}{suffix}")
+
+
+def _get_file_signature(hdf5_path: str) -> np.ndarray:
+    file_stat = os.stat(hdf5_path)
+    return np.array([file_stat.st_size, file_stat.st_mtime], dtype=np.float64)
+
+
+def _get_entry_schema(entry_group: h5py.Group) -> Dict[str, Dict[str, List[int]]]:
+    schema = {}
+    for group_name in (Nfeat.NODE, Efeat.EDGE):
+        if group_name in entry_group:
+            schema[group_name] = {feature_name: list(feature_node.shape[1:])
+                                  for feature_name, feature_node in entry_group[group_name].items()
+                                  if isinstance(feature_node, h5py.Dataset)}
+
+    if gridstorage.MAPPED_FEATURES in entry_group:
+        # sparse features are groups, that keep the grid shape in an attribute
+        schema[gridstorage.MAPPED_FEATURES] = {
+            feature_name: [int(size) for size in (feature_node.shape if isinstance(feature_node, h5py.Dataset)
+                                                  else feature_node.attrs[gridstorage.SPARSE_SHAPE])]
+            for feature_name, feature_node in entry_group[gridstorage.MAPPED_FEATURES].items()}
+
+    return schema
+
+
+class EntryCatalogue:
+    def __init__( # pylint: disable=too-many-arguments
+        self,
+        entry_names: List[str],
+        target_names: List[str],
+        target_values: np.ndarray,
+        node_counts: np.ndarray,
+        edge_counts: np.ndarray,
+        schema: Dict[str, Dict[str, List[int]]],
+    ):
+        """
+        The entries of one .HDF5 file.
+
+        Args:
+            entry_names (List[str]): Names of the entries, in file order.
+            target_names (List[str]): Names of the targets found in any entry.
+            target_values (np.ndarray): Target values, of shape (entries, targets), NaN where an entry lacks the target.
+            node_counts (np.ndarray): Number of nodes per entry.
+            edge_counts (np.ndarray): Number of edges per entry, in one direction.
+            schema (Dict[str, Dict[str, List[int]]]): Per group of the first entry, the shape of each feature,
+                without the node or edge dimension. Mapped grid features have the shape of the grid.
+        """
+
+        self.entry_names = entry_names
+        self.target_names = target_names
+        self.target_values = target_values
+        self.node_counts = node_counts
+        self.edge_counts = edge_counts
+        self.schema = schema
+
+    def __len__(self) -> int:
+        return len(self.entry_names)
+
+    def get_target_column(self, target_name: str) -> np.ndarray:
+        """Gets the values of one target for all entries, NaN where an entry lacks it."""
+
+        if target_name not in self.target_names:
+            return np.full(len(self.entry_names), np.nan)
+
+        return self.target_values[:, self.target_names.index(target_name)]
+
+    @classmethod
+    def build(cls, hdf5_path: str) -> "EntryCatalogue":
+        """Builds the catalogue by traversing the .HDF5 file."""
+
+        entry_names = []
+        target_names = []
+        entry_targets = []
+        node_counts = []
+        edge_counts = []
+        schema = {}
+
+        with h5py.File(hdf5_path, 'r') as hdf5_file:
+            for entry_name, entry_group in hdf5_file.items():
+                entry_names.append(entry_name)
+
+                node_counts.append(entry_group[f"{Nfeat.NODE}/{Nfeat.POSITION}"].shape[0]
+                                   if f"{Nfeat.NODE}/{Nfeat.POSITION}" in entry_group else 0)
+                edge_counts.append(entry_group[f"{Efeat.EDGE}/{Efeat.INDEX}"].shape[0]
+                                   if f"{Efeat.EDGE}/{Efeat.INDEX}" in entry_group else 0)
+
+                values = {}
+                if targets.VALUES in entry_group:
+                    for target_name, target_node in entry_group[targets.VALUES].items():
+                        if target_name not in target_names:
+                            target_names.append(target_name)
+                        values[target_name] = target_node[()]
+                entry_targets.append(values)
+
+                if len(schema) == 0:
+                    schema = _get_entry_schema(entry_group)
+
+        target_values = np.full((len(entry_names), len(target_names)), np.nan)
+        for entry_index, values in enumerate(entry_targets):
+            for target_name, value in values.items():
+                try:
+                    target_values[entry_index, target_names.index(target_name)] = value
+                except (TypeError, ValueError):
+                    pass  # not a number
+
+        return cls(entry_names, target_names, target_values,
+                   np.array(node_counts, dtype=np.int64), np.array(edge_counts, dtype=np.int64), schema)
+
+    @classmethod
+    def load(cls, hdf5_path: str) -> Optional["EntryCatalogue"]:
+        """Loads the catalogue from its sidecar file.
+
+        Returns:
+            Optional[:class:`EntryCatalogue`]: The catalogue, or None if there's none or the .HDF5 file has changed since.
+        """
+
+        catalogue_path = get_sidecar_path(hdf5_path, CATALOGUE_FILE_SUFFIX)
+        if not os.path.isfile(catalogue_path):
+            return None
+
+        try:
+            with np.load(catalogue_path) as catalogue_file:
+                if "version" not in catalogue_file.files or catalogue_file["version"] != CATALOGUE_VERSION:
+                    return None
+
+                if not np.array_equal(catalogue_file["signature"], _get_file_signature(hdf5_path)):
+                    return None
+
+                return cls(catalogue_file["entry_names"].tolist(),
+                           catalogue_file["target_names"].tolist(),
+                           catalogue_file["target_values"],
+                           catalogue_file["node_counts"],
+                           catalogue_file["edge_counts"],
+                           json.loads(str(catalogue_file["schema"])))
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # e.g. a sidecar that another process is writing, which is then built again
+            _log.warning(f"ignoring unreadable catalogue {catalogue_path}")
+            return None
+
+    def save(self, hdf5_path: str):
+        """Saves the catalogue in its sidecar file, next to the .HDF5 file it was built from."""
+
+        catalogue_path = get_sidecar_path(hdf5_path, CATALOGUE_FILE_SUFFIX)
+
+        # written to a temporary file that replaces the sidecar at once, so that other processes building the same
+        # dataset never read a partly written sidecar
+        temporary_path = os.path.join(os.path.dirname(os.path.abspath(catalogue_path)),
+                                      f".{os.path.basename(catalogue_path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            # np.savez would add .npz to a name without it, so write to an open file
+            with open(temporary_path, 'wb') as catalogue_file:
+                np.savez(catalogue_file,
+                         version=CATALOGUE_VERSION,
+                         signature=_get_file_signature(hdf5_path),
+                         entry_names=np.array(self.entry_names, dtype=str),
+                         target_names=np.array(self.target_names, dtype=str),
+                         target_values=self.target_values,
+                         node_counts=self.node_counts,
+                         edge_counts=self.edge_counts,
+                         schema=np.array(json.dumps(self.schema)))
+            os.replace(temporary_path, catalogue_path)
+        except OSError:
+            _log.warning(f"could not write catalogue {catalogue_path}")
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+
+def get_catalogue(hdf5_path: str) -> EntryCatalogue:
+    """Gets the catalogue of an .HDF5 file, building and saving it if it's missing or outdated.
+
+    Args:
+        hdf5_path (str): The .HDF5 file.
+
+    Returns:
+        :class:`EntryCatalogue`: Its catalogue.
+    """
+
+    catalogue = EntryCatalogue.load(hdf5_path)
+    if catalogue is None:
+        catalogue = EntryCatalogue.build(hdf5_path)
+        catalogue.save(hdf5_path)
+
+    return catalogue
+
+
+def write_catalogue(hdf5_path: str):
+    """Builds the catalogue of an .HDF5 file and saves it next to the file.
+
+    Args:
+        hdf5_path (str): The .HDF5 file.
+    """
+
+    EntryCatalogue.build(hdf5_path).save(hdf5_path)
+
+
+def get_entry_names(hdf5_path: str) -> List[str]:
+    "the names of the entries of an .HDF5 file, in file order, without reading them"
+
+    with h5py.File(hdf5_path, 'r') as hdf5_file:
+        return list(hdf5_file.keys())
+
+
+@contextmanager
+def keep_catalogue(hdf5_path: str) -> Iterator[None]:
+    """Keeps the catalogue of an .HDF5 file valid across writes that don't change what it records, like the clusters.
+
+    An up-to-date catalogue is saved again after the writes, for the file's new signature, instead of being rebuilt
+    by traversing the file. If the writes added or removed entries, it's rebuilt right away.
+
+    Args:
+        hdf5_path (str): The .HDF5 file, that's written to in the with block.
+    """
+
+    catalogue = EntryCatalogue.load(hdf5_path)
+
+    yield
+
+    if catalogue is None:
+        return
+
+    if get_entry_names(hdf5_path) == catalogue.entry_names:
+        catalogue.save(hdf5_path)
+    else:
+        write_catalogue(hdf5_path)
+
+
+def get_catalogues(hdf5_paths: List[str], max_workers: Optional[int] = None) -> List[Optional[EntryCatalogue]]:
+    """Gets the catalogues of several .HDF5 files at once, with a pool of threads.
+
+    Reading the sidecar files and checking the .HDF5 files' signatures is mostly waiting on the file system, which
+    the threads do concurrently. Building missing catalogues gains less, since h5py handles one call at a time.
+
+    Args:
+        hdf5_paths (List[str]): The .HDF5 files.
+        max_workers (Optional[int], optional): Number of threads. Defaults to None, which takes the thread pool's default.
+
+    Returns:
+        List[Optional[:class:`EntryCatalogue`]]: The catalogue of each file, or None for files that can't be opened.
+    """
+
+    def get_or_none(hdf5_path: str) -> Optional[EntryCatalogue]:
+        # only a file that can't be opened is taken for corrupted; a sidecar that can't be read or written is built
+        # again, or kept in memory only, by get_catalogue
+        try:
+            with h5py.File(hdf5_path, 'r'):
+                pass
+        except OSError:
+            _log.exception(f"cannot open {hdf5_path}")
+            return None
+
+        return get_catalogue(hdf5_path)
+
+    if len(hdf5_paths) <= 1:
+        return [get_or_none(hdf5_path) for hdf5_path in hdf5_paths]
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(get_or_none, hdf5_paths))
@@ -0,0 +1,113 @@
+"""Checkpoints that are written atomically, optionally by a background thread.
+
+A checkpoint is first written to a temporary file next to its destination, and then renamed to it, so that an
+interrupted write never leaves a truncated checkpoint behind.
+"""
+
+import copy
+import os
+from collections import deque
+from typing import Any, Optional
+
+import torch
+
+from deeprankcore.utils.backgroundworker import BackgroundWorker
+
+
+def snapshot_state(state: Any) -> Any:
+    """Copies a state, to be saved later, with its tensors on the cpu.
+
+    The copy doesn't change when training goes on, so it can be written while the next batches are being trained on.
+
+    Args:
+        state (Any): Tensors, possibly in dictionaries, lists and tuples, e.g. state_dicts, and other (deep-copyable)
+            objects that don't hold the model's parameters.
+
+    Returns:
+        Any: The copy.
+
+    Raises:
+        TypeError: For an optimizer, which would be copied with the parameters it holds; snapshot its state_dict.
+    """
+
+    if isinstance(state, torch.optim.Optimizer):
+        raise TypeError("Can't snapshot an optimizer, snapshot its state_dict instead")
+
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+
+    if isinstance(state, dict):
+        return {key: snapshot_state(value) for key, value in state.items()}
+
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot_state(value) for value in state)
+
+    return copy.deepcopy(state)
+
+
+def save_checkpoint(state: Any, path: str):
+    """Saves a state with `torch.save`, atomically.
+
+    Args:
+        state (Any): The state to save.
+        path (str): The file to save it to.
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    temporary_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        torch.save(state, temporary_path)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class CheckpointWriter(BackgroundWorker):
+    def __init__(self, keep_last: Optional[int] = None, max_pending: int = 2):
+        """
+        Writes checkpoints in a background thread.
+
+        Use it as a context manager, which waits for the pending checkpoints on exit.
+
+        Args:
+            keep_last (Optional[int], optional): How many rotating checkpoints to keep, the older ones are removed.
+                Defaults to None (keep all).
+            max_pending (int, optional): How many checkpoints can wait to be written, before :meth:`write` waits for
+                the thread to catch up. This bounds the memory taken by snapshots. Defaults to 2.
+        """
+
+        if keep_last is not None and keep_last < 1:
+            raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+
+        super().__init__(max_pending, name="checkpoint-writer")
+        self.keep_last = keep_last
+
+        self._rotating_paths = deque()
+
+    def _write(self, state: Any, path: str, rotate: bool):
+
+        save_checkpoint(state, path)
+
+        if rotate:
+            if path in self._rotating_paths:
+                self._rotating_paths.remove(path)
+            self._rotating_paths.append(path)
+            while self.keep_last is not None and len(self._rotating_paths) > self.keep_last:
+                old_path = self._rotating_paths.popleft()
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+    def write(self, state: Any, path: str, rotate: bool = False):
+        """Snapshots a state and queues it to be written.
+
+        Args:
+            state (Any): The state, as for :func:`snapshot_state`.
+            path (str): The file to write it to.
+            rotate (bool, optional): Whether it's a rotating checkpoint, of which only the last keep_last are kept.
+                Defaults to False.
+        """
+
+        self.submit(self._write, snapshot_state(state), path, rotate)
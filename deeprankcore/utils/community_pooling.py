@@ -1,15 +1,27 @@
+import logging
 import warnings
+from contextlib import ExitStack
+from typing import Tuple
 
 import community
+import h5py
 import markov_clustering as mc
 import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 import torch
+from torch import Tensor
 from torch_geometric.data import Batch, Data
 from torch_geometric.nn.pool.consecutive import consecutive_cluster
 from torch_geometric.nn.pool.pool import pool_batch, pool_edge
-from torch_scatter import scatter_max, scatter_mean
+from torch_scatter import scatter_max, scatter_mean, scatter_sum
+from tqdm import tqdm
+
+from deeprankcore.utils.catalogue import keep_catalogue
+from deeprankcore.utils.featurestats import keep_cached_stats
+from deeprankcore.utils.hdf5files import close_hdf5_file
+
+_log = logging.getLogger(__name__)
 
 
 def plot_graph(graph, cluster):
@@ -19,12 +31,70 @@ def plot_graph(graph, cluster):
     plt.show()
 
 
-def get_preloaded_cluster(cluster, batch):
+def get_preloaded_cluster(cluster: Tensor, batch: Tensor) -> Tensor:
+    """Numbers the clusters of the graphs of a batch consecutively, from the clusters numbered per graph.
+
+    The clusters of each graph are offset by the number of clusters of the graphs before it. The cluster tensor is
+    left unchanged, so that a batch can be run through a model more than once.
+
+    Args:
+        cluster (Tensor): Cluster of every node, numbered per graph.
+        batch (Tensor): Graph of every node.
+
+    Returns:
+        Tensor: Cluster of every node, numbered over the batch.
+    """
+
+    graph_count = int(batch.max()) + 1
+    cluster_counts = torch.zeros(graph_count, dtype=cluster.dtype, device=cluster.device).scatter_reduce(
+        0, batch, cluster, reduce="amax", include_self=False) + 1
+    offsets = torch.cumsum(cluster_counts, dim=0) - cluster_counts
+
+    return cluster + offsets[batch]
+
+
+def pool_clusters(
+    cluster: Tensor,
+    x: Tensor,
+    edge_index: Tensor,
+    edge_attr: Tensor,
+    batch: Tensor,
+) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+    """Pools the nodes and edges of every cluster, like :func:`community_pooling`, on tensors.
+
+    Every cluster becomes a node with the maximum of its members' features. The edges between clusters are summed,
+    and edges within a cluster are dropped. Unlike :func:`community_pooling`, it can be compiled with TorchScript and
+    traced by torch.compile.
+
+    Args:
+        cluster (Tensor): Cluster of every node, numbered over the batch.
+        x (Tensor): Node features.
+        edge_index (Tensor): Edges, of shape (2, number of edges).
+        edge_attr (Tensor): Edge features.
+        batch (Tensor): Graph of every node.
+
+    Returns:
+        Tuple[Tensor, Tensor, Tensor, Tensor]: The node features, edges, edge features and graph of every node
+            of the pooled graphs.
+    """
+
+    cluster, perm = consecutive_cluster(cluster)
+    cluster_count = cluster.size(0)
+
+    pooled_x = torch.empty((int(cluster.max()) + 1, x.size(1)), dtype=x.dtype, device=x.device)
+    x = pooled_x.scatter_reduce(0, cluster.unsqueeze(1).expand_as(x), x, reduce="amax", include_self=False)
+
+    edge_index = cluster[edge_index.reshape(-1)].reshape(2, -1)
+    between_clusters = edge_index[0] != edge_index[1]
+    edge_index = edge_index[:, between_clusters]
+    edge_attr = edge_attr[between_clusters]
+
+    # merge the edges between the same clusters, sorted by row
+    edge_keys, edge_inverse = torch.unique(edge_index[0] * cluster_count + edge_index[1], sorted=True, return_inverse=True)
+    edge_attr = scatter_sum(edge_attr, edge_inverse, dim=0, dim_size=edge_keys.size(0))
+    edge_index = torch.stack([torch.div(edge_keys, cluster_count, rounding_mode="floor"), edge_keys % cluster_count])
 
-    nbatch = torch.max(batch) + 1
-    for ib in range(1, nbatch):
-        cluster[batch == ib] += torch.max(cluster[batch == ib - 1]) + 1
-    return cluster
+    return x, edge_index, edge_attr, batch[perm]
 
 
 def community_detection_per_batch( # pylint: disable=too-many-locals
@@ -236,3 +306,57 @@ def community_pooling(cluster, data):
             data.cluster1 = c1
 
     return data
+
+
+def precluster_dataset(dataset, method: str):
+    """Detects the clusters of the graphs of a dataset, at two depths, and stores them in its .HDF5 files.
+
+    The clusters are stored in the "clustering/<method>" group of every entry, as "depth_0" and "depth_1", where networks
+    like GINet read them from. Entries that can't be loaded are removed from the files.
+
+    Args:
+        dataset (:class:`deeprankcore.dataset.GraphDataset`): The dataset, whose files are opened for writing.
+        method (str): "mcl" or "louvain".
+    """
+
+    # the sidecar files stay valid, the clusters aren't part of what they record
+    with ExitStack() as sidecars:
+        for hdf5_path in sorted({fname for fname, _ in dataset.index_entries}):
+            sidecars.enter_context(keep_catalogue(hdf5_path))
+            sidecars.enter_context(keep_cached_stats(hdf5_path))
+
+        for fname, mol in tqdm(dataset.index_entries):
+            data = dataset.load_one_graph(fname, mol)
+
+            # the read-only handle, of this and any other dataset, must be closed before the file is opened for writing
+            close_hdf5_file(fname)
+
+            if data is None:
+                f5 = h5py.File(fname, "a")
+                try:
+                    _log.info(f"deleting {mol}")
+                    del f5[mol]
+                except BaseException:
+                    _log.info(f"{mol} not found")
+                f5.close()
+                continue
+
+            f5 = h5py.File(fname, "a")
+            grp = f5[mol]
+            clust_grp = grp.require_group("clustering")
+
+            if method.lower() in clust_grp:
+                del clust_grp[method.lower()]
+
+            method_grp = clust_grp.create_group(method.lower())
+            cluster = community_detection(
+                data.edge_index, data.num_nodes, method=method
+            )
+            method_grp.create_dataset("depth_0", data=cluster.cpu())
+            data = community_pooling(cluster, data)
+            cluster = community_detection(
+                data.edge_index, data.num_nodes, method=method
+            )
+            method_grp.create_dataset("depth_1", data=cluster.cpu())
+
+            f5.close()
@@ -0,0 +1,156 @@
+import copy
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import torch
+from torch_geometric.data.data import Data
+
+
+def get_data_size(data: Data) -> int:
+    """Gets the number of bytes taken by the tensors of a data item.
+
+    Args:
+        data (:class:`torch_geometric.data.data.Data`): The data item.
+
+    Returns:
+        int: The total size of its tensors.
+    """
+
+    return sum(value.element_size() * value.nelement() for _, value in data if isinstance(value, torch.Tensor))
+
+
+class DataCache:
+    def __init__(
+        self,
+        max_bytes: int,
+        policy: str = "lru",
+        shared: bool = False,
+    ):
+        """
+        Keeps decoded data items in memory, so that they are read from the .HDF5 files only once.
+
+        Items are given as shallow copies: setting their attributes doesn't change the cached item, but changing
+        their tensors in place does.
+
+        Args:
+            max_bytes (int): Memory budget, for the tensors of all cached items together.
+            policy (str, optional): What to do when the budget is used up. With "lru", the least recently used items
+                are evicted. With "static", the cached items are kept and new items are no longer cached.
+                The latter works better for shuffled datasets that don't fit the budget, because every epoch visits
+                all items and "lru" would evict each item before it's used again.
+                Defaults to "lru".
+            shared (bool, optional): Whether to move cached tensors to shared memory. The DataLoader workers and
+                other processes that get the cache from this process, then share its items instead of copying them.
+                Items cached in a worker are not seen by other processes, so fill the cache with
+                :meth:`deeprankcore.dataset.DeeprankDataset.preload_cache` before starting them.
+                Defaults to False.
+        """
+
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes must not be negative, got {max_bytes}")
+
+        if policy not in ("lru", "static"):
+            raise ValueError(f"Unknown cache policy {policy}, choose lru or static")
+
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.shared = shared
+
+        self._items = OrderedDict()
+        self._sizes = {}
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def get(self, key: Hashable) -> Optional[Data]:
+        """Gets a cached item.
+
+        Args:
+            key (Hashable): The item's key.
+
+        Returns:
+            :class:`torch_geometric.data.data.Data`: A shallow copy of the item, or None if it's not cached.
+        """
+
+        data = self._items.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.policy == "lru":
+            self._items.move_to_end(key)
+
+        return copy.copy(data)
+
+    def put(self, key: Hashable, data: Data) -> bool:
+        """Caches an item, if the policy allows it.
+
+        Args:
+            key (Hashable): The item's key.
+            data (:class:`torch_geometric.data.data.Data`): The item to cache.
+
+        Returns:
+            bool: Whether the item was cached.
+        """
+
+        if key in self._items:
+            return True
+
+        size = get_data_size(data)
+        if size > self.max_bytes:
+            return False
+
+        if self.policy == "static":
+            if self.nbytes + size > self.max_bytes:
+                return False
+        else:
+            while self.nbytes + size > self.max_bytes:
+                evicted_key, _ = self._items.popitem(last=False)
+                self.nbytes -= self._sizes.pop(evicted_key)
+                self.evictions += 1
+
+        data = copy.copy(data)
+        if self.shared:
+            for _, value in data:
+                if isinstance(value, torch.Tensor):
+                    value.share_memory_()
+
+        self._items[key] = data
+        self._sizes[key] = size
+        self.nbytes += size
+
+        return True
+
+    def get_or_load(self, key: Hashable, load: Callable[..., Data]) -> Data:
+        """Gets a cached item, or loads and caches it.
+
+        Args:
+            key (Hashable): The item's key, a tuple that is also passed as arguments to load.
+            load (Callable[..., Data]): Loads the item.
+
+        Returns:
+            :class:`torch_geometric.data.data.Data`: The item.
+        """
+
+        data = self.get(key)
+        if data is None:
+            data = load(*key)
+            self.put(key, data)
+
+        return data
+
+    def clear(self):
+        "removes all items from the cache"
+
+        self._items = OrderedDict()
+        self._sizes = {}
+        self.nbytes = 0
@@ -0,0 +1,119 @@
+"""Helpers for distributed data-parallel training with `torch.distributed`.
+
+Training runs in several processes, one per core group or node, that each train on a shard of the data and average
+their gradients. Start them with torchrun, for example on one machine with 4 processes:
+
+    torchrun --nproc_per_node 4 train.py
+
+where train.py calls :meth:`deeprankcore.trainer.Trainer.train` with distributed=True. torchrun sets the environment
+variables RANK, WORLD_SIZE, MASTER_ADDR and MASTER_PORT, from which the processes find each other.
+"""
+
+import logging
+import os
+from typing import Any, List
+
+import torch.distributed as dist
+from torch.utils.data.distributed import DistributedSampler
+
+_log = logging.getLogger(__name__)
+
+
+def init_distributed(backend: str = "gloo"):
+    """Joins the process group of the distributed run, unless this process already has.
+
+    Args:
+        backend (str, optional): The communication backend. Defaults to "gloo", which works on cpu.
+
+    Raises:
+        RuntimeError: If torch has no distributed support, or the environment doesn't describe a distributed run.
+    """
+
+    if not dist.is_available():
+        raise RuntimeError("This build of torch has no distributed support")
+
+    if dist.is_initialized():
+        return
+
+    missing_variables = [name for name in ("RANK", "WORLD_SIZE", "MASTER_ADDR", "MASTER_PORT") if name not in os.environ]
+    if len(missing_variables) > 0:
+        raise RuntimeError(f"Environment variables {missing_variables} are not set, start the processes with torchrun")
+
+    dist.init_process_group(backend, init_method="env://")
+    _log.info(f"process {dist.get_rank()} of {dist.get_world_size()} joined the {backend} process group")
+
+
+def is_distributed() -> bool:
+    "whether this process is part of a distributed run"
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    "the index of this process in the distributed run, 0 outside one"
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    "the number of processes in the distributed run, 1 outside one"
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    "whether this process writes the outputs and checkpoints, which is the one with rank 0"
+    return get_rank() == 0
+
+
+def gather_objects(obj: Any) -> List[Any]:
+    """Gathers an object from all processes.
+
+    Args:
+        obj (Any): This process's object, picklable.
+
+    Returns:
+        List[Any]: The object of every process, by rank.
+    """
+
+    if not is_distributed():
+        return [obj]
+
+    objects = [None] * dist.get_world_size()
+    dist.all_gather_object(objects, obj)
+    return objects
+
+
+def merge_shards(shards: List[List[Any]], total_size: int) -> List[Any]:
+    """Puts the items of data shards back in sampling order.
+
+    A :class:`torch.utils.data.distributed.DistributedSampler` deals the sampled indices out to the processes in turn,
+    after padding them with repeated indices up to a multiple of the number of processes.
+
+    Args:
+        shards (List[List[Any]]): The items of every process, by rank.
+        total_size (int): The number of items without padding.
+
+    Returns:
+        List[Any]: The items, without the padding.
+    """
+
+    merged = []
+    for index in range(max((len(shard) for shard in shards), default=0)):
+        merged += [shard[index] for shard in shards if index < len(shard)]
+
+    return merged[:total_size]
+
+
+def get_padding_count(sampler: DistributedSampler) -> int:
+    """Counts the repeated indices that a distributed sampler pads this process's shard with.
+
+    They come last in the shard, see :func:`merge_shards`.
+
+    Args:
+        sampler (:class:`torch.utils.data.distributed.DistributedSampler`): The sampler of this process.
+
+    Returns:
+        int: The number of padding indices at the end of the shard.
+    """
+
+    dataset_size = len(sampler.dataset)
+    shard_positions = range(sampler.rank, sampler.total_size, sampler.num_replicas)
+    return len(shard_positions) - len(range(sampler.rank, min(dataset_size, sampler.total_size), sampler.num_replicas))
@@ -82,7 +82,22 @@ class EarlyStopping:
                 self.trace_func(f'EarlyStopping activated at epoch # {epoch} due to overfitting. ' +
                                 f'The difference between validation and training loss of {gap} exceeds the maximum allowed ({self.maxgap})')
                 self.early_stop = True
-                
+
+    def state_dict(self) -> dict:
+        "the progress of the early stopping, to resume it from a checkpoint"
+        return {
+            "early_stop": self.early_stop,
+            "counter": self.counter,
+            "best_score": self.best_score,
+            "val_loss_min": self.val_loss_min,
+        }
+
+    def load_state_dict(self, state: dict):
+        "resumes the progress of the early stopping from a state given by :meth:`state_dict`"
+        self.early_stop = state["early_stop"]
+        self.counter = state["counter"]
+        self.best_score = state["best_score"]
+        self.val_loss_min = state["val_loss_min"]
 
 
 
@@ -4,6 +4,7 @@ import random
 from math import sqrt
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 from matplotlib import pyplot
 from sklearn.metrics import roc_auc_score
@@ -11,17 +12,26 @@ from torch import argmax, tensor
 from torch.nn.functional import cross_entropy
 from torch.utils.tensorboard import SummaryWriter
 
+from deeprankcore.utils.backgroundworker import BackgroundWorker
+from deeprankcore.utils.distributed import is_main_process
+
 _log = logging.getLogger(__name__)
 
 
 class OutputExporter:
-    """The class implements a general exporter to be called when a neural network generates outputs."""
+    """The class implements a general exporter to be called when a neural network generates outputs.
+
+    The trainer hands the outputs of a pass over the data to :meth:`process_chunk`, a chunk of entries at a time, and
+    then calls :meth:`end_pass` with the loss. By default, the chunks of a pass are gathered and handed to :meth:`process`
+    at once. Exporters that override :meth:`process_chunk` and :meth:`end_pass` can stream the chunks instead.
+    """
 
     def __init__(self, directory_path: str = None):
         
         if directory_path is None:
             directory_path = "./output"
         self._directory_path = directory_path
+        self._pass_chunks = {}
 
         if not os.path.exists(self._directory_path):
             os.makedirs(self._directory_path)
@@ -39,6 +49,25 @@ class OutputExporter:
         "the entry_names, output_values, target_values MUST have the same length"
         pass # pylint: disable=unnecessary-pass
 
+    def process_chunk(self, pass_name: str, epoch_number: int, # pylint: disable=too-many-arguments
+                      entry_names: List[str], output_values: List[Any], target_values: List[Any]):
+        "overridable, takes the outputs of the next entries of a pass, target_values is empty if the data has no targets"
+
+        pass_entry_names, pass_output_values, pass_target_values = self._pass_chunks.setdefault((pass_name, epoch_number), ([], [], []))
+        pass_entry_names += entry_names
+        pass_output_values += output_values
+        pass_target_values += target_values
+
+    def end_pass(self, pass_name: str, epoch_number: int, loss: float):
+        "overridable, called when all chunks of a pass are processed"
+
+        entry_names, output_values, target_values = self._pass_chunks.pop((pass_name, epoch_number), ([], [], []))
+        self.process(pass_name, epoch_number, entry_names, output_values, target_values, loss)
+
+    def process_profile(self, pass_name: str, epoch_number: int, metrics: Dict[str, float]):
+        "overridable, takes the timings and other metrics of a pass, when the trainer profiles (see :class:`deeprankcore.utils.profiling.PassProfile`)"
+        pass # pylint: disable=unnecessary-pass
+
     def is_compatible_with( # pylint: disable=unused-argument
         self,
         output_data_shape: int,
@@ -48,30 +77,83 @@ class OutputExporter:
 
 
 class OutputExporterCollection:
-    """It allows a series of output exporters to be used at the same time."""
+    """It allows a series of output exporters to be used at the same time.
+
+    In a distributed run, only the main process exports, the outputs of all processes.
+    """
 
     def __init__(self, *args: List[OutputExporter]):
         self._output_exporters = args
 
     def __enter__(self):
-        for output_exporter in self._output_exporters:
-            output_exporter.__enter__()
+        if is_main_process():
+            for output_exporter in self._output_exporters:
+                output_exporter.__enter__()
 
         return self
 
     def __exit__(self, exception_type, exception, traceback):
-        for output_exporter in self._output_exporters:
-            output_exporter.__exit__(exception_type, exception, traceback)
+        if is_main_process():
+            for output_exporter in self._output_exporters:
+                output_exporter.__exit__(exception_type, exception, traceback)
 
     def process(self, pass_name: str, epoch_number: int, # pylint: disable=too-many-arguments
                 entry_names: List[str], output_values: List[Any], target_values: List[Any], loss: float):
-        for output_exporter in self._output_exporters:
-            output_exporter.process(pass_name, epoch_number, entry_names, output_values, target_values, loss)
+        if is_main_process():
+            for output_exporter in self._output_exporters:
+                output_exporter.process(pass_name, epoch_number, entry_names, output_values, target_values, loss)
+
+    def process_chunk(self, pass_name: str, epoch_number: int, # pylint: disable=too-many-arguments
+                      entry_names: List[str], output_values: List[Any], target_values: List[Any]):
+        if is_main_process():
+            for output_exporter in self._output_exporters:
+                output_exporter.process_chunk(pass_name, epoch_number, entry_names, output_values, target_values)
+
+    def end_pass(self, pass_name: str, epoch_number: int, loss: float):
+        if is_main_process():
+            for output_exporter in self._output_exporters:
+                output_exporter.end_pass(pass_name, epoch_number, loss)
+
+    def process_profile(self, pass_name: str, epoch_number: int, metrics: Dict[str, float]):
+        if is_main_process():
+            for output_exporter in self._output_exporters:
+                output_exporter.process_profile(pass_name, epoch_number, metrics)
 
     def __iter__(self):
         return iter(self._output_exporters)
 
 
+def _add_profile_scalars(writer: SummaryWriter, pass_name: str, epoch_number: int, metrics: Dict[str, float]):
+    "writes the metrics of a profiled pass, as scalars named after the pass"
+
+    for name, value in metrics.items():
+        writer.add_scalar(f"{pass_name} profile/{name}", value, epoch_number)
+
+
+class TensorboardProfileExporter(OutputExporter):
+    """Exporter for tensorboard, of the profiles of the passes when the trainer profiles.
+
+    Outputs to tensorboard, for each epoch, the time spent in every stage, the throughput, the graph sizes and
+    the peak memory of the training and validation passes. Works for any task.
+    """
+
+    def __init__(self, directory_path: str):
+        super().__init__(directory_path)
+        self._writer = SummaryWriter(log_dir=directory_path)
+
+    def __enter__(self):
+        self._writer.__enter__()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self._writer.__exit__(exception_type, exception, traceback)
+
+    def process_profile(self, pass_name: str, epoch_number: int, metrics: Dict[str, float]):
+        "write to tensorboard"
+
+        _add_profile_scalars(self._writer, pass_name, epoch_number, metrics)
+
+
 class TensorboardBinaryClassificationExporter(OutputExporter):
     """Exporter for tensorboard, works for binary classification only.
 
@@ -79,6 +161,7 @@ class TensorboardBinaryClassificationExporter(OutputExporter):
     - Mathews Correlation Coefficient (MCC)
     - Accuracy
     - ROC area under the curve
+    - The profiles of the passes, when the trainer profiles
     Outputs are computed for each epoch.
     """
 
@@ -139,6 +222,11 @@ class TensorboardBinaryClassificationExporter(OutputExporter):
             roc_auc = roc_auc_score(target_values, probabilities)
             self._writer.add_scalar(f"{pass_name} ROC AUC", roc_auc, epoch_number)
 
+    def process_profile(self, pass_name: str, epoch_number: int, metrics: Dict[str, float]):
+        "write to tensorboard"
+
+        _add_profile_scalars(self._writer, pass_name, epoch_number, metrics)
+
     def is_compatible_with(self, output_data_shape: int, target_data_shape: Optional[int] = None) -> bool:
         """For regression, target data is needed and output data must be a list of two-dimensional values."""
 
@@ -236,31 +324,128 @@ class HDF5OutputExporter(OutputExporter):
     - output value/s
     - target value
     - loss per epoch
-    The user can then read the content of the hdf5 file into a Pandas dataframe.
+    The results are appended to a table per phase ("training", for training and validation), chunk by chunk, by a
+    background thread, so that they don't pile up in memory. The loss of the rows of a pass is filled in when the pass
+    ends, and the rows of a pass that doesn't end, e.g. because of an error, are removed.
+    The user can then read the content of the hdf5 file into a Pandas dataframe, with :func:`read_hdf5_output`, which
+    also reads the files of earlier versions.
     """
 
-    def __init__(self, directory_path: str):
+    def __init__(self, directory_path: str, max_entry_name_length: int = 256):
+        """
+        Args:
+            directory_path (str): Where to store the output_exporter.hdf5 file.
+            max_entry_name_length (int, optional): Maximum length of the entry names, for which room is made in the tables.
+                Defaults to 256.
+        """
 
         self.phase = None
+        self.max_entry_name_length = max_entry_name_length
         super().__init__(directory_path)
 
+        self._path = os.path.join(self._directory_path, 'output_exporter.hdf5')
+        self._store = None
+        self._writer = None
+        self._written_keys = set()
+        self._pass_starts = {}
+
     def __enter__(self):
 
-        self.d = {'phase': [], 'epoch': [], 'entry': [], 'output': [], 'target': [], 'loss': []}
-        self.df = pd.DataFrame(data=self.d)
+        self._store = pd.HDFStore(self._path, mode='a', complevel=4, complib='blosc')
+        self._written_keys = set()
+        self._pass_starts = {}
+
+        self._writer = BackgroundWorker(name="hdf5-output-writer").__enter__()
 
         return self
 
     def __exit__(self, exception_type, exception, traceback):
 
-        if self.phase is not None:
-            if self.phase == "validation":
-                self.phase = "training"
+        try:
+            self._writer.close()
+        finally:
+            try:
+                # the rows of passes that didn't end have no loss
+                for key, start in self._pass_starts.items():
+                    self._store.remove(key, start=start, stop=self._count_rows(key))
+            finally:
+                self._store.close()
+                self._store = None
+                self._writer = None
+
+    @staticmethod
+    def _get_key(pass_name: str) -> str:
+        if pass_name == "validation":
+            return "training"
+        return pass_name
+
+    def _append(self, key: str, frame: pd.DataFrame):
+
+        # the first pass of a session replaces the key's table of an earlier session
+        if key not in self._written_keys:
+            if key in self._store:
+                self._store.remove(key)
+            self._written_keys.add(key)
+
+        row_count = self._count_rows(key)
+        self._pass_starts.setdefault(key, row_count)
+
+        frame.index = pd.RangeIndex(row_count, row_count + len(frame))
+        self._store.append(key, frame, min_itemsize={"phase": 32, "entry": self.max_entry_name_length},
+                           data_columns=["phase", "epoch", "entry", "loss"], index=["phase", "epoch", "entry"])
+
+        if row_count == 0:
+            setattr(self._store.get_storer(key).attrs, _FORMAT_VERSION_ATTRIBUTE, _FORMAT_VERSION)
+
+    def _count_rows(self, key: str) -> int:
+        if key not in self._store:
+            return 0
+        return self._store.get_storer(key).nrows
+
+    def _end_pass(self, key: str, loss: float):
+
+        start = self._pass_starts.pop(key, None)
+        if start is None:
+            return
+
+        # the loss is a column of its own, that is written in place
+        table = self._store.get_storer(key).table
+        stop = table.nrows
+        for chunk_start in range(start, stop, _LOSS_CHUNK_SIZE):
+            chunk_stop = min(chunk_start + _LOSS_CHUNK_SIZE, stop)
+            table.modify_column(start=chunk_start, stop=chunk_stop, colname="loss",
+                                column=np.full(chunk_stop - chunk_start, float(loss)))
+        table.flush()
+
+    def process_chunk(self, pass_name: str, epoch_number: int, # pylint: disable=too-many-arguments
+                      entry_names: List[str], output_values: List[Any], target_values: List[Any]):
+
+        self.phase = pass_name
+
+        frame = pd.DataFrame({'phase': pass_name, 'epoch': epoch_number, 'entry': list(entry_names)},
+                             index=pd.RangeIndex(len(entry_names)))
+        frame['epoch'] = frame['epoch'].astype(np.int64)
+
+        output_values = np.asarray(output_values, dtype=np.float64)
+        if output_values.ndim > 1:
+            for output_index in range(output_values.shape[1]):
+                frame[f'output_{output_index}'] = output_values[:, output_index]
+        else:
+            frame['output'] = output_values
+
+        if len(target_values) > 0:
+            frame['target'] = np.asarray(target_values, dtype=np.float64)
+        else:
+            frame['target'] = np.nan
+
+        # filled in at the end of the pass
+        frame['loss'] = np.nan
+
+        self._writer.submit(self._append, self._get_key(pass_name), frame)
 
-            self.df.to_hdf(
-                os.path.join(self._directory_path, 'output_exporter.hdf5'),
-                key=self.phase,
-                mode='a')
+    def end_pass(self, pass_name: str, epoch_number: int, loss: float):
+
+        self._writer.submit(self._end_pass, self._get_key(pass_name), loss)
 
     def process( # pylint: disable=too-many-arguments
         self,
@@ -271,13 +456,47 @@ class HDF5OutputExporter(OutputExporter):
         target_values: List[Any],
         loss: float):
 
-        self.phase = pass_name
-        pass_name = [pass_name] * len(output_values)
-        loss = [loss] * len(output_values)
-        epoch_number = [epoch_number] * len(output_values)
+        self.process_chunk(pass_name, epoch_number, entry_names, output_values, target_values)
+        self.end_pass(pass_name, epoch_number, loss)
+
+
+_LOSS_CHUNK_SIZE = 65536
+
+# the layout of the tables: 1 for a table in fixed format with a column of lists of outputs, 2 for an append-able table
+# with the outputs in columns output_0, output_1, ..
+_FORMAT_VERSION_ATTRIBUTE = "deeprankcore_format_version"
+_FORMAT_VERSION = 2
+
+
+def read_hdf5_output(path: str, key: str, where: Optional[str] = None) -> pd.DataFrame:
+    """Reads the results of an :class:`HDF5OutputExporter`, of this or an earlier version.
+
+    The columns output_0, output_1, .. of outputs with several values (e.g. the probabilities of the classes) are
+    combined into one column, output, of lists, as written by earlier versions.
+
+    Args:
+        path (str): The output_exporter.hdf5 file.
+        key (str): The phase, e.g. "training" (which includes validation) or "testing".
+        where (Optional[str], optional): A condition on the phase, epoch and entry columns, e.g. "epoch == 10",
+            to read part of the results only. Defaults to None (all).
+
+    Returns:
+        pd.DataFrame: The results, with columns phase, epoch, entry, output, target and loss.
+    """
+
+    with pd.HDFStore(path, mode="r") as store:
+        format_version = getattr(store.get_storer(key).attrs, _FORMAT_VERSION_ATTRIBUTE, 1)
+
+        if format_version == 1:
+            # earlier versions wrote the whole table at once, in fixed format, which can't be selected from
+            frame = store.get(key)
+            return frame if where is None else frame.query(where)
+
+        frame = store.select(key, where=where)
 
-        d_epoch = {'phase': pass_name, 'epoch': epoch_number, 'entry': entry_names, 'output': output_values, 'target': target_values, 'loss': loss}
-        df_epoch = pd.DataFrame(data=d_epoch)
+    output_columns = [column for column in frame.columns if column.startswith("output_")]
+    if len(output_columns) > 0:
+        frame.insert(frame.columns.get_loc(output_columns[0]), "output", frame[output_columns].values.tolist())
+        frame = frame.drop(columns=output_columns)
 
-        self.df = pd.concat([self.df, df_epoch])
-        self.df.reset_index(drop=True, inplace=True)
+    return frame
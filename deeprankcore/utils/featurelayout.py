@@ -0,0 +1,82 @@
+from typing import Dict, List, Tuple, Union
+
+import h5py
+import numpy as np
+
+
+def get_feature_columns(group: h5py.Group, feature_names: Union[List[str], str]) -> Dict[str, Tuple[int, int]]:
+    """Lays out features side by side in one array, one column per channel.
+
+    Args:
+        group (:class:`h5py.Group`): The node or edge features group of an entry.
+        feature_names (Union[List[str], str]): The features to lay out, or "all" for all but the metafeatures.
+
+    Returns:
+        Dict[str, Tuple[int, int]]: For each feature, the range of its columns.
+    """
+
+    if feature_names == "all":
+        feature_names = [name for name in group.keys() if name[0] != '_']  # ignore metafeatures
+
+    return get_schema_feature_columns({name: list(group[name].shape[1:]) for name in feature_names}, feature_names)
+
+
+def get_schema_feature_columns(shapes: Dict[str, List[int]], feature_names: List[str]) -> Dict[str, Tuple[int, int]]:
+    """Lays out features like :func:`get_feature_columns`, from their shapes in a catalogue's schema.
+
+    Args:
+        shapes (Dict[str, List[int]]): For each feature, its shape without the node or edge dimension, as in
+            :attr:`deeprankcore.utils.catalogue.EntryCatalogue.schema`.
+        feature_names (List[str]): The features to lay out.
+
+    Returns:
+        Dict[str, Tuple[int, int]]: For each feature, the range of its columns.
+    """
+
+    columns = {}
+    column_start = 0
+    for feature_name in feature_names:
+        shape = shapes[feature_name]
+        width = 1 if len(shape) == 0 else shape[0]
+
+        columns[feature_name] = (column_start, column_start + width)
+        column_start += width
+
+    return columns
+
+
+def get_column_count(columns: Dict[str, Tuple[int, int]]) -> int:
+    "the total number of columns in the layout"
+    return max((column_end for _, column_end in columns.values()), default=0)
+
+
+def get_standardization_vectors(
+    columns: Dict[str, Tuple[int, int]],
+    means: Dict[str, float],
+    devs: Dict[str, float],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Puts the means and standard deviations of the features in the columns of the layout.
+
+    Args:
+        columns (Dict[str, Tuple[int, int]]): The layout, from :func:`get_feature_columns`.
+        means (Dict[str, float]): The means, per feature name or, for features with more than one channel, per name_channel.
+        devs (Dict[str, float]): The standard deviations, keyed like the means.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The mean and standard deviation of every column.
+    """
+
+    column_count = get_column_count(columns)
+    mean_vector = np.empty(column_count, dtype=np.float32)
+    dev_vector = np.empty(column_count, dtype=np.float32)
+
+    for feature_name, (column_start, column_end) in columns.items():
+        if column_end - column_start == 1 and feature_name in means:
+            keys = [feature_name]
+        else:
+            keys = [f"{feature_name}_{channel}" for channel in range(column_end - column_start)]
+
+        mean_vector[column_start:column_end] = [means[key] for key in keys]
+        dev_vector[column_start:column_end] = [devs[key] for key in keys]
+
+    return mean_vector, dev_vector
@@ -0,0 +1,232 @@
+"""Streaming per-channel feature statistics of .HDF5 files, used to standardize features.
+
+The statistics are computed one entry at a time, so that the features never need to be in memory all together,
+and merged over entries and files with Chan's parallel variant of Welford's algorithm.
+Per .HDF5 file, they are cached in a sidecar file, next to it, which is reused until the .HDF5 file changes.
+"""
+
+import json
+import logging
+import os
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional
+
+import h5py
+import numpy as np
+
+from deeprankcore.domain import gridstorage
+from deeprankcore.utils.catalogue import get_entry_names, get_sidecar_path
+from deeprankcore.utils.grid import read_grid_feature
+
+_log = logging.getLogger(__name__)
+
+
+STATS_FILE_SUFFIX = ".stats.json"
+
+
+class RunningStats:
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        """
+        Count, mean and sum of squared deviations of a stream of values.
+
+        Args:
+            count (int, optional): Number of values. Defaults to 0.
+            mean (float, optional): Their mean. Defaults to 0.0.
+            m2 (float, optional): The sum of their squared deviations from the mean. Defaults to 0.0.
+        """
+
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @property
+    def std(self) -> float:
+        "population standard deviation, like np.std"
+        if self.count == 0:
+            return 0.0
+        return float(np.sqrt(self.m2 / self.count))
+
+    def merge(self, other: "RunningStats"):
+        "adds the values of other to these statistics"
+
+        if other.count == 0:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    def update(self, values: np.ndarray):
+        "adds an array of values to these statistics"
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+
+        mean = values.mean()
+        self.merge(RunningStats(values.size, float(mean), float(((values - mean) ** 2).sum())))
+
+
+def _get_file_stats(hdf5_path: str, features_dict: Dict[str, List[str]],
+                    subset: Optional[List[str]]) -> Dict[str, Dict[str, RunningStats]]:
+    """Computes the statistics of one .HDF5 file.
+
+    Returns:
+        Dict[str, Dict[str, RunningStats]]: Per group/feature, the statistics per column, where column is the feature name or,
+            for features with more than one channel, name_channel.
+    """
+
+    if subset is not None:
+        subset = set(subset)
+
+    stats = {}
+    with h5py.File(hdf5_path, 'r') as hdf5_file:
+        for entry_name, entry_group in hdf5_file.items():
+            if subset is not None and entry_name not in subset:
+                continue
+
+            for feature_type, feature_names in features_dict.items():
+                for feature_name in feature_names:
+                    if feature_type == gridstorage.MAPPED_FEATURES:
+                        channel_values = {feature_name: read_grid_feature(entry_group[feature_type][feature_name])}
+                    else:
+                        values = entry_group[feature_type][feature_name][()]
+                        if np.ndim(values) == 2:
+                            channel_values = {f"{feature_name}_{channel}": values[:, channel] for channel in range(values.shape[1])}
+                        else:
+                            channel_values = {feature_name: values}
+
+                    feature_stats = stats.setdefault(f"{feature_type}/{feature_name}", {})
+                    for column_name, values in channel_values.items():
+                        feature_stats.setdefault(column_name, RunningStats()).update(values)
+
+    return stats
+
+
+def _get_file_signature(hdf5_path: str) -> Dict[str, float]:
+    file_stat = os.stat(hdf5_path)
+    return {"size": file_stat.st_size, "mtime": file_stat.st_mtime}
+
+
+def _read_cached_stats(hdf5_path: str) -> Dict[str, Dict[str, RunningStats]]:
+    "reads the sidecar statistics, if they were made from the current version of the file"
+
+    stats_path = get_sidecar_path(hdf5_path, STATS_FILE_SUFFIX)
+    if not os.path.isfile(stats_path):
+        return {}
+
+    try:
+        with open(stats_path, 'rt', encoding="utf-8") as stats_file:
+            cached = json.load(stats_file)
+    except (OSError, ValueError):
+        _log.warning(f"ignoring unreadable statistics file {stats_path}")
+        return {}
+
+    if cached.get("file") != _get_file_signature(hdf5_path):
+        return {}
+
+    return {feature_key: {column_name: RunningStats(*column_stats) for column_name, column_stats in feature_stats.items()}
+            for feature_key, feature_stats in cached["features"].items()}
+
+
+def _write_cached_stats(hdf5_path: str, stats: Dict[str, Dict[str, RunningStats]]):
+
+    stats_path = get_sidecar_path(hdf5_path, STATS_FILE_SUFFIX)
+    try:
+        with open(stats_path, 'wt', encoding="utf-8") as stats_file:
+            json.dump({"file": _get_file_signature(hdf5_path),
+                       "features": {feature_key: {column_name: [column_stats.count, column_stats.mean, column_stats.m2]
+                                                  for column_name, column_stats in feature_stats.items()}
+                                    for feature_key, feature_stats in stats.items()}},
+                      stats_file)
+    except OSError:
+        _log.warning(f"could not cache feature statistics in {stats_path}")
+
+
+@contextmanager
+def keep_cached_stats(hdf5_path: str) -> Iterator[None]:
+    """Keeps the cached statistics of an .HDF5 file valid across writes that don't change the features, like the clusters.
+
+    Up-to-date statistics are saved again after the writes, for the file's new signature, unless the writes added or
+    removed entries.
+
+    Args:
+        hdf5_path (str): The .HDF5 file, that's written to in the with block.
+    """
+
+    stats = _read_cached_stats(hdf5_path)
+    entry_names = get_entry_names(hdf5_path) if len(stats) > 0 else None
+
+    yield
+
+    if entry_names is not None and get_entry_names(hdf5_path) == entry_names:
+        _write_cached_stats(hdf5_path, stats)
+
+
+def _get_feature_keys(features_dict: Dict[str, List[str]]) -> List[str]:
+    return [f"{feature_type}/{feature_name}" for feature_type, feature_names in features_dict.items() for feature_name in feature_names]
+
+
+def compute_feature_stats(
+    hdf5_paths: List[str],
+    features_dict: Dict[str, List[str]],
+    subset: Optional[List[str]] = None,
+    cpu_count: Optional[int] = None,
+    use_cache: bool = True,
+) -> Dict[str, RunningStats]:
+    """Computes per-channel statistics of features in .HDF5 files.
+
+    Args:
+        hdf5_paths (List[str]): The .HDF5 files.
+        features_dict (Dict[str, List[str]]): The feature names, per group, as in :attr:`deeprankcore.dataset.DeeprankDataset.features_dict`.
+        subset (Optional[List[str]], optional): Entries to include. Defaults to None (meaning include all).
+        cpu_count (Optional[int], optional): How many processes compute the statistics of uncached files simultaneously.
+            Defaults to None, which takes one per file, up to the number of cpu cores.
+        use_cache (bool, optional): Whether to read and write the statistics in sidecar files, next to the .HDF5 files.
+            Statistics of a subset are never cached. Defaults to True.
+
+    Returns:
+        Dict[str, RunningStats]: Statistics per column, where column is the feature name or, for features with more than
+            one channel, name_channel.
+    """
+
+    use_cache = use_cache and subset is None
+
+    file_stats = []
+    uncached_paths = []
+    for hdf5_path in hdf5_paths:
+        cached_stats = _read_cached_stats(hdf5_path) if use_cache else {}
+        if all(feature_key in cached_stats for feature_key in _get_feature_keys(features_dict)):
+            file_stats.append(cached_stats)
+        else:
+            uncached_paths.append(hdf5_path)
+
+    if len(uncached_paths) > 0:
+        if cpu_count is None:
+            cpu_count = min(len(uncached_paths), os.cpu_count())
+
+        pool_function = partial(_get_file_stats, features_dict=features_dict, subset=subset)
+        if cpu_count > 1:
+            with Pool(cpu_count) as pool:
+                computed_stats = pool.map(pool_function, uncached_paths)
+        else:
+            computed_stats = [pool_function(hdf5_path) for hdf5_path in uncached_paths]
+
+        for hdf5_path, stats in zip(uncached_paths, computed_stats):
+            if use_cache:
+                # keep the statistics of other features, cached earlier
+                _write_cached_stats(hdf5_path, {**_read_cached_stats(hdf5_path), **stats})
+            file_stats.append(stats)
+
+    column_stats = {}
+    for stats in file_stats:
+        for feature_key in _get_feature_keys(features_dict):
+            for column_name, stats_part in stats.get(feature_key, {}).items():
+                column_stats.setdefault(column_name, RunningStats()).merge(stats_part)
+
+    return column_stats
@@ -14,6 +14,7 @@ from deeprankcore.molstruct.atom import Atom
 from deeprankcore.molstruct.pair import AtomicContact, Contact, ResidueContact
 from deeprankcore.molstruct.residue import Residue, get_residue_center
 from deeprankcore.utils.grid import Augmentation, Grid, GridSettings, MapMethod
+from deeprankcore.utils.hdf5files import close_hdf5_file
 
 _log = logging.getLogger(__name__)
 
@@ -153,11 +154,7 @@ class Graph:
                                                            augmentation.angle,
                                                            self.center)
 
-        for point_index in range(points.shape[0]):
-            position = points[point_index]
-            value = values[point_index]
-
-            grid.map_feature(position, feature_name, value, method)
+        grid.map_features(points, feature_name, values, method)
 
     def map_to_grid(self, grid: Grid, method: MapMethod, augmentation: Optional[Augmentation] = None):
 
@@ -192,6 +189,7 @@ class Graph:
     def write_to_hdf5(self, hdf5_path: str): # pylint: disable=too-many-locals
         """Write a featured graph to an hdf5 file, according to deeprank standards."""
 
+        close_hdf5_file(hdf5_path)
         with h5py.File(hdf5_path, "a") as hdf5_file:
 
             # create groups to hold data
@@ -296,6 +294,7 @@ class Graph:
         grid.to_hdf5(hdf5_path)
 
         # store target values
+        close_hdf5_file(hdf5_path)
         with h5py.File(hdf5_path, 'a') as hdf5_file:
 
             entry_group = hdf5_file[id_]
@@ -3,13 +3,15 @@
 import itertools
 import logging
 from enum import Enum
-from typing import Dict, List, Union
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 
 import h5py
 import numpy as np
 from scipy.signal import bspline
 
 from deeprankcore.domain import gridstorage
+from deeprankcore.utils.hdf5files import close_hdf5_file
 
 _log = logging.getLogger(__name__)
 
@@ -50,18 +52,29 @@ class GridSettings:
     - sizes: x, y, z sizes of the box in Å
     - points_counts: the number of points on the x, y, z edges of the cube
     - resolutions: the size in Å of one x, y, z edge subdivision. Also the distance between two points on the edge.
+    - sparse: whether the mapped features should be stored as sparse (COO) arrays, holding only the nonzero grid points.
+    - dtype: the floating point type in which the mapped features are stored, float16, float32 (default) or float64.
+        Mapping is computed in float32, or in float64 if that is the storage type.
     """
 
     def __init__(
         self,
         points_counts: List[int],
-        sizes: List[float]
+        sizes: List[float],
+        sparse: bool = False,
+        dtype: Union[str, np.dtype] = np.float32
     ):
         assert len(points_counts) == 3
         assert len(sizes) == 3
 
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float16, np.float32, np.float64):
+            raise ValueError(f"Unsupported grid dtype {dtype}, please use float16, float32 or float64")
+
         self._points_counts = points_counts
         self._sizes = sizes
+        self._sparse = sparse
+        self._dtype = dtype
 
     @property
     def resolutions(self) -> List[float]:
@@ -75,6 +88,18 @@ class GridSettings:
     def points_counts(self) -> List[int]:
         return self._points_counts
 
+    @property
+    def sparse(self) -> bool:
+        return self._sparse
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def compute_dtype(self) -> np.dtype:
+        return np.promote_types(self._dtype, np.float32)
+
 
 class Grid:
     """
@@ -96,26 +121,25 @@ class Grid:
         self._features = {}
 
     def _set_mesh(self, center: np.ndarray, settings: GridSettings):
-        """Builds the grid points."""
+        """Builds the grid points.
 
-        half_size_x = settings.sizes[0] / 2
-        half_size_y = settings.sizes[1] / 2
-        half_size_z = settings.sizes[2] / 2
+        Only the x, y, z axes are stored. The 3D meshes are views on these, so no full-size arrays are allocated.
+        """
 
-        min_x = center[0] - half_size_x
-        max_x = min_x + (settings.points_counts[0] - 1.0) * settings.resolutions[0]
-        self._xs = np.linspace(min_x, max_x, num=settings.points_counts[0])
+        relative_xs, relative_ys, relative_zs = _get_relative_axes(tuple(settings.points_counts), tuple(settings.sizes))
 
-        min_y = center[1] - half_size_y
-        max_y = min_y + (settings.points_counts[1] - 1.0) * settings.resolutions[1]
-        self._ys = np.linspace(min_y, max_y, num=settings.points_counts[1])
+        dtype = settings.compute_dtype
+        self._xs = (relative_xs + center[0]).astype(dtype)
+        self._ys = (relative_ys + center[1]).astype(dtype)
+        self._zs = (relative_zs + center[2]).astype(dtype)
 
-        min_z = center[2] - half_size_z
-        max_z = min_z + (settings.points_counts[2] - 1.0) * settings.resolutions[2]
-        self._zs = np.linspace(min_z, max_z, num=settings.points_counts[2])
+    def _get_distances(self, position: np.ndarray) -> np.ndarray:
+        "distances from the position to every grid point, computed from the axes by broadcasting"
 
-        self._ygrid, self._xgrid, self._zgrid = np.meshgrid(
-            self._ys, self._xs, self._zs
+        return np.sqrt(
+            np.square(self._xs[:, np.newaxis, np.newaxis] - position[0]) +
+            np.square(self._ys[np.newaxis, :, np.newaxis] - position[1]) +
+            np.square(self._zs[np.newaxis, np.newaxis, :] - position[2])
         )
 
     @property
@@ -128,7 +152,7 @@ class Grid:
 
     @property
     def xgrid(self) -> np.array:
-        return self._xgrid
+        return np.broadcast_to(self._xs[:, np.newaxis, np.newaxis], self.shape)
 
     @property
     def ys(self) -> np.array:
@@ -136,7 +160,7 @@ class Grid:
 
     @property
     def ygrid(self) -> np.array:
-        return self._ygrid
+        return np.broadcast_to(self._ys[np.newaxis, :, np.newaxis], self.shape)
 
     @property
     def zs(self) -> np.array:
@@ -144,22 +168,48 @@ class Grid:
 
     @property
     def zgrid(self) -> np.array:
-        return self._zgrid
+        return np.broadcast_to(self._zs[np.newaxis, np.newaxis, :], self.shape)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (self._xs.shape[0], self._ys.shape[0], self._zs.shape[0])
 
     @property
     def features(self) -> Dict[str, np.array]:
         return self._features
 
-    def add_feature_values(self, feature_name: str, data: np.ndarray):
+    def add_feature_values(
+        self,
+        feature_name: str,
+        data: np.ndarray,
+        region: Optional[Tuple[slice, slice, slice]] = None
+    ):
         """Makes sure feature values per grid point get stored.
 
         This method may be called repeatedly to add on to existing grid point values.
+        If a region is given, the data only covers that part of the grid.
         """
 
-        if feature_name not in self._features:
-            self._features[feature_name] = data
+        if region is None:
+            if feature_name not in self._features:
+                self._features[feature_name] = data.astype(self._settings.compute_dtype, copy=False)
+            else:
+                self._features[feature_name] += data
         else:
-            self._features[feature_name] += data
+            if feature_name not in self._features:
+                self._features[feature_name] = np.zeros(self.shape, dtype=self._settings.compute_dtype)
+
+            self._features[feature_name][region] += data
+
+    @staticmethod
+    def _get_axis_region(axis: np.ndarray, position: float, cutoff: float) -> slice:
+        "the range of indices on the axis, that lie within the cutoff distance from the position"
+
+        indices = np.nonzero(np.abs(axis - position) < cutoff)[0]
+        if len(indices) == 0:
+            return slice(0, 0)
+
+        return slice(indices[0], indices[-1] + 1)
 
     def _get_mapped_feature_gaussian(
         self, position: np.ndarray, value: float
@@ -167,32 +217,40 @@ class Grid:
 
         beta = 1.0
 
-        fx, fy, fz = position
-        distances = np.sqrt(
-            (self.xgrid - fx) ** 2 + (self.ygrid - fy) ** 2 + (self.zgrid - fz) ** 2
-        )
+        distances = self._get_distances(position)
 
         return value * np.exp(-beta * distances)
 
     def _get_mapped_feature_fast_gaussian(
         self, position: np.ndarray, value: float
-    ) -> np.ndarray:
+    ) -> Tuple[Tuple[slice, slice, slice], np.ndarray]:
+        """Only the grid points within the cutoff distance are calculated.
+
+        Returns:
+            Tuple[Tuple[slice, slice, slice], np.ndarray]: The region of the grid that the data covers and the mapped data in that region.
+        """
 
         beta = 1.0
         cutoff = 5.0 * beta
 
         fx, fy, fz = position
+        region = (self._get_axis_region(self.xs, fx, cutoff),
+                  self._get_axis_region(self.ys, fy, cutoff),
+                  self._get_axis_region(self.zs, fz, cutoff))
+
         distances = np.sqrt(
-            (self.xgrid - fx) ** 2 + (self.ygrid - fy) ** 2 + (self.zgrid - fz) ** 2
+            (self.xs[region[0], np.newaxis, np.newaxis] - fx) ** 2 +
+            (self.ys[np.newaxis, region[1], np.newaxis] - fy) ** 2 +
+            (self.zs[np.newaxis, np.newaxis, region[2]] - fz) ** 2
         )
 
-        data = np.zeros(distances.shape)
+        data = np.zeros(distances.shape, dtype=distances.dtype)
 
         data[distances < cutoff] = value * np.exp(
             -beta * distances[distances < cutoff]
         )
 
-        return data
+        return region, data
 
     def _get_mapped_feature_bsp_line(
         self, position: np.ndarray, value: float
@@ -202,51 +260,72 @@ class Grid:
 
         fx, fy, fz = position
         bsp_data = (
-            bspline((self.xgrid - fx) / self._settings.resolutions[0], order)
-            * bspline((self.ygrid - fy) / self._settings.resolutions[1], order)
-            * bspline((self.zgrid - fz) / self._settings.resolutions[2], order)
+            bspline((self.xs - fx) / self._settings.resolutions[0], order)[:, np.newaxis, np.newaxis]
+            * bspline((self.ys - fy) / self._settings.resolutions[1], order)[np.newaxis, :, np.newaxis]
+            * bspline((self.zs - fz) / self._settings.resolutions[2], order)[np.newaxis, np.newaxis, :]
         )
 
         return value * bsp_data
 
-    def _get_mapped_feature_nearest_neighbour( # pylint: disable=too-many-locals
-        self, position: np.ndarray, value: float
-    ) -> np.ndarray:
+    def _get_nearest_neighbour_weights(
+        self, positions: np.ndarray
+    ) -> Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray], np.ndarray, np.ndarray]:
+        """Trilinear weights of the 8 grid points surrounding each position.
+
+        Args:
+            positions (np.ndarray): Array of shape (n, 3).
 
-        fx, _, _ = position
-        distances_x = np.abs(self.xs - fx)
-        distances_y = np.abs(self.ys - fx)
-        distances_z = np.abs(self.zs - fx)
+        Returns:
+            Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray], np.ndarray, np.ndarray]: The x, y, z indices of the grid points,
+                their weights and the index of the position that each grid point belongs to.
+                Grid points outside the grid are left out.
+        """
 
-        indices_x = np.argsort(distances_x)[:2]
-        indices_y = np.argsort(distances_y)[:2]
-        indices_z = np.argsort(distances_z)[:2]
+        origin = np.array([self.xs[0], self.ys[0], self.zs[0]])
+        resolutions = np.array(self._settings.resolutions)
+        shape = np.array(self.shape)
 
-        sorted_x = distances_x[indices_x]
-        weights_x = sorted_x / np.sum(sorted_x)
+        fractions = (positions - origin) / resolutions
+        lower_indices = np.floor(fractions).astype(np.int64)
+        upper_weights = fractions - lower_indices
+        lower_weights = 1.0 - upper_weights
 
-        sorted_y = distances_y[indices_y]
-        weights_y = sorted_y / np.sum(sorted_y)
+        point_indices = np.arange(positions.shape[0])
 
-        sorted_z = distances_z[indices_z]
-        weights_z = sorted_z / np.sum(sorted_z)
+        all_indices = []
+        all_weights = []
+        all_point_indices = []
+        for corner in itertools.product((0, 1), repeat=3):
+            corner = np.array(corner)
 
-        indices = [indices_x, indices_y, indices_z]
-        points = list(itertools.product(*indices))
+            indices = lower_indices + corner
+            weights = np.prod(np.where(corner == 1, upper_weights, lower_weights), axis=1)
+            inside = np.all((indices >= 0) & (indices < shape), axis=1)
 
-        weight_products = list(itertools.product(weights_x, weights_y, weights_z))
-        weights = [np.sum(p) for p in weight_products]
+            all_indices.append(indices[inside])
+            all_weights.append(weights[inside])
+            all_point_indices.append(point_indices[inside])
 
-        neighbour_data = np.zeros(
-            (self.xs.shape[0], self.ys.shape[0], self.zs.shape[0])
-        )
+        indices = np.concatenate(all_indices)
 
-        for point_index, point in enumerate(points):
-            weight = weights[point_index]
+        return (indices[:, 0], indices[:, 1], indices[:, 2]), np.concatenate(all_weights), np.concatenate(all_point_indices)
 
-            neighbour_data[point] = weight * value
+    def _map_nearest_neighbours(self, positions: np.ndarray, index_names_values: List[Tuple[str, np.ndarray]]):
+        """Divides the values of all positions over the surrounding grid points at once.
+
+        Args:
+            positions (np.ndarray): Array of shape (n, 3).
+            index_names_values (List[Tuple[str, np.ndarray]]): Per feature name, an array of shape (n,), holding the values of the positions.
+        """
 
-        return neighbour_data
+        grid_indices, weights, point_indices = self._get_nearest_neighbour_weights(positions)
+
+        for index_name, values in index_names_values:
+
+            if index_name not in self._features:
+                self._features[index_name] = np.zeros(self.shape, dtype=self._settings.compute_dtype)
+
+            np.add.at(self._features[index_name], grid_indices, weights * values[point_indices])
 
     def _get_atomic_density_koes(self, position: np.ndarray, vanderwaals_radius: float) -> np.ndarray:
         """Function to map individual atomic density on the grid.
@@ -258,11 +337,9 @@ class Grid:
             np.ndarray: The mapped density.
         """
 
-        distances = np.sqrt(np.square(self.xgrid - position[0]) +
-                            np.square(self.ygrid - position[1]) +
-                            np.square(self.zgrid - position[2]))
+        distances = self._get_distances(position)
 
-        density_data = np.zeros(distances.shape)
+        density_data = np.zeros(distances.shape, dtype=distances.dtype)
 
         indices_close = distances < vanderwaals_radius
         indices_far = (distances >= vanderwaals_radius) & (distances < 1.5 * vanderwaals_radius)
@@ -302,24 +379,64 @@ class Grid:
         # map the data to the grid
         for index_name, value in index_names_values:
 
+            region = None
+
             if method == MapMethod.GAUSSIAN:
                 grid_data = self._get_mapped_feature_gaussian(position, value)
 
             elif method == MapMethod.FAST_GAUSSIAN:
-                grid_data = self._get_mapped_feature_fast_gaussian(position, value)
+                region, grid_data = self._get_mapped_feature_fast_gaussian(position, value)
 
             elif method == MapMethod.BSP_LINE:
                 grid_data = self._get_mapped_feature_bsp_line(position, value)
 
             elif method == MapMethod.NEAREST_NEIGHBOURS:
-                grid_data = self._get_mapped_feature_nearest_neighbour(position, value)
+                self._map_nearest_neighbours(np.array([position]), [(index_name, np.array([value]))])
+                continue
 
             # set to grid
-            self.add_feature_values(index_name, grid_data)
+            self.add_feature_values(index_name, grid_data, region)
+
+    def map_features(
+        self,
+        positions: np.ndarray,
+        feature_name: str,
+        feature_values: List[Union[np.ndarray, float]],
+        method: MapMethod,
+    ):
+        """Maps point feature data at the given positions to the grid, using the given method.
+
+        With nearest neighbours mapping, all points are handled at once. Other methods map the points one by one.
+
+        Args:
+            positions (np.ndarray): Array of shape (n, 3).
+            feature_name (str): Name of the feature.
+            feature_values (List[Union[np.ndarray, float]]): One value per position, either a single number or a one-dimensional array.
+            method (:class:`MapMethod`): The mapping method.
+        """
+
+        if method != MapMethod.NEAREST_NEIGHBOURS:
+            for position, feature_value in zip(positions, feature_values):
+                self.map_feature(position, feature_name, feature_value, method)
+            return
+
+        values = np.array(feature_values, dtype=self._settings.compute_dtype)
+        if values.ndim == 1:
+            index_names_values = [(feature_name, values)]
+        else:
+            index_names_values = [(f"{feature_name}_{index:03d}", values[:, index]) for index in range(values.shape[1])]
+
+        self._map_nearest_neighbours(np.asarray(positions), index_names_values)
 
     def to_hdf5(self, hdf5_path: str):
-        """Write the grid data to hdf5, according to deeprank standards."""
+        """Write the grid data to hdf5, according to deeprank standards.
+
+        Features are stored in the dtype of the grid settings.
+        If the grid settings are sparse, every feature is stored as a group
+        holding the indices and values of its nonzero grid points.
+        """
 
+        close_hdf5_file(hdf5_path)
         with h5py.File(hdf5_path, "a") as hdf5_file:
 
             # create a group to hold everything
@@ -336,9 +453,81 @@ class Grid:
             features_group = grid_group.require_group(gridstorage.MAPPED_FEATURES)
             for feature_name, feature_data in self.features.items():
 
-                features_group.create_dataset(
-                    feature_name,
-                    data=feature_data,
-                    compression="lzf",
-                    chunks=True,
-                )
+                feature_data = feature_data.astype(self._settings.dtype, copy=False)
+
+                if self._settings.sparse:
+                    _write_sparse_feature(features_group, feature_name, feature_data)
+                else:
+                    features_group.create_dataset(
+                        feature_name,
+                        data=feature_data,
+                        compression="lzf",
+                        chunks=True,
+                    )
+
+
+@lru_cache(maxsize=16)
+def _get_relative_axes(points_counts: Tuple[int, int, int],
+                       sizes: Tuple[float, float, float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The x, y, z axes of a grid, relative to its center.
+
+    These only depend on the grid settings, so they're cached and shared between all grids built with the same settings.
+    The returned arrays are read-only.
+    """
+
+    axes = []
+    for points_count, size in zip(points_counts, sizes):
+        resolution = size / points_count
+
+        min_ = -size / 2
+        max_ = min_ + (points_count - 1.0) * resolution
+
+        axis = np.linspace(min_, max_, num=points_count)
+        axis.setflags(write=False)
+        axes.append(axis)
+
+    return tuple(axes)
+
+
+def _write_sparse_feature(features_group: h5py.Group, feature_name: str, feature_data: np.ndarray):
+
+    nonzero = np.nonzero(feature_data)
+    index_type = np.min_scalar_type(max(feature_data.shape))
+
+    feature_group = features_group.create_group(feature_name)
+    feature_group.attrs[gridstorage.SPARSE_SHAPE] = feature_data.shape
+    feature_group.create_dataset(
+        gridstorage.SPARSE_INDICES,
+        data=np.stack(nonzero, axis=1).astype(index_type),
+        compression="lzf",
+        chunks=True if len(nonzero[0]) > 0 else None,
+    )
+    feature_group.create_dataset(
+        gridstorage.SPARSE_VALUES,
+        data=feature_data[nonzero],
+        compression="lzf",
+        chunks=True if len(nonzero[0]) > 0 else None,
+    )
+
+
+def read_grid_feature(feature_node: Union[h5py.Dataset, h5py.Group]) -> np.ndarray:
+    """Reads one mapped feature from an hdf5 file, as a dense array.
+
+    Args:
+        feature_node (Union[:class:`h5py.Dataset`, :class:`h5py.Group`]): Either a dense dataset or
+            a group holding the feature in sparse (COO) format.
+
+    Returns:
+        np.ndarray: The feature values on the x, y, z grid points.
+    """
+
+    if isinstance(feature_node, h5py.Dataset):
+        return feature_node[()]
+
+    indices = feature_node[gridstorage.SPARSE_INDICES][()]
+    values = feature_node[gridstorage.SPARSE_VALUES][()]
+
+    data = np.zeros(feature_node.attrs[gridstorage.SPARSE_SHAPE], dtype=values.dtype)
+    data[indices[:, 0], indices[:, 1], indices[:, 2]] = values
+
+    return data
@@ -0,0 +1,131 @@
+"""Read-only .HDF5 file handles, kept open between reads and shared by all datasets of a process.
+
+HDF5 doesn't let a process open a file for writing while it has the file open for reading. Code that writes to a file
+that datasets may have read, calls :func:`close_hdf5_file` first; the datasets open it again on their next read.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import h5py
+
+_lock = threading.RLock()
+_open_files = OrderedDict()
+_open_files_pid = os.getpid()
+_user_counts = {}
+
+
+def _get_key(hdf5_path: str) -> str:
+    return os.path.realpath(hdf5_path)
+
+
+def _check_process():
+    "drops the handles inherited from another process, after a fork, without closing them"
+
+    global _open_files, _open_files_pid, _user_counts # pylint: disable=global-statement
+
+    if _open_files_pid != os.getpid():
+        _open_files = OrderedDict()
+        _open_files_pid = os.getpid()
+        _user_counts = {}
+
+
+def get_hdf5_file(hdf5_path: str, max_open_files: int = 8) -> h5py.File:
+    """Gets a read-only handle to an .HDF5 file, opening it if needed.
+
+    Handles are reused between reads, up to max_open_files of them. The least recently used one is closed first.
+
+    Args:
+        hdf5_path (str): .HDF5 file name.
+        max_open_files (int, optional): Maximum number of files that the process keeps open. Defaults to 8.
+
+    Returns:
+        :class:`h5py.File`: The opened file.
+    """
+
+    key = _get_key(hdf5_path)
+
+    with _lock:
+        _check_process()
+
+        hdf5_file = _open_files.get(key)
+        if hdf5_file is not None and hdf5_file.id.valid:
+            _open_files.move_to_end(key)
+            return hdf5_file
+
+        _open_files.pop(key, None)
+        while len(_open_files) >= max_open_files:
+            _, least_recent_file = _open_files.popitem(last=False)
+            least_recent_file.close()
+
+        hdf5_file = h5py.File(hdf5_path, "r")
+        _open_files[key] = hdf5_file
+        return hdf5_file
+
+
+def is_hdf5_file_open(hdf5_path: str) -> bool:
+    "whether the process keeps a read-only handle to an .HDF5 file"
+
+    with _lock:
+        _check_process()
+        return _get_key(hdf5_path) in _open_files
+
+
+def close_hdf5_file(hdf5_path: str):
+    """Closes the read-only handle to an .HDF5 file, if the process keeps one.
+
+    Call this before opening the file for writing.
+
+    Args:
+        hdf5_path (str): .HDF5 file name.
+    """
+
+    with _lock:
+        _check_process()
+
+        hdf5_file = _open_files.pop(_get_key(hdf5_path), None)
+        if hdf5_file is not None:
+            hdf5_file.close()
+
+
+def use_hdf5_files(hdf5_paths: Iterable[str]):
+    """Registers a user, e.g. a dataset, of the handles to some .HDF5 files.
+
+    Args:
+        hdf5_paths (Iterable[str]): .HDF5 file names.
+    """
+
+    with _lock:
+        _check_process()
+
+        for hdf5_path in hdf5_paths:
+            key = _get_key(hdf5_path)
+            _user_counts[key] = _user_counts.get(key, 0) + 1
+
+
+def release_hdf5_files(hdf5_paths: Iterable[str], pid: int):
+    """Unregisters a user of the handles to some .HDF5 files, closing those that have no users left.
+
+    Args:
+        hdf5_paths (Iterable[str]): .HDF5 file names, as given to :func:`use_hdf5_files`.
+        pid (int): The process that the user was registered in. Users of another process are ignored.
+    """
+
+    with _lock:
+        _check_process()
+        if pid != os.getpid():
+            return
+
+        for hdf5_path in hdf5_paths:
+            key = _get_key(hdf5_path)
+            count = _user_counts.get(key, 0) - 1
+            if count > 0:
+                _user_counts[key] = count
+                continue
+
+            _user_counts.pop(key, None)
+            hdf5_file = _open_files.pop(key, None)
+            if hdf5_file is not None:
+                hdf5_file.close()
@@ -0,0 +1,215 @@
+"""Packed, memory-mappable storage of graphs, for fast random access during training.
+
+All graphs of one or more .HDF5 files are concatenated into a few .npy arrays, in one directory:
+
+- node_features.npy: float32, (total node count, node feature columns)
+- positions.npy: float32, (total node count, 3)
+- node_offsets.npy: int64, (entry count + 1,), entry i has nodes node_offsets[i] up to node_offsets[i + 1]
+- edge_indices.npy: int64, (total edge count, 2), one row per edge in one direction, indices relative to the entry's nodes
+- edge_features.npy: float32, (total edge count, edge feature columns)
+- edge_offsets.npy: int64, (entry count + 1,), like node_offsets
+- target_values.npy: float64, (entry count, target count), NaN where an entry lacks the target
+- metadata.json: the entries' .HDF5 files and names, the target names and the feature columns
+
+The arrays are opened with `np.load(mmap_mode="c")`, so slicing one entry only reads its pages from disk.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import h5py
+import numpy as np
+
+from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import nodestorage as Nfeat
+from deeprankcore.domain import targetstorage as targets
+from deeprankcore.utils.featurelayout import (get_column_count,
+                                              get_feature_columns)
+
+_log = logging.getLogger(__name__)
+
+
+METADATA_FILE = "metadata.json"
+
+_ARRAY_NAMES = ["node_features", "positions", "node_offsets",
+                "edge_indices", "edge_features", "edge_offsets", "target_values"]
+
+
+def pack_graphs( # pylint: disable=too-many-locals
+    hdf5_paths: Union[str, List[str]],
+    packed_path: str,
+    node_features: Union[List[str], str] = "all",
+    edge_features: Union[List[str], str] = "all",
+):
+    """Converts the graphs in .HDF5 files to the packed format.
+
+    Args:
+        hdf5_paths (Union[str, List[str]]): The .HDF5 files, as made by :class:`deeprankcore.query.QueryCollection`.
+        packed_path (str): Directory to write the packed arrays to.
+        node_features (Union[List[str], str], optional): Node features to pack, "all" takes the features of the first entry.
+            Defaults to "all".
+        edge_features (Union[List[str], str], optional): Edge features to pack, "all" takes the features of the first entry.
+            Defaults to "all".
+    """
+
+    if isinstance(hdf5_paths, str):
+        hdf5_paths = [hdf5_paths]
+
+    # first pass: count the nodes and edges, so that the arrays can be written in place
+    entries = []
+    node_counts = []
+    edge_counts = []
+    target_names = []
+    node_columns = None
+    edge_columns = None
+    for hdf5_path in hdf5_paths:
+        with h5py.File(hdf5_path, 'r') as hdf5_file:
+            for entry_name, entry_group in hdf5_file.items():
+                if node_columns is None:
+                    node_columns = get_feature_columns(entry_group[Nfeat.NODE], node_features)
+                    edge_columns = get_feature_columns(entry_group[Efeat.EDGE], edge_features)
+
+                entries.append((os.path.realpath(hdf5_path), entry_name))
+                node_counts.append(entry_group[f"{Nfeat.NODE}/{Nfeat.POSITION}"].shape[0])
+                edge_counts.append(entry_group[f"{Efeat.EDGE}/{Efeat.INDEX}"].shape[0])
+
+                if targets.VALUES in entry_group:
+                    target_names += [name for name in entry_group[targets.VALUES].keys() if name not in target_names]
+
+    if len(entries) == 0:
+        raise ValueError(f"No entries found in {hdf5_paths}")
+
+    node_offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+    node_offsets[1:] = np.cumsum(node_counts)
+    edge_offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+    edge_offsets[1:] = np.cumsum(edge_counts)
+
+    os.makedirs(packed_path, exist_ok=True)
+
+    def open_array(name, shape, dtype):
+        return np.lib.format.open_memmap(os.path.join(packed_path, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+    node_feature_array = open_array("node_features", (node_offsets[-1], get_column_count(node_columns)), np.float32)
+    position_array = open_array("positions", (node_offsets[-1], 3), np.float32)
+    edge_index_array = open_array("edge_indices", (edge_offsets[-1], 2), np.int64)
+    edge_feature_array = open_array("edge_features", (edge_offsets[-1], get_column_count(edge_columns)), np.float32)
+    target_array = open_array("target_values", (len(entries), len(target_names)), np.float64)
+    target_array[:] = np.nan
+
+    # second pass: copy the data
+    entry_index = 0
+    for hdf5_path in hdf5_paths:
+        with h5py.File(hdf5_path, 'r') as hdf5_file:
+            for entry_group in hdf5_file.values():
+                nodes = slice(node_offsets[entry_index], node_offsets[entry_index + 1])
+                edges = slice(edge_offsets[entry_index], edge_offsets[entry_index + 1])
+
+                node_group = entry_group[Nfeat.NODE]
+                for feature_name, (column_start, column_end) in node_columns.items():
+                    node_feature_array[nodes, column_start:column_end] = node_group[feature_name][()].reshape(nodes.stop - nodes.start, -1)
+                position_array[nodes] = node_group[Nfeat.POSITION][()]
+
+                edge_group = entry_group[Efeat.EDGE]
+                for feature_name, (column_start, column_end) in edge_columns.items():
+                    edge_feature_array[edges, column_start:column_end] = edge_group[feature_name][()].reshape(edges.stop - edges.start, -1)
+                edge_index_array[edges] = edge_group[Efeat.INDEX][()]
+
+                if targets.VALUES in entry_group:
+                    for target_name, target_node in entry_group[targets.VALUES].items():
+                        target_array[entry_index, target_names.index(target_name)] = target_node[()]
+
+                entry_index += 1
+
+    for array in (node_feature_array, position_array, edge_index_array, edge_feature_array, target_array):
+        array.flush()
+
+    np.save(os.path.join(packed_path, "node_offsets.npy"), node_offsets)
+    np.save(os.path.join(packed_path, "edge_offsets.npy"), edge_offsets)
+
+    with open(os.path.join(packed_path, METADATA_FILE), 'wt', encoding="utf-8") as metadata_file:
+        json.dump({"entries": entries,
+                   "target_names": target_names,
+                   "node_columns": node_columns,
+                   "edge_columns": edge_columns}, metadata_file)
+
+    _log.info(f"packed {len(entries)} entries from {hdf5_paths} to {packed_path}")
+
+
+class PackedGraphs:
+    def __init__(self, packed_path: str):
+        """
+        Reads graphs from the packed format, written by :func:`pack_graphs`.
+
+        Args:
+            packed_path (str): Directory with the packed arrays.
+        """
+
+        self.packed_path = packed_path
+
+        with open(os.path.join(packed_path, METADATA_FILE), 'rt', encoding="utf-8") as metadata_file:
+            metadata = json.load(metadata_file)
+
+        self.target_names = metadata["target_names"]
+        self.node_columns = {name: tuple(column_range) for name, column_range in metadata["node_columns"].items()}
+        self.edge_columns = {name: tuple(column_range) for name, column_range in metadata["edge_columns"].items()}
+        self._entry_indices = {tuple(entry): entry_index for entry_index, entry in enumerate(metadata["entries"])}
+
+        self._arrays = None
+
+    def __getstate__(self) -> dict:
+        # pickling memory maps would copy their data, the copy maps the files itself
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def _get_arrays(self) -> Dict[str, np.ndarray]:
+        if self._arrays is None:
+            # copy-on-write, so that torch tensors can share the mapped memory
+            self._arrays = {name: np.load(os.path.join(self.packed_path, f"{name}.npy"), mmap_mode="c")
+                            for name in _ARRAY_NAMES}
+        return self._arrays
+
+    def get_entry_index(self, hdf5_path: str, entry_name: str) -> Optional[int]:
+        """Looks up where an .HDF5 entry is packed.
+
+        Returns:
+            Optional[int]: The packed entry's index, or None if it's not packed.
+        """
+
+        return self._entry_indices.get((os.path.realpath(hdf5_path), entry_name))
+
+    def get_nodes(self, entry_index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Gets the node features and positions of a packed entry.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The node features and positions, views on the mapped memory.
+        """
+
+        arrays = self._get_arrays()
+        nodes = slice(*arrays["node_offsets"][entry_index:entry_index + 2])
+        return arrays["node_features"][nodes], arrays["positions"][nodes]
+
+    def get_edges(self, entry_index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Gets the edges of a packed entry, in one direction.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The edge indices, of shape (n, 2), and edge features, views on the mapped memory.
+        """
+
+        arrays = self._get_arrays()
+        edges = slice(*arrays["edge_offsets"][entry_index:entry_index + 2])
+        return arrays["edge_indices"][edges], arrays["edge_features"][edges]
+
+    def get_target_value(self, entry_index: int, target_name: str) -> Optional[float]:
+        """Gets a target value of a packed entry, None if the entry lacks it."""
+
+        if target_name not in self.target_names:
+            return None
+
+        value = self._get_arrays()["target_values"][entry_index, self.target_names.index(target_name)]
+        if np.isnan(value):
+            return None
+
+        return float(value)
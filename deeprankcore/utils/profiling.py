@@ -0,0 +1,251 @@
+"""Timing of the stages of the passes over the data, to see where training time goes.
+
+A :class:`PassProfile` records, for one pass (e.g. the training epoch or the validation of an epoch), the time spent in
+every stage, the number of samples and the sizes of the graphs, and the peak memory. Its :meth:`PassProfile.summary`
+is a flat dictionary of metrics, which the trainer logs and hands to the output exporters.
+"""
+
+import sys
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import torch
+from torch.utils.data import DataLoader
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+def get_peak_rss() -> Optional[float]:
+    """The peak resident set size (physical memory) of the process so far, in MiB.
+
+    Returns:
+        Optional[float]: The peak, or None where the platform doesn't report it.
+    """
+
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in bytes on macOS, in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return max_rss / 2**20
+    return max_rss / 2**10
+
+
+class _Stage:
+    "context manager that adds the time spent in it to a stage of a profile"
+
+    def __init__(self, profile: "PassProfile", name: str):
+        self._profile = profile
+        self._name = name
+        self._start = None
+        self._record_function = None
+
+    def __enter__(self):
+        if self._profile.record_functions:
+            self._record_function = torch.profiler.record_function(self._name)
+            self._record_function.__enter__()
+
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if self._profile.device.type == "cuda":
+            # kernels run asynchronously, wait for those of the stage
+            torch.cuda.synchronize(self._profile.device)
+
+        stage_times = self._profile.stage_times
+        stage_times[self._name] = stage_times.get(self._name, 0.0) + perf_counter() - self._start
+
+        if self._record_function is not None:
+            self._record_function.__exit__(exception_type, exception, traceback)
+            self._record_function = None
+
+
+class _NullStage:
+    "context manager that does nothing, for disabled profiles"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class PassProfile:
+    def __init__(self, enabled: bool = True, device: Optional[torch.device] = None, record_functions: bool = False):
+        """
+        Records the timings of the stages of a pass over the data.
+
+        The stages are timed with :meth:`stage`, and the batches counted with :meth:`add_batch`. A disabled profile
+        records nothing, and its stages cost next to nothing, so that the training loop can always be instrumented.
+
+        Args:
+            enabled (bool, optional): Whether to record. Defaults to True.
+            device (Optional[torch.device], optional): Device that the model runs on. On a gpu, every stage waits for its
+                kernels to finish, for its time to be accurate, and the peak gpu memory of the pass is recorded.
+                Defaults to None, the cpu.
+            record_functions (bool, optional): Whether to also label the stages in the traces of :mod:`torch.profiler`,
+                with :func:`torch.profiler.record_function`. Defaults to False.
+        """
+
+        self.enabled = enabled
+        self.device = torch.device("cpu") if device is None else torch.device(device)
+        self.record_functions = record_functions
+
+        self.stage_times = {}
+        self.num_batches = 0
+        self.num_samples = 0
+        self.num_nodes = 0
+        self.num_edges = 0
+        self.max_batch_nodes = 0
+        self.max_batch_edges = 0
+
+        self._start = None
+        self._wall_time = 0.0
+
+    def start(self):
+        "starts the wall clock of the pass"
+
+        if not self.enabled:
+            return
+
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        self._start = perf_counter()
+
+    def stop(self):
+        "stops the wall clock of the pass"
+
+        if self.enabled and self._start is not None:
+            self._wall_time += perf_counter() - self._start
+            self._start = None
+
+    def stage(self, name: str):
+        """Times a stage, as a context manager. The times of all occurrences of a stage are summed.
+
+        Args:
+            name (str): Name of the stage, e.g. "forward".
+        """
+
+        if not self.enabled:
+            return _NULL_STAGE
+
+        return _Stage(self, name)
+
+    def add_batch(self, data_batch):
+        """Counts the samples of a batch and, for graphs, its nodes and edges.
+
+        Args:
+            data_batch (:class:`torch_geometric.data.Batch`): The batch.
+        """
+
+        if not self.enabled:
+            return
+
+        self.num_batches += 1
+        self.num_samples += data_batch.num_graphs
+
+        edge_index = getattr(data_batch, "edge_index", None)
+        if edge_index is not None:
+            num_nodes = data_batch.num_nodes
+            num_edges = edge_index.shape[1]
+
+            self.num_nodes += num_nodes
+            self.num_edges += num_edges
+            self.max_batch_nodes = max(self.max_batch_nodes, num_nodes)
+            self.max_batch_edges = max(self.max_batch_edges, num_edges)
+
+    def iterate(self, loader: Iterable) -> Iterator:
+        """Iterates over a loader, timing how long every batch takes to be loaded.
+
+        With a :class:`torch.utils.data.DataLoader` that loads in the main process (num_workers=0), the loading
+        time is split into reading the entries ("read") and collating them into batches ("collate"). With workers,
+        the entries are read and collated in the workers, and only the time waiting for them is recorded ("load").
+
+        Args:
+            loader (Iterable): The loader.
+
+        Yields:
+            The batches of the loader.
+        """
+
+        if not self.enabled:
+            yield from loader
+            return
+
+        collate_fn = None
+        if isinstance(loader, DataLoader) and loader.num_workers == 0 and loader.collate_fn is not None:
+            collate_fn = loader.collate_fn
+            loader.collate_fn = self._time_collate(collate_fn)
+
+        try:
+            with self.stage("load"):
+                iterator = iter(loader)
+
+            while True:
+                with self.stage("load"):
+                    try:
+                        data_batch = next(iterator)
+                    except StopIteration:
+                        break
+
+                yield data_batch
+        finally:
+            if collate_fn is not None:
+                loader.collate_fn = collate_fn
+
+    def _time_collate(self, collate_fn: Callable) -> Callable:
+
+        def _timed_collate(batch):
+            with self.stage("collate"):
+                return collate_fn(batch)
+
+        return _timed_collate
+
+    def summary(self) -> Dict[str, float]:
+        """The metrics of the pass.
+
+        The stage times are "time/<stage>" in seconds, with "time/total" the wall time of the pass and "time/other" the
+        time spent outside of the stages. "samples_per_second" is the throughput over the wall time. For graphs, the
+        mean number of nodes and edges per graph and the maximum per batch are given. "peak_rss_mb" is the peak
+        physical memory of the process so far (it's not reset between passes) and "peak_cuda_memory_mb" that of the pass
+        on the gpu.
+
+        Returns:
+            Dict[str, float]: The metrics, by name.
+        """
+
+        stage_times = dict(self.stage_times)
+        if "collate" in stage_times:
+            # collation happened while loading, the rest of the loading time is reading
+            stage_times["read"] = stage_times.pop("load", 0.0) - stage_times["collate"]
+
+        metrics = {f"time/{name}": duration for name, duration in stage_times.items()}
+        metrics["time/total"] = self._wall_time
+        metrics["time/other"] = max(self._wall_time - sum(stage_times.values()), 0.0)
+
+        metrics["batches"] = self.num_batches
+        metrics["samples"] = self.num_samples
+        metrics["samples_per_second"] = self.num_samples / self._wall_time if self._wall_time > 0.0 else 0.0
+
+        if self.num_nodes > 0 and self.num_samples > 0:
+            metrics["mean_nodes_per_graph"] = self.num_nodes / self.num_samples
+            metrics["mean_edges_per_graph"] = self.num_edges / self.num_samples
+            metrics["max_nodes_per_batch"] = self.max_batch_nodes
+            metrics["max_edges_per_batch"] = self.max_batch_edges
+
+        peak_rss = get_peak_rss()
+        if peak_rss is not None:
+            metrics["peak_rss_mb"] = peak_rss
+
+        if self.device.type == "cuda":
+            metrics["peak_cuda_memory_mb"] = torch.cuda.max_memory_allocated(self.device) / 2**20
+
+        return metrics
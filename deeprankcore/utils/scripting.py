@@ -0,0 +1,81 @@
+"""Export of graph neural networks to TorchScript, for inference without deeprankcore.
+
+A scripted model is a single file that torch loads with its weights and code, for instance in a prediction service:
+
+    import torch
+    import torch_scatter  # registers the scatter operations that the networks use
+
+    model = torch.jit.load("model.pt")
+    outputs = model(x, edge_index, edge_attr, batch, cluster0, cluster1)
+
+where the arguments are the tensors of a batch of graphs, as in a :class:`torch_geometric.data.Batch` loaded from a
+:class:`deeprankcore.dataset.GraphDataset`. The clusters are only required by networks that pool them, like GINet.
+Loading a model needs torch and torch_scatter, but not deeprankcore or torch_geometric.
+"""
+
+import copy
+from typing import Optional
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor, nn
+
+
+class GraphInference(nn.Module):
+    def __init__(self, model: nn.Module, classification: bool):
+        """
+        Runs a graph neural network on the tensors of a batch and formats its output like :meth:`deeprankcore.trainer.Trainer.predict`.
+
+        Args:
+            model (nn.Module): The network, with a `forward_tensors(x, edge_index, edge_attr, batch, cluster0, cluster1)` method,
+                like the networks in `deeprankcore.neuralnets.gnn`.
+            classification (bool): Whether the network classifies, in which case the output is the probability of every class.
+                Otherwise it's one value per graph.
+        """
+
+        super().__init__()
+
+        if not hasattr(model, "forward_tensors"):
+            raise TypeError(f"{type(model).__name__} has no forward_tensors method to run it on the tensors of a batch")
+
+        self.model = model
+        self.classification = classification
+
+    def forward( # pylint: disable=too-many-arguments
+        self,
+        x: Tensor,
+        edge_index: Tensor,
+        edge_attr: Tensor,
+        batch: Tensor,
+        cluster0: Optional[Tensor] = None,
+        cluster1: Optional[Tensor] = None,
+    ) -> Tensor:
+
+        output = self.model.forward_tensors(x, edge_index, edge_attr, batch, cluster0, cluster1)
+
+        if self.classification:
+            return F.softmax(output, dim=1)
+
+        return output.reshape(-1)
+
+
+def script_model(model: nn.Module, classification: bool) -> torch.jit.ScriptModule:
+    """Compiles a graph neural network with TorchScript, for inference on the cpu.
+
+    The network itself is left as it is: a copy of it is moved to the cpu, set in evaluation mode and compiled.
+
+    Args:
+        model (nn.Module): The network, as for :class:`GraphInference`.
+        classification (bool): Whether the network classifies.
+
+    Returns:
+        torch.jit.ScriptModule: The compiled :class:`GraphInference` of the network, which :func:`torch.jit.save` saves.
+    """
+
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+
+    inference_model = GraphInference(copy.deepcopy(model).cpu(), classification)
+    inference_model.eval()
+
+    return torch.jit.script(inference_model)
@@ -0,0 +1,101 @@
+"""Random, stratified and group-aware splits of dataset indices.
+
+Stratified splits keep the proportion of every label (e.g. class) the same on both sides. Group-aware splits keep the
+entries of a group (e.g. the models of one PDB complex) together on one side, so that no group leaks from one side to
+the other.
+"""
+
+from typing import Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def _split_stratified(labels: np.ndarray, split_size: int) -> Tuple[np.ndarray, np.ndarray]:
+
+    _, label_indices = np.unique(labels, return_inverse=True)
+    label_indices = label_indices.reshape(-1)
+    label_counts = np.bincount(label_indices)
+
+    # share out the split over the labels by largest remainder, so that the shares add up to split_size,
+    # on equal remainders favouring the labels with the smallest shares
+    shares = label_counts * split_size / len(labels)
+    label_split_sizes = np.floor(shares).astype(np.int64)
+    remainders = shares - label_split_sizes
+    for label_index in np.lexsort((label_split_sizes, -remainders))[:split_size - label_split_sizes.sum()]:
+        label_split_sizes[label_index] += 1
+
+    main_indices = []
+    split_off_indices = []
+    for label_index, label_split_size in enumerate(label_split_sizes):
+        indices = np.random.permutation(np.flatnonzero(label_indices == label_index))
+        split_off_indices.append(indices[:label_split_size])
+        main_indices.append(indices[label_split_size:])
+
+    return (np.random.permutation(np.concatenate(main_indices)),
+            np.random.permutation(np.concatenate(split_off_indices)))
+
+
+def _split_grouped(groups: Sequence[Hashable], split_size: int) -> Tuple[np.ndarray, np.ndarray]:
+
+    group_indices = {}
+    for index, group in enumerate(groups):
+        group_indices.setdefault(group, []).append(index)
+
+    # whole groups, in random order, go to the split until it's big enough
+    main_indices = []
+    split_off_indices = []
+    group_list = list(group_indices.values())
+    for group_index in np.random.permutation(len(group_list)):
+        if len(split_off_indices) < split_size:
+            split_off_indices += group_list[group_index]
+        else:
+            main_indices += group_list[group_index]
+
+    return np.array(main_indices, dtype=np.int64), np.array(split_off_indices, dtype=np.int64)
+
+
+def split_indices(
+    size: int,
+    split_size: int,
+    labels: Optional[np.ndarray] = None,
+    groups: Optional[Sequence[Hashable]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Splits the indices of a dataset in two, at random.
+
+    Uses numpy's global random number generator, like `np.random.shuffle`.
+
+    Args:
+        size (int): Number of entries in the dataset.
+        split_size (int): Number of entries to split off.
+        labels (Optional[np.ndarray], optional): Label of every entry, to stratify the split on. Defaults to None.
+        groups (Optional[Sequence[Hashable]], optional): Group of every entry, to keep together. The split then holds whole
+            groups, up to the first group that makes it at least split_size entries big. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The indices of the remaining entries and of the split off entries.
+
+    Raises:
+        ValueError: If both labels and groups are given, or they don't match the size, or all entries end up on one side.
+    """
+
+    if labels is not None and groups is not None:
+        raise ValueError("A split can be either stratified or grouped, not both")
+
+    if labels is not None:
+        if len(labels) != size:
+            raise ValueError(f"Got {len(labels)} labels for {size} entries")
+        main_indices, split_off_indices = _split_stratified(np.asarray(labels), split_size)
+
+    elif groups is not None:
+        if len(groups) != size:
+            raise ValueError(f"Got {len(groups)} groups for {size} entries")
+        main_indices, split_off_indices = _split_grouped(groups, split_size)
+
+    else:
+        indices = np.random.permutation(size)
+        main_indices, split_off_indices = indices[split_size:], indices[:split_size]
+
+    if len(main_indices) == 0 or (split_size > 0 and len(split_off_indices) == 0):
+        raise ValueError(f"Splitting {split_size} of {size} entries leaves one side empty")
+
+    return main_indices, split_off_indices
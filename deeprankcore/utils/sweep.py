@@ -0,0 +1,284 @@
+"""Runs of many trainer configurations on the same datasets, e.g. for a hyperparameter search.
+
+The datasets are built once, by the caller, and their graphs clustered once. Every configuration then trains its own
+:class:`deeprankcore.trainer.Trainer` on them, in a pool of processes, each process getting the datasets once:
+
+    from deeprankcore.utils.datacache import DataCache
+    from deeprankcore.utils.sweep import SweepConfiguration, run_sweep
+
+    if __name__ == "__main__":
+        cache = DataCache(max_bytes=8 * 2**30, policy="static", shared=True)
+        dataset_train = GraphDataset(hdf5_path="train.hdf5", target="binary", cache=cache)
+        dataset_val = GraphDataset(hdf5_path="valid.hdf5", target="binary", cache=cache)
+
+        configurations = [
+            SweepConfiguration(f"lr{lr}", GINet, optimizer_options={"lr": lr}, train_options={"nepoch": 20, "validate": True})
+            for lr in (1e-2, 1e-3, 1e-4)
+        ]
+        results = run_sweep(configurations, dataset_train, dataset_val, num_processes=3)
+
+The processes are spawned, hence the `if __name__ == "__main__"` guard. Datasets with a shared
+:class:`deeprankcore.utils.datacache.DataCache` are preloaded before the processes start, which then share the decoded
+graphs instead of each reading them from the .HDF5 files; so do datasets reading from a packed_path, through the page
+cache.
+"""
+
+import logging
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+from typing import Any, Dict, List, Optional, Union
+
+import torch
+import torch.multiprocessing
+
+from deeprankcore.dataset import GraphDataset, GridDataset
+from deeprankcore.trainer import Trainer
+from deeprankcore.utils.community_pooling import precluster_dataset
+from deeprankcore.utils.exporters import HDF5OutputExporter, OutputExporter
+
+_log = logging.getLogger(__name__)
+
+
+class SweepConfiguration:
+    def __init__( # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        neuralnet,
+        trainer_options: Optional[Dict[str, Any]] = None,
+        optimizer_options: Optional[Dict[str, Any]] = None,
+        train_options: Optional[Dict[str, Any]] = None,
+        test_options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        A configuration of a trainer to run in a sweep.
+
+        Args:
+            name (str): Name of the configuration, unique within the sweep. Its outputs and models are stored in a directory
+                of that name.
+            neuralnet (child class of :class:`torch.nn.Module`): Neural network class, as for :class:`deeprankcore.trainer.Trainer`.
+            trainer_options (Optional[Dict[str, Any]], optional): Other arguments of :class:`deeprankcore.trainer.Trainer`,
+                e.g. class_weights. The datasets and output exporters are set by the sweep. Defaults to None.
+            optimizer_options (Optional[Dict[str, Any]], optional): Arguments of
+                :meth:`deeprankcore.trainer.Trainer.configure_optimizers`, e.g. lr. Defaults to None, for the default optimizer.
+            train_options (Optional[Dict[str, Any]], optional): Arguments of :meth:`deeprankcore.trainer.Trainer.train`,
+                e.g. nepoch. output_prefix defaults to "model" in the configuration's directory. Defaults to None.
+            test_options (Optional[Dict[str, Any]], optional): Arguments of :meth:`deeprankcore.trainer.Trainer.test`,
+                to test the trained model when the sweep has a test dataset. Defaults to None.
+        """
+
+        if not name or os.path.basename(name) != name:
+            raise ValueError(f"Invalid configuration name {name!r}, it names a directory and can't contain path separators")
+
+        for key in ("dataset_train", "dataset_val", "dataset_test", "output_exporters", "pretrained_model"):
+            if key in (trainer_options or {}):
+                raise ValueError(f"{key} is set by the sweep, it can't be a trainer option of configuration {name}")
+
+        self.name = name
+        self.neuralnet = neuralnet
+        self.trainer_options = trainer_options or {}
+        self.optimizer_options = optimizer_options or {}
+        self.train_options = train_options or {}
+        self.test_options = test_options or {}
+
+
+class SweepResult:
+    def __init__( # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        losses: Dict[str, Dict[int, float]],
+        epoch_saved_model: Optional[int],
+        output_directory: str,
+        duration: float,
+        error: Optional[str] = None,
+    ):
+        """
+        The result of running a configuration of a sweep.
+
+        Args:
+            name (str): Name of the configuration.
+            losses (Dict[str, Dict[int, float]]): The loss of every pass, by pass name ("training", "validation" or "testing")
+                and epoch. Epoch 0 is the evaluation before training.
+            epoch_saved_model (Optional[int]): Epoch of the saved model, None if no model was saved.
+            output_directory (str): Directory with the configuration's outputs and models.
+            duration (float): Time the configuration took to run, in seconds.
+            error (Optional[str], optional): The error that the configuration failed with, with its traceback.
+                Defaults to None, for a successful run.
+        """
+
+        self.name = name
+        self.losses = losses
+        self.epoch_saved_model = epoch_saved_model
+        self.output_directory = output_directory
+        self.duration = duration
+        self.error = error
+
+    @property
+    def best_validation_loss(self) -> Optional[float]:
+        "the lowest validation loss after training, None if the configuration didn't validate"
+
+        validation_losses = [loss for epoch, loss in self.losses.get("validation", {}).items() if epoch > 0]
+        return min(validation_losses) if len(validation_losses) > 0 else None
+
+
+class _LossRecorder(OutputExporter):
+    "keeps the loss of every pass"
+
+    def __init__(self, directory_path: str):
+        super().__init__(directory_path)
+        self.losses = {}
+
+    def process_chunk(self, pass_name: str, epoch_number: int, # pylint: disable=too-many-arguments
+                      entry_names: List[str], output_values: List[Any], target_values: List[Any]):
+        pass # pylint: disable=unnecessary-pass
+
+    def end_pass(self, pass_name: str, epoch_number: int, loss: float):
+        self.losses.setdefault(pass_name, {})[epoch_number] = loss
+
+
+def _run_configuration(
+    configuration: SweepConfiguration,
+    datasets: Dict[str, Optional[Union[GraphDataset, GridDataset]]],
+    output_directory: str,
+) -> SweepResult:
+    "trains a trainer of the configuration, the errors are reported in the result rather than raised"
+
+    directory_path = os.path.join(output_directory, configuration.name)
+    loss_recorder = _LossRecorder(directory_path)
+    epoch_saved_model = None
+
+    t0 = time()
+    try:
+        trainer_options = {"precluster": False, **configuration.trainer_options}
+        trainer = Trainer(
+            configuration.neuralnet,
+            datasets["train"],
+            datasets["val"],
+            datasets["test"],
+            output_exporters=[HDF5OutputExporter(directory_path), loss_recorder],
+            **trainer_options,
+        )
+        if len(configuration.optimizer_options) > 0:
+            trainer.configure_optimizers(**configuration.optimizer_options)
+
+        train_options = {"output_prefix": os.path.join(directory_path, "model"), **configuration.train_options}
+        trainer.train(**train_options)
+        epoch_saved_model = trainer.epoch_saved_model
+
+        if datasets["test"] is not None:
+            trainer.test(**configuration.test_options)
+
+        error = None
+
+    except Exception: # pylint: disable=broad-except
+        error = traceback.format_exc()
+        _log.error(f"configuration {configuration.name} failed:\n{error}")
+
+    return SweepResult(configuration.name, loss_recorder.losses, epoch_saved_model, directory_path, time() - t0, error)
+
+
+# the datasets of a sweep's process, given once when it starts
+_process_datasets = None
+
+
+def _init_process(datasets: Dict[str, Optional[Union[GraphDataset, GridDataset]]], num_threads: int):
+
+    global _process_datasets # pylint: disable=global-statement
+    _process_datasets = datasets
+
+    torch.set_num_threads(num_threads)
+
+
+def _run_configuration_in_process(configuration: SweepConfiguration, output_directory: str) -> SweepResult:
+    return _run_configuration(configuration, _process_datasets, output_directory)
+
+
+def run_sweep( # pylint: disable=too-many-arguments, too-many-locals
+    configurations: List[SweepConfiguration],
+    dataset_train: Union[GraphDataset, GridDataset],
+    dataset_val: Optional[Union[GraphDataset, GridDataset]] = None,
+    dataset_test: Optional[Union[GraphDataset, GridDataset]] = None,
+    num_processes: int = 1,
+    num_threads: Optional[int] = None,
+    output_directory: str = "./sweep",
+) -> List[SweepResult]:
+    """Trains a trainer of every configuration on the same datasets, in parallel processes.
+
+    The graphs of datasets with a clustering_method are clustered once, here, and the trainers use the stored clusters.
+    Datasets with a shared cache are preloaded into it before the processes start, so that the processes share the
+    decoded graphs. Pass a validation dataset, so that all configurations validate on the same entries, rather than on
+    their own random val_size split.
+
+    Configurations that fail don't stop the sweep, their error is given in their result.
+
+    Args:
+        configurations (List[:class:`SweepConfiguration`]): The configurations, with unique names.
+        dataset_train (:class:`GraphDataset` or :class:`GridDataset`): The training set.
+        dataset_val (Optional[:class:`GraphDataset` or :class:`GridDataset`], optional): The validation set. Defaults to None.
+        dataset_test (Optional[:class:`GraphDataset` or :class:`GridDataset`], optional): The test set, that the trained models are
+            tested on. Defaults to None.
+        num_processes (int, optional): Number of configurations to run at the same time, each in its own process.
+            1 runs them one after the other, in this process. Defaults to 1.
+        num_threads (Optional[int], optional): Number of threads of torch in every process. Defaults to None, which
+            divides the cpus over the processes, or keeps torch's setting when running in this process.
+        output_directory (str, optional): Directory with a subdirectory of outputs and models for every configuration.
+            Defaults to "./sweep".
+
+    Returns:
+        List[:class:`SweepResult`]: The results, in the order of the configurations.
+    """
+
+    if num_processes < 1:
+        raise ValueError(f"num_processes must be at least 1, got {num_processes}")
+
+    names = [configuration.name for configuration in configurations]
+    if len(set(names)) != len(names):
+        raise ValueError(f"The names of the configurations must be unique, got {names}")
+
+    datasets = {"train": dataset_train, "val": dataset_val, "test": dataset_test}
+
+    for dataset in datasets.values():
+        if dataset is None:
+            continue
+
+        clustering_method = getattr(dataset, "clustering_method", None)
+        if clustering_method is not None:
+            _log.info(f"clustering the graphs of {dataset.hdf5_path} with {clustering_method}")
+            precluster_dataset(dataset, clustering_method)
+
+        if dataset.cache is not None and dataset.cache.shared:
+            dataset.preload_cache()
+
+    # the processes open their own files
+    for dataset in datasets.values():
+        if dataset is not None:
+            dataset.close_hdf5_files()
+
+    _log.info(f"running {len(configurations)} configurations, {num_processes} at a time")
+
+    if num_processes == 1:
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        return [_run_configuration(configuration, datasets, output_directory) for configuration in configurations]
+
+    if num_threads is None:
+        num_threads = max(1, (os.cpu_count() or 1) // num_processes)
+
+    # spawned rather than forked: forking a process with threads (of torch, h5py or background writers) isn't safe.
+    # The datasets are pickled with torch's reductions, which pass the tensors in shared memory by reference.
+    with ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=torch.multiprocessing.get_context("spawn"),
+        initializer=_init_process,
+        initargs=(datasets, num_threads),
+    ) as executor:
+        futures = [executor.submit(_run_configuration_in_process, configuration, output_directory)
+                   for configuration in configurations]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        if result.error is None:
+            _log.info(f"configuration {result.name} ran in {result.duration:.1f}s, best validation loss {result.best_validation_loss}")
+
+    return results
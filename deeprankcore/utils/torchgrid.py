@@ -0,0 +1,224 @@
+"""This module maps point features to 3D grids with PyTorch, for whole batches of graphs at once.
+
+It mirrors the mapping methods of :class:`deeprankcore.utils.grid.Grid`, but works on tensors, so that the mapping can
+run inside a DataLoader, use PyTorch's intra-op threading and directly produce the (batch, channels, x, y, z) tensors
+that the 3D CNNs take as input.
+"""
+
+import logging
+from math import comb, factorial
+from typing import List, Optional
+
+import torch
+from torch import Tensor
+from torch_geometric.data.data import Data
+
+from deeprankcore.utils.grid import GridSettings, MapMethod, _get_relative_axes
+
+_log = logging.getLogger(__name__)
+
+
+# maximum number of (point, grid point) pairs to hold in memory at once, for the methods that cover the whole grid
+_MAX_CHUNK_ELEMENTS = 2 ** 24
+
+
+def _bspline(x: Tensor, order: int) -> Tensor:
+    "centered B-spline basis function, equal to scipy.signal.bspline"
+
+    result = torch.zeros_like(x)
+    for k in range(order + 2):
+        shifted = torch.clamp(x + (order + 1) / 2.0 - k, min=0.0)
+        result += (-1) ** k * comb(order + 1, k) * shifted ** order
+
+    return result / factorial(order)
+
+
+def _get_relative_grid_points(settings: GridSettings, dtype: torch.dtype, device: torch.device) -> List[Tensor]:
+    "the x, y, z axes of the grid, relative to its center"
+
+    return [torch.tensor(axis, dtype=dtype, device=device)
+            for axis in _get_relative_axes(tuple(settings.points_counts), tuple(settings.sizes))]
+
+
+def _get_point_weights(relative_positions: Tensor, axes: List[Tensor],
+                       settings: GridSettings, method: MapMethod) -> Tensor:
+    """Weights of every grid point for a chunk of positions.
+
+    Returns:
+        Tensor: Of shape (n, x * y * z).
+    """
+
+    if method == MapMethod.BSP_LINE:
+        order = 4
+        bsp_x, bsp_y, bsp_z = [_bspline((axis[None, :] - relative_positions[:, i:i + 1]) / settings.resolutions[i], order)
+                               for i, axis in enumerate(axes)]
+
+        return (bsp_x[:, :, None, None] * bsp_y[:, None, :, None] * bsp_z[:, None, None, :]).reshape(relative_positions.shape[0], -1)
+
+    # gaussian methods
+    beta = 1.0
+    square_distances = ((axes[0][None, :] - relative_positions[:, 0:1]) ** 2)[:, :, None, None] + \
+                       ((axes[1][None, :] - relative_positions[:, 1:2]) ** 2)[:, None, :, None] + \
+                       ((axes[2][None, :] - relative_positions[:, 2:3]) ** 2)[:, None, None, :]
+    distances = torch.sqrt(square_distances).reshape(relative_positions.shape[0], -1)
+
+    weights = torch.exp(-beta * distances)
+    if method == MapMethod.FAST_GAUSSIAN:
+        cutoff = 5.0 * beta
+        weights = torch.where(distances < cutoff, weights, torch.zeros_like(weights))
+
+    return weights
+
+
+def _map_nearest_neighbours(output: Tensor, relative_positions: Tensor, values: Tensor,
+                            batch: Tensor, axes: List[Tensor], settings: GridSettings):
+    "divides the values over the 8 surrounding grid points with trilinear weights, adds them to the output"
+
+    batch_size, channel_count = output.shape[:2]
+    shape = torch.tensor([axis.shape[0] for axis in axes], device=output.device)
+    origin = torch.stack([axis[0] for axis in axes])
+    resolutions = torch.tensor(settings.resolutions, dtype=relative_positions.dtype, device=output.device)
+
+    fractions = (relative_positions - origin) / resolutions
+    lower_indices = torch.floor(fractions).long()
+    upper_weights = fractions - lower_indices
+    lower_weights = 1.0 - upper_weights
+
+    # accumulate in a (batch * grid points, channels) layout, so that one index addresses all channels
+    flat_output = torch.zeros(batch_size * int(shape.prod()), channel_count, dtype=output.dtype, device=output.device)
+
+    for corner in ((0, 0, 0), (0, 0, 1), (0, 1, 0), (0, 1, 1), (1, 0, 0), (1, 0, 1), (1, 1, 0), (1, 1, 1)):
+        corner = torch.tensor(corner, device=output.device)
+
+        indices = lower_indices + corner
+        weights = torch.where(corner == 1, upper_weights, lower_weights).prod(dim=1)
+        inside = ((indices >= 0) & (indices < shape)).all(dim=1)
+
+        indices = indices[inside]
+        flat_indices = ((batch[inside] * shape[0] + indices[:, 0]) * shape[1] + indices[:, 1]) * shape[2] + indices[:, 2]
+
+        flat_output.index_add_(0, flat_indices, weights[inside, None] * values[inside])
+
+    output += flat_output.view(batch_size, *shape.tolist(), channel_count).permute(0, 4, 1, 2, 3)
+
+
+def map_to_grid( # pylint: disable=too-many-arguments, too-many-locals
+    positions: Tensor,
+    values: Tensor,
+    batch: Tensor,
+    centers: Tensor,
+    settings: GridSettings,
+    method: MapMethod
+) -> Tensor:
+    """Maps point features of a batch of graphs to one grid per graph.
+
+    Args:
+        positions (Tensor): Point positions, of shape (n, 3).
+        values (Tensor): Point feature values, of shape (n, channels).
+        batch (Tensor): For each point, the index of the graph it belongs to, of shape (n,).
+        centers (Tensor): The grid center of each graph, of shape (batch, 3).
+        settings (:class:`GridSettings`): The grid settings, shared by all graphs.
+        method (:class:`MapMethod`): The mapping method.
+
+    Returns:
+        Tensor: The mapped features, of shape (batch, channels, x, y, z).
+    """
+
+    dtype = values.dtype if values.is_floating_point() else torch.float32
+    device = values.device
+
+    values = values.to(dtype)
+    relative_positions = positions.to(dtype) - centers.to(dtype)[batch]
+
+    axes = _get_relative_grid_points(settings, dtype, device)
+    batch_size = centers.shape[0]
+    channel_count = values.shape[1]
+    grid_point_count = int(settings.points_counts[0] * settings.points_counts[1] * settings.points_counts[2])
+
+    output = torch.zeros(batch_size, channel_count, *settings.points_counts, dtype=dtype, device=device)
+
+    if method == MapMethod.NEAREST_NEIGHBOURS:
+        _map_nearest_neighbours(output, relative_positions, values, batch, axes, settings)
+        return output
+
+    flat_output = output.view(batch_size * channel_count, grid_point_count)
+
+    chunk_size = max(1, _MAX_CHUNK_ELEMENTS // grid_point_count)
+    for chunk_start in range(0, relative_positions.shape[0], chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+
+        weights = _get_point_weights(relative_positions[chunk], axes, settings, method)
+
+        # spread the values over a (batch * channels, points) matrix, so that one product adds them all to the right grids
+        chunk_values = values[chunk]
+        chunk_batch = batch[chunk]
+        point_values = torch.zeros(batch_size, channel_count, chunk_values.shape[0], dtype=dtype, device=device)
+        point_values[chunk_batch, :, torch.arange(chunk_values.shape[0], device=device)] = chunk_values
+
+        flat_output += point_values.view(batch_size * channel_count, -1) @ weights
+
+    return output
+
+
+class GridCollater:
+    """Collate function that maps a list of graphs to a batch of grids.
+
+    Use it with a :class:`torch.utils.data.DataLoader` over a :class:`deeprankcore.dataset.GraphDataset`,
+    to feed 3D CNNs without preprocessing the grids to .HDF5 files.
+    Node features are mapped at the node positions and, if present, edge features at the positions of both nodes
+    of the edge. The channels are the node features, followed by the edge features.
+    """
+
+    def __init__(self, settings: GridSettings, method: MapMethod, map_edge_features: bool = True):
+        """
+        Args:
+            settings (:class:`GridSettings`): The grid settings.
+            method (:class:`MapMethod`): The mapping method.
+            map_edge_features (bool, optional): Whether to map the edge features too. Defaults to True.
+        """
+
+        self._settings = settings
+        self._method = method
+        self._map_edge_features = map_edge_features
+
+    def __call__(self, data_list: List[Data]) -> Data:
+
+        node_positions = []
+        node_values = []
+        node_batch = []
+        edge_positions = []
+        edge_values = []
+        edge_batch = []
+        centers = []
+        targets = []
+
+        for index, data in enumerate(data_list):
+            node_positions.append(data.pos)
+            node_values.append(data.x)
+            node_batch.append(torch.full((data.pos.shape[0],), index, dtype=torch.long))
+            centers.append(data.pos.mean(dim=0))
+
+            if self._map_edge_features and data.edge_attr is not None:
+                # edges are stored in both directions, so the first node of each covers both ends
+                edge_positions.append(data.pos[data.edge_index[0]])
+                edge_values.append(data.edge_attr)
+                edge_batch.append(torch.full((data.edge_index.shape[1],), index, dtype=torch.long))
+
+            if data.y is not None:
+                targets.append(data.y)
+
+        centers = torch.stack(centers)
+        grids = map_to_grid(torch.cat(node_positions), torch.cat(node_values), torch.cat(node_batch),
+                            centers, self._settings, self._method)
+
+        if len(edge_values) > 0 and edge_values[0].shape[1] > 0:
+            edge_grids = map_to_grid(torch.cat(edge_positions), torch.cat(edge_values), torch.cat(edge_batch),
+                                     centers, self._settings, self._method)
+            grids = torch.cat((grids, edge_grids), dim=1)
+
+        y: Optional[Tensor] = torch.cat(targets) if len(targets) == len(data_list) else None
+
+        batch_data = Data(x=grids, y=y)
+        batch_data.entry_names = [data.entry_names for data in data_list]
+
+        return batch_data
@@ -0,0 +1,24 @@
+import os
+import shutil
+from tempfile import mkdtemp
+
+import pytest
+
+from deeprankcore.utils.catalogue import SIDECAR_DIRECTORY_VARIABLE
+
+
+@pytest.fixture(scope="session", autouse=True)
+def sidecar_directory():
+    "keeps the sidecar files, like catalogues, out of the test data directory"
+
+    directory = mkdtemp()
+    previous_directory = os.environ.get(SIDECAR_DIRECTORY_VARIABLE)
+    os.environ[SIDECAR_DIRECTORY_VARIABLE] = directory
+
+    yield directory
+
+    if previous_directory is None:
+        del os.environ[SIDECAR_DIRECTORY_VARIABLE]
+    else:
+        os.environ[SIDECAR_DIRECTORY_VARIABLE] = previous_directory
+    shutil.rmtree(directory)
@@ -1,16 +1,27 @@
+import gc
 import os
+import shutil
 import unittest
+from copy import deepcopy
 from shutil import rmtree
 from tempfile import mkdtemp
 
 import h5py
 import numpy as np
+import pandas as pd
+import torch
 from torch_geometric.loader import DataLoader
 
-from deeprankcore.dataset import GraphDataset, GridDataset, save_hdf5_keys
+from deeprankcore.dataset import (GraphDataset, GridDataset,
+                                  hdf5_worker_init_fn, save_hdf5_keys)
 from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import gridstorage
 from deeprankcore.domain import nodestorage as Nfeat
 from deeprankcore.domain import targetstorage as targets
+from deeprankcore.utils.community_pooling import precluster_dataset
+from deeprankcore.utils.datacache import DataCache
+from deeprankcore.utils.grid import Grid, GridSettings, MapMethod
+from deeprankcore.utils.hdf5files import is_hdf5_file_open
 
 node_feats = [Nfeat.RESTYPE, Nfeat.POLARITY, Nfeat.BSA, Nfeat.RESDEPTH, Nfeat.HSE, Nfeat.INFOCONTENT, Nfeat.PSSM]
 
@@ -93,8 +104,35 @@ class TestDataSet(unittest.TestCase):
         # 1 entry with class value
         assert dataset[0].y.shape == (1,)
 
+    def test_grid_dataset_low_precision_sparse(self):
+        tmp_dir_path = mkdtemp()
+        hdf5_path = os.path.join(tmp_dir_path, "grid.hdf5")
+        try:
+            for entry_index, settings in enumerate([GridSettings([20, 20, 20], [20.0, 20.0, 20.0], sparse=True, dtype=np.float16),
+                                                    GridSettings([20, 20, 20], [20.0, 20.0, 20.0])]):
+                grid = Grid(f"entry{entry_index}", [0.0, 0.0, 0.0], settings)
+                grid.map_feature(np.array([1.0, 2.0, 3.0]), Efeat.VDW, 0.5, MapMethod.FAST_GAUSSIAN)
+                grid.to_hdf5(hdf5_path)
+
+                with h5py.File(hdf5_path, 'a') as hdf5_file:
+                    hdf5_file[f"entry{entry_index}"].require_group(targets.VALUES).create_dataset(targets.IRMSD, data=1.0)
+
+            with h5py.File(hdf5_path, 'r') as hdf5_file:
+                assert hdf5_file[f"entry0/{gridstorage.MAPPED_FEATURES}/{Efeat.VDW}/{gridstorage.SPARSE_VALUES}"].dtype == np.float16
+                assert hdf5_file[f"entry1/{gridstorage.MAPPED_FEATURES}/{Efeat.VDW}"].dtype == np.float32
+
+            dataset = GridDataset(hdf5_path, features=[Efeat.VDW], target=targets.IRMSD)
+            sparse_data = dataset.load_one_grid(hdf5_path, "entry0")
+            dense_data = dataset.load_one_grid(hdf5_path, "entry1")
+
+            assert sparse_data.x.dtype == dense_data.x.dtype == torch.float32
+            assert sparse_data.x.shape == dense_data.x.shape == (1, 1, 20, 20, 20)
+            assert torch.allclose(sparse_data.x, dense_data.x, atol=1e-3)
+        finally:
+            rmtree(tmp_dir_path)
+
     def test_dataset_filter(self):
-        GraphDataset(
+        dataset = GraphDataset(
             hdf5_path=self.hdf5_path,
             node_features=node_feats,
             edge_features=[Efeat.DISTANCE],
@@ -103,6 +141,40 @@ class TestDataSet(unittest.TestCase):
             target_filter={targets.IRMSD: "<10"},
         )
 
+        with h5py.File(self.hdf5_path, 'r') as f5:
+            irmsds = {entry_name: f5[f"{entry_name}/{targets.VALUES}/{targets.IRMSD}"][()] for entry_name in f5.keys()}
+
+        assert [entry_name for _, entry_name in dataset.index_entries] == \
+            [entry_name for entry_name, irmsd in irmsds.items() if irmsd < 10]
+
+        dataset = GraphDataset(
+            hdf5_path=self.hdf5_path,
+            node_features=node_feats,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.IRMSD,
+            target_filter={targets.IRMSD: "<15.5"},
+        )
+        assert len(dataset) > 0
+        assert [entry_name for _, entry_name in dataset.index_entries] == \
+            [entry_name for entry_name, irmsd in irmsds.items() if irmsd < 15.5]
+
+        threshold = sorted(irmsds.values())[1]
+        dataset = GraphDataset(
+            hdf5_path=self.hdf5_path,
+            node_features=node_feats,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.IRMSD,
+            target_filter={targets.IRMSD: f">={threshold} and <1e6", "unknown": "==1"},
+        )
+        assert len(dataset) == len(irmsds) - 1
+
+        with self.assertRaises(ValueError):
+            GraphDataset(
+                hdf5_path=self.hdf5_path,
+                target=targets.IRMSD,
+                target_filter={targets.IRMSD: "in [1, 2]"},
+            )
+
     def test_multi_file_dataset(self):
         dataset = GraphDataset(
             hdf5_path=["tests/data/hdf5/train.hdf5", "tests/data/hdf5/valid.hdf5"],
@@ -114,6 +186,129 @@ class TestDataSet(unittest.TestCase):
         assert dataset.len() > 0
         assert dataset.get(0) is not None
 
+    def test_integrity_check(self):
+        tmp_dir_path = mkdtemp()
+        try:
+            corrupted_path = os.path.join(tmp_dir_path, "corrupted.hdf5")
+            with open(corrupted_path, 'wt', encoding="utf-8") as corrupted_file:
+                corrupted_file.write("not hdf5")
+
+            empty_path = os.path.join(tmp_dir_path, "empty.hdf5")
+            with h5py.File(empty_path, 'w'):
+                pass
+
+            dataset = GraphDataset(
+                hdf5_path=[empty_path, "tests/data/hdf5/1ATN_ppi.hdf5", corrupted_path],
+                check_integrity=True
+            )
+
+            assert dataset.hdf5_paths == ["tests/data/hdf5/1ATN_ppi.hdf5"]
+            assert len(dataset) == 4
+        finally:
+            rmtree(tmp_dir_path)
+
+    def test_features_checked_in_all_files(self):
+        dataset = GraphDataset(
+            hdf5_path=["tests/data/hdf5/variants.hdf5", "tests/data/hdf5/1ATN_ppi.hdf5"],
+            node_features=[Nfeat.BSA, Nfeat.PSSM],
+            edge_features=[Efeat.DISTANCE]
+        )
+        assert dataset.get(0) is not None
+
+        with self.assertRaises(ValueError):
+            GraphDataset(
+                hdf5_path=["tests/data/hdf5/variants.hdf5", "tests/data/hdf5/1ATN_ppi.hdf5"],
+                node_features=[Nfeat.BSA, Nfeat.CONSERVATION],
+                edge_features=[Efeat.DISTANCE]
+            )
+
+    def test_hdf5_file_handles(self):
+        dataset = GraphDataset(
+            hdf5_path=["tests/data/hdf5/valid.hdf5", "tests/data/hdf5/test.hdf5"],
+            node_features=node_feats,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.BINARY,
+            max_open_files=1
+        )
+
+        first_path = dataset.index_entries[0][0]
+        dataset.get(0)
+        hdf5_file = dataset._get_hdf5_file(first_path) # pylint: disable=protected-access
+        dataset.get(1)
+        assert dataset._get_hdf5_file(first_path) is hdf5_file # pylint: disable=protected-access
+
+        # reading from the other file closes the least recently used one
+        dataset.get(len(dataset) - 1)
+        assert not hdf5_file
+        assert not is_hdf5_file_open(first_path)
+
+        copied_dataset = deepcopy(dataset)
+        assert copied_dataset.get(0) is not None
+
+        loader = DataLoader(dataset, batch_size=8, num_workers=2, worker_init_fn=hdf5_worker_init_fn)
+        assert sum(batch.num_graphs for batch in loader) == len(dataset)
+
+        dataset.close_hdf5_files()
+        assert not any(is_hdf5_file_open(hdf5_path) for hdf5_path in dataset.hdf5_paths)
+
+    def test_hdf5_file_handles_shared(self):
+        work_directory = mkdtemp()
+        try:
+            hdf5_path = os.path.join(work_directory, "test.hdf5")
+            shutil.copyfile("tests/data/hdf5/test.hdf5", hdf5_path)
+
+            datasets = [
+                GraphDataset(hdf5_path=hdf5_path, node_features=node_feats, edge_features=[Efeat.DISTANCE],
+                             target=targets.BINARY, clustering_method="mcl", tqdm=False)
+                for _ in range(2)
+            ]
+            for dataset in datasets:
+                dataset.get(0)
+
+            # writing to the file, which both datasets have read, closes their shared handle
+            precluster_dataset(datasets[0], "mcl")
+            for dataset in datasets:
+                assert dataset.get(0).cluster0 is not None
+
+            # the handle is closed when no dataset uses the file anymore
+            del dataset # the loop variable
+            datasets.pop().get(1)
+            gc.collect()
+            assert is_hdf5_file_open(hdf5_path)
+            datasets.pop()
+            gc.collect()
+            assert not is_hdf5_file_open(hdf5_path)
+        finally:
+            rmtree(work_directory)
+
+    def test_cached_dataset(self):
+        cache = DataCache(1 << 30, shared=True)
+        dataset = GraphDataset(
+            hdf5_path=self.hdf5_path,
+            node_features=node_feats,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.IRMSD,
+            cache=cache
+        )
+
+        dataset.preload_cache()
+        assert len(cache) == len(dataset)
+
+        uncached_dataset = GraphDataset(
+            hdf5_path=self.hdf5_path,
+            node_features=node_feats,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.IRMSD
+        )
+        for idx in range(len(dataset)):
+            cached_data = dataset.get(idx)
+            data = uncached_dataset.get(idx)
+            assert torch.equal(cached_data.x, data.x)
+            assert torch.equal(cached_data.edge_attr, data.edge_attr)
+            assert cached_data.entry_names == data.entry_names
+
+        assert cache.hits == len(dataset)
+
     def test_save_external_links(self):
         n = 2
 
@@ -269,6 +464,30 @@ class TestDataSet(unittest.TestCase):
 
         assert dataset.df.shape[0] == len(keys[2:])
 
+    def test_graph_hdf5_to_pandas_chunks(self):
+
+        dataset = GraphDataset(
+            hdf5_path = ["tests/data/hdf5/valid.hdf5", "tests/data/hdf5/test.hdf5"],
+            node_features=['charge', 'pssm'],
+            edge_features=['distance'],
+            target='binary'
+        )
+        df = dataset.hdf5_to_pandas(features=['pssm', 'binary'], cpu_count=2)
+
+        assert list(df.columns) == ['id'] + [f'pssm_{i}' for i in range(20)] + ['binary']
+        assert df.shape[0] == len(dataset)
+
+        chunks = list(dataset.iter_hdf5_chunks(chunk_size=2, features=['pssm', 'binary']))
+        assert all(chunk.shape[0] <= 2 for chunk in chunks)
+
+        df_chunks = pd.concat(chunks).reset_index(drop=True)
+        assert list(df_chunks['id']) == list(df['id'])
+        assert np.array_equal(np.concatenate(df_chunks['pssm_3'].values), np.concatenate(df['pssm_3'].values))
+        assert np.array_equal(df_chunks['binary'].values, df['binary'].values)
+
+        with self.assertRaises(ValueError):
+            dataset.hdf5_to_pandas(features=['res_type'])
+
     def test_graph_save_hist(self):
 
         output_directory = mkdtemp()
@@ -361,6 +580,52 @@ class TestDataSet(unittest.TestCase):
                 assert -0.2 < mean < 0.2
                 assert 0.8 < dev < 1.2
 
+    def test_graph_standardize_similar_feature_names(self):
+
+        # polarity is also part of the name diff_polarity, each must get its own means and deviations
+        hdf5_path = "tests/data/hdf5/variants.hdf5"
+        dataset = GraphDataset(
+            hdf5_path = hdf5_path,
+            target='binary',
+            standardize=True
+        )
+
+        data = dataset.get(0)
+        with h5py.File(hdf5_path, 'r') as f5:
+            raw_values = f5[data.entry_names][f"{Nfeat.NODE}/{Nfeat.POLARITY}"][()]
+
+        channels = range(raw_values.shape[1])
+        expected_values = (raw_values - [dataset.means[f"{Nfeat.POLARITY}_{channel}"] for channel in channels]) / \
+            [dataset.devs[f"{Nfeat.POLARITY}_{channel}"] for channel in channels]
+
+        column_start, column_end = dataset._node_columns[Nfeat.POLARITY] # pylint: disable=protected-access
+        assert np.allclose(data.x[:, column_start:column_end].numpy(), expected_values, equal_nan=True)
+
+    def test_graph_feature_columns_empty_first_file(self):
+
+        # the columns are laid out from the catalogues, the first file having no entries to read them from
+        tmp_dir = mkdtemp()
+        try:
+            empty_path = os.path.join(tmp_dir, "empty.hdf5")
+            h5py.File(empty_path, "w").close()
+
+            hdf5_path = "tests/data/hdf5/test.hdf5"
+            dataset = GraphDataset(
+                hdf5_path = [empty_path, hdf5_path],
+                target='binary',
+                check_integrity=False
+            )
+
+            data = dataset.get(0)
+            with h5py.File(hdf5_path, 'r') as f5:
+                raw_values = f5[data.entry_names][f"{Nfeat.NODE}/{Nfeat.BSA}"][()]
+
+            column_start, column_end = dataset._node_columns[Nfeat.BSA] # pylint: disable=protected-access
+            assert column_end == column_start + 1
+            assert np.allclose(data.x[:, column_start].numpy(), raw_values)
+        finally:
+            rmtree(tmp_dir)
+
     def test_graph_standardization_logic(self):
 
         hdf5_path = "tests/data/hdf5/train.hdf5"
@@ -4,6 +4,7 @@ import unittest
 import warnings
 
 import pytest
+import torch
 from torch import nn
 
 from deeprankcore.dataset import GraphDataset
@@ -87,6 +88,11 @@ class TestLosses(unittest.TestCase):
         assert isinstance(trainer_pretrained.lossfunction, lossfunction)
         assert trainer_pretrained.class_weights
 
+        # the weights come from the stored targets, they match the loaded ones
+        targets_all = torch.cat([data.y for data in trainer.dataset_train]).tolist()
+        counts = torch.tensor([targets_all.count(i) for i in trainer.classes], dtype=torch.float32)
+        assert torch.allclose(trainer.weights, (1.0 / counts) / (1.0 / counts).sum())
+
 
     # def test_classif_invalid_weighted(self):
     #     dataset = GraphDataset(hdf5_path, 
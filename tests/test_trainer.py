@@ -2,11 +2,14 @@ import glob
 import logging
 import os
 import shutil
+import socket
 import tempfile
 import unittest
 import warnings
+from unittest.mock import patch
 
 import h5py
+import numpy as np
 import pytest
 import torch
 
@@ -21,9 +24,10 @@ from deeprankcore.neuralnets.gnn.ginet import GINet
 from deeprankcore.neuralnets.gnn.naive_gnn import NaiveNetwork
 from deeprankcore.neuralnets.gnn.sgat import SGAT
 from deeprankcore.trainer import Trainer, _divide_dataset
+from deeprankcore.utils.checkpointing import snapshot_state
 from deeprankcore.utils.exporters import (
-    HDF5OutputExporter, ScatterPlotExporter,
-    TensorboardBinaryClassificationExporter)
+    HDF5OutputExporter, OutputExporter, ScatterPlotExporter,
+    TensorboardBinaryClassificationExporter, read_hdf5_output)
 
 _log = logging.getLogger(__name__)
 
@@ -114,6 +118,37 @@ def _model_base_test( # pylint: disable=too-many-arguments, too-many-locals
             dataset_test,
             pretrained_model=save_path)
 
+# an odd number of entries, for the sampler to pad the shard of the second process
+_distributed_subset = ['residue-ppi-BA-325605:M-P', 'residue-ppi-BA-422913:M-P', 'residue-ppi-BA-481845:M-P']
+
+
+def _distributed_worker(rank: int, world_size: int, port: int, work_directory: str):
+    os.environ.update({"RANK": str(rank), "WORLD_SIZE": str(world_size),
+                       "MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port)})
+    torch.manual_seed(rank)  # the processes must be synchronized by the trainer
+
+    dataset = GraphDataset(
+        hdf5_path="tests/data/hdf5/test.hdf5",
+        subset=_distributed_subset,
+        node_features=default_features,
+        edge_features=[Efeat.DISTANCE],
+        target=targets.BINARY,
+        tqdm=False,
+    )
+    trainer = Trainer(
+        neuralnet = NaiveNetwork,
+        dataset_train = dataset,
+        dataset_val = dataset,
+        output_exporters = [HDF5OutputExporter(os.path.join(work_directory, "output"))],
+    )
+    try:
+        trainer.train(nepoch=2, batch_size=8, validate=True, distributed=True,
+                      output_prefix=os.path.join(work_directory, "model"))
+        torch.save(trainer.model.state_dict(), os.path.join(work_directory, f"parameters_{rank}.pt"))
+    finally:
+        torch.distributed.destroy_process_group()
+
+
 class TestTrainer(unittest.TestCase):
     @classmethod
     def setUpClass(class_):
@@ -151,6 +186,68 @@ class TestTrainer(unittest.TestCase):
         )
         trainer.train(nepoch=1, batch_size = 2, save_best_model=None)
 
+    def test_grid_bfloat16_channels_last(self):
+        dataset = GridDataset(
+            hdf5_path="tests/data/hdf5/1ATN_ppi.hdf5",
+            subset=None,
+            target=targets.BINARY,
+            task=targets.CLASSIF,
+            features=[Efeat.VDW])
+        num_threads = torch.get_num_threads()
+        try:
+            trainer = Trainer(
+                CnnClassification,
+                dataset,
+                val_size=0,
+                precision="bfloat16",
+                channels_last=True,
+                num_threads=1,
+            )
+            assert torch.get_num_threads() == 1
+
+            trainer.train(nepoch=1, batch_size=2, save_best_model=None)
+            entry_names, outputs, _ = trainer.predict(dataset)
+        finally:
+            torch.set_num_threads(num_threads)
+
+        assert trainer.model.convlayer_000.weight.is_contiguous(memory_format=torch.channels_last_3d)
+        assert trainer.model.convlayer_000.weight.dtype == torch.float32
+        assert len(entry_names) == len(dataset)
+        assert outputs.dtype == np.float32
+        assert np.allclose(outputs.sum(axis=1), 1.0, atol=1e-2)
+
+    def test_bfloat16_graphs(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            node_features=default_features,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.BINARY,
+            tqdm=False,
+        )
+        trainer = Trainer(
+            neuralnet = NaiveNetwork,
+            dataset_train = dataset,
+            dataset_val = dataset,
+            precision = "bfloat16",
+        )
+
+        trainer.train(nepoch=1, batch_size=8, validate=True, save_best_model=None)
+        _, outputs, _ = trainer.predict(dataset)
+        assert outputs.dtype == np.float32
+        assert np.isfinite(outputs).all()
+
+    def test_invalid_precision(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            target=targets.BINARY,
+        )
+
+        with pytest.raises(ValueError):
+            Trainer(NaiveNetwork, dataset, precision="float16")
+
+        with pytest.raises(ValueError):
+            Trainer(NaiveNetwork, dataset, channels_last=True)
+
     def test_grid_graph_incompatible(self):
         dataset_train = GridDataset(
             hdf5_path="tests/data/hdf5/1ATN_ppi.hdf5",
@@ -439,6 +536,224 @@ class TestTrainer(unittest.TestCase):
         assert len(trainer.train_loader) == len(dataset)
         assert trainer.valid_loader is None
 
+    def test_node_budget_batches(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            target=targets.BINARY,
+            clustering_method="mcl"
+        )
+        trainer = Trainer(
+            neuralnet = GINet,
+            dataset_train = dataset,
+            dataset_test = dataset,
+        )
+        max_nodes = int(dataset.get_entry_sizes()[0].max())
+
+        trainer.train(batch_size=64, max_batch_nodes=max_nodes, save_best_model=None)
+        trainer.test(batch_size=64, max_batch_nodes=max_nodes)
+
+        for loader in (trainer.train_loader, trainer.valid_loader, trainer.test_loader):
+            for batch in loader:
+                assert batch.num_nodes <= max_nodes
+
+    def test_format_output_classes(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            node_features=default_features,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.BINARY,
+            tqdm=False,
+        )
+        trainer = Trainer(
+            neuralnet = NaiveNetwork,
+            dataset_train = dataset,
+            val_size = 0,
+        )
+        pred = torch.zeros((3, 2))
+
+        trainer.classes_to_index = {1: 0, 0: 1}
+        _, target = trainer._format_output(pred, torch.tensor([0.0, 1.0, 1.0])) # pylint: disable=protected-access
+        assert target.tolist() == [1, 0, 0]
+
+        # classes that don't start at 0
+        trainer.classes_to_index = {3: 0, 5: 1}
+        _, target = trainer._format_output(pred, torch.tensor([5.0, 3.0, 5.0])) # pylint: disable=protected-access
+        assert target.tolist() == [1, 0, 1]
+
+        with pytest.raises(ValueError):
+            trainer._format_output(pred, torch.tensor([3.0, 4.0, 6.0])) # pylint: disable=protected-access
+
+    def test_predict(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            node_features=default_features,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.BINARY,
+        )
+        trainer = Trainer(
+            neuralnet = NaiveNetwork,
+            dataset_train = dataset,
+            dataset_test = dataset,
+            val_size = 0,
+        )
+
+        entry_names, outputs, target_values = trainer.predict(batch_size=7)
+        assert entry_names == [entry_name for _, entry_name in dataset.index_entries]
+        assert outputs.shape == (len(dataset), 2)
+        assert np.allclose(outputs.sum(axis=1), 1.0)
+        assert target_values.tolist() == [dataset.get(idx).y.item() for idx in range(len(dataset))]
+
+        # the same data, loaded from the file, without targets
+        file_entry_names, file_outputs, file_target_values = trainer.predict("tests/data/hdf5/test.hdf5", batch_size=64)
+        assert file_entry_names == entry_names
+        assert np.allclose(file_outputs, outputs, atol=1e-6)
+        assert file_target_values is None
+
+        # inference keeps no autograd graph
+        for parameter in trainer.model.parameters():
+            assert parameter.grad is None
+
+    def test_distributed(self):
+        work_directory = tempfile.mkdtemp()
+        try:
+            with socket.socket() as free_socket:
+                free_socket.bind(("127.0.0.1", 0))
+                port = free_socket.getsockname()[1]
+
+            torch.multiprocessing.spawn(_distributed_worker, args=(2, port, work_directory), nprocs=2)
+
+            parameters = [torch.load(os.path.join(work_directory, f"parameters_{rank}.pt")) for rank in range(2)]
+            for name, value in parameters[0].items():
+                assert torch.equal(value, parameters[1][name]), name
+
+            assert len(glob.glob(os.path.join(work_directory, "model*.pth.tar"))) == 1
+
+            dataset_size = len(_distributed_subset)
+            output = read_hdf5_output(os.path.join(work_directory, "output", "output_exporter.hdf5"), key="training")
+            for (phase, epoch), epoch_output in output.groupby(["phase", "epoch"]):
+                assert len(epoch_output) == dataset_size, (phase, epoch)
+                assert epoch_output["entry"].nunique() == dataset_size, (phase, epoch)
+
+                # the loss is the mean cross entropy over the entries, without the padding
+                probabilities = np.array(epoch_output["output"].tolist())
+                expected_loss = -np.mean(np.log(probabilities[np.arange(dataset_size), epoch_output["target"].astype(int)]))
+                assert np.isclose(epoch_output["loss"].iloc[0], expected_loss, rtol=1e-4), (phase, epoch)
+        finally:
+            shutil.rmtree(work_directory)
+
+    def test_export_chunks(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            node_features=default_features,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.BINARY,
+            tqdm=False,
+        )
+        output_directory = tempfile.mkdtemp()
+        try:
+            trainer = Trainer(
+                neuralnet = NaiveNetwork,
+                dataset_train = dataset,
+                dataset_val = dataset,
+                output_exporters = [HDF5OutputExporter(output_directory)],
+            )
+
+            with patch("deeprankcore.trainer._EXPORT_CHUNK_SIZE", 5):
+                trainer.train(nepoch=2, batch_size=3, validate=True, save_best_model=None)
+                entry_names, outputs, _ = trainer.predict(dataset)
+
+            output = read_hdf5_output(os.path.join(output_directory, "output_exporter.hdf5"), key="training")
+        finally:
+            shutil.rmtree(output_directory)
+
+        for (phase, epoch), epoch_output in output.groupby(["phase", "epoch"]):
+            assert sorted(epoch_output["entry"]) == sorted(entry_names), (phase, epoch)
+
+        # the last validation pass ran the final model
+        last_output = output[(output["phase"] == "validation") & (output["epoch"] == 2)]
+        exported_outputs = dict(zip(last_output["entry"], last_output["output"]))
+        for entry_name, entry_outputs in zip(entry_names, outputs):
+            assert np.allclose(exported_outputs[entry_name], entry_outputs, atol=1e-6), entry_name
+
+    def test_profile(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            node_features=default_features,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.BINARY,
+            tqdm=False,
+        )
+
+        profiles = {}
+
+        class _ProfileExporter(OutputExporter):
+            def process_profile(self, pass_name, epoch_number, metrics):
+                profiles[(pass_name, epoch_number)] = metrics
+
+        output_directory = tempfile.mkdtemp()
+        try:
+            trainer = Trainer(
+                neuralnet = NaiveNetwork,
+                dataset_train = dataset,
+                dataset_val = dataset,
+                output_exporters = [_ProfileExporter(output_directory)],
+                profile = True,
+            )
+
+            torch_profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            with self.assertLogs("deeprankcore.trainer", level="INFO") as logs:
+                trainer.train(nepoch=2, batch_size=3, validate=True, save_best_model=None, torch_profiler=torch_profiler)
+        finally:
+            shutil.rmtree(output_directory)
+
+        assert sorted(profiles) == [("training", 0), ("training", 1), ("training", 2), ("validation", 0), ("validation", 1), ("validation", 2)]
+
+        training_metrics = profiles[("training", 1)]
+        for stage in ("read", "collate", "forward", "loss", "backward", "optimizer", "export", "total"):
+            assert training_metrics[f"time/{stage}"] >= 0.0, stage
+        assert training_metrics["samples"] == len(dataset)
+        assert training_metrics["mean_nodes_per_graph"] > 0
+
+        assert "time/backward" not in profiles[("validation", 1)]
+
+        assert sum("training profile {" in message for message in logs.output) == 3
+
+        # the stages are labelled in the traces of the torch profiler
+        assert "backward" in [event.key for event in torch_profiler.key_averages()]
+
+    def test_resume_from_checkpoint(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            node_features=default_features,
+            edge_features=[Efeat.DISTANCE],
+            target=targets.BINARY,
+            tqdm=False,
+        )
+        output_prefix = os.path.join(self.work_directory, "resumed")
+
+        def _create_trainer():
+            return Trainer(
+                neuralnet = NaiveNetwork,
+                dataset_train = dataset,
+                dataset_val = dataset,
+            )
+
+        trainer = _create_trainer()
+        trainer.train(nepoch=4, batch_size=8, validate=True, earlystop_patience=10, output_prefix=output_prefix,
+                      checkpoint_every=1, keep_checkpoints=2)
+        assert sorted(glob.glob(output_prefix + "_checkpoint_e*.pth.tar")) == \
+            [output_prefix + "_checkpoint_e3.pth.tar", output_prefix + "_checkpoint_e4.pth.tar"]
+
+        # resuming after epoch 3 trains epoch 4 as the first run did, with the same shuffling
+        resumed_trainer = _create_trainer()
+        resumed_trainer.train(nepoch=4, batch_size=8, validate=True, earlystop_patience=10, output_prefix=output_prefix,
+                              resume_from=output_prefix + "_checkpoint_e3.pth.tar")
+        for name, value in trainer.model.state_dict().items():
+            assert torch.allclose(value, resumed_trainer.model.state_dict()[name]), name
+
+        with pytest.raises(ValueError):
+            _create_trainer().train(resume_from=glob.glob(output_prefix + "_t*.pth.tar")[0])
+
     def test_optim(self):
         dataset = GraphDataset(
             hdf5_path="tests/data/hdf5/test.hdf5",
@@ -470,6 +785,39 @@ class TestTrainer(unittest.TestCase):
         assert trainer_pretrained.lr == lr
         assert trainer_pretrained.weight_decay == weight_decay
 
+    def test_model_snapshot(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            target=targets.BINARY,
+        )
+        trainer = Trainer(
+            neuralnet = NaiveNetwork,
+            dataset_train = dataset,
+        )
+        with warnings.catch_warnings(record=UserWarning):
+            trainer.train(nepoch=1, save_best_model=None)
+
+        snapshot = snapshot_state(trainer._get_state()) # pylint: disable=protected-access
+
+        # the snapshot holds copies of the tensors, and no references to the model's parameters
+        parameter_pointers = {parameter.data_ptr() for parameter in trainer.model.parameters()}
+        parameter_ids = {id(parameter) for parameter in trainer.model.parameters()}
+
+        def _check(value):
+            assert id(value) not in parameter_ids
+            assert not isinstance(value, (torch.nn.Module, torch.optim.Optimizer)) or value is snapshot["lossfunction"]
+            if isinstance(value, torch.Tensor):
+                assert value.data_ptr() not in parameter_pointers
+            elif isinstance(value, dict):
+                for item in value.values():
+                    _check(item)
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    _check(item)
+
+        _check(snapshot)
+        assert snapshot["optimizer"] is torch.optim.Adam
+
     def test_default_optim(self):
         dataset = GraphDataset(
             hdf5_path="tests/data/hdf5/test.hdf5",
@@ -576,6 +924,36 @@ class TestTrainer(unittest.TestCase):
 
         hdf5_file.close()
         
+    def test_divide_dataset_views(self):
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/1ATN_ppi.hdf5",
+            target=targets.IRMSD,
+            standardize=True,
+            tqdm=False,
+        )
+
+        dataset_main, dataset_split = _divide_dataset(dataset, splitsize=1, group_by=lambda entry_name: entry_name.split("_")[1])
+        assert len(dataset_main) == 3
+        assert len(dataset_split) == 1
+        assert set(dataset_main.index_entries) | set(dataset_split.index_entries) == set(dataset.index_entries)
+
+        # the views share the parent's statistics
+        assert dataset_main.means is dataset.means
+        assert dataset_split.devs is dataset.devs
+
+        # the splits of regression targets can't be stratified
+        with pytest.raises(ValueError):
+            _divide_dataset(dataset, splitsize=0.5, stratify=True)
+
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/1ATN_ppi.hdf5",
+            target=targets.BINARY,
+            tqdm=False,
+        )
+        dataset_main, dataset_split = _divide_dataset(dataset, splitsize=0.5, stratify=True)
+        assert sorted(dataset_split.get_target_values().tolist() + dataset_main.get_target_values().tolist()) == \
+            sorted(dataset.get_target_values().tolist())
+
     def test_invalid_trainsize(self):
         hdf5 = "tests/data/hdf5/train.hdf5"
         hdf5_file = h5py.File(hdf5, 'r')    # contains 44 datapoints
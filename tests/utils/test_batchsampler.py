@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from deeprankcore.dataset import GraphDataset
+from deeprankcore.utils.batchsampler import SizeBatchSampler
+
+
+def test_batches_stay_under_budget():
+
+    node_counts = np.random.default_rng(0).integers(10, 100, size=200)
+    edge_counts = 4 * node_counts
+
+    sampler = SizeBatchSampler(node_counts, edge_counts, max_nodes=500, max_edges=1800, shuffle=True, bucket_size=50, seed=1)
+    batches = list(sampler)
+
+    assert sorted(index for batch in batches for index in batch) == list(range(200))
+    for batch in batches:
+        assert node_counts[batch].sum() <= 500
+        assert edge_counts[batch].sum() <= 1800
+
+
+def test_len_matches_iteration():
+
+    node_counts = np.random.default_rng(0).integers(1, 50, size=100)
+    sampler = SizeBatchSampler(node_counts, max_nodes=120, shuffle=True)
+
+    for _ in range(3):
+        batch_count = len(sampler)
+        assert len(list(sampler)) == batch_count
+
+
+def test_oversized_entry_batched_alone():
+
+    sampler = SizeBatchSampler(np.array([5, 50, 5, 5]), max_nodes=20)
+    batches = list(sampler)
+
+    assert [1] in batches
+    assert sorted(index for batch in batches for index in batch) == [0, 1, 2, 3]
+
+
+def test_max_batch_size():
+
+    sampler = SizeBatchSampler(np.ones(10, dtype=int), max_nodes=100, max_batch_size=3)
+
+    assert [len(batch) for batch in sampler] == [3, 3, 3, 1]
+
+
+def test_buckets_sorted_by_size():
+
+    node_counts = np.array([9, 1, 8, 2, 7, 3])
+    sampler = SizeBatchSampler(node_counts, max_nodes=10, bucket_size=6)
+
+    assert list(sampler) == [[1, 3, 5], [4], [2], [0]]
+
+
+def test_invalid_budget():
+
+    with pytest.raises(ValueError):
+        SizeBatchSampler(np.ones(4, dtype=int))
+
+    with pytest.raises(ValueError):
+        SizeBatchSampler(np.ones(4, dtype=int), max_edges=10)
+
+
+def test_from_dataset():
+
+    dataset = GraphDataset("tests/data/hdf5/1ATN_ppi.hdf5")
+    node_counts, edge_counts = dataset.get_entry_sizes()
+
+    for idx in range(len(dataset)):
+        graph = dataset.get(idx)
+        assert graph.num_nodes == node_counts[idx]
+        assert graph.edge_index.shape[1] == edge_counts[idx]
+
+    sampler = SizeBatchSampler.from_dataset(dataset, max_nodes=int(node_counts.max()))
+    assert sorted(index for batch in sampler for index in batch) == list(range(len(dataset)))
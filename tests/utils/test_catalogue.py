@@ -0,0 +1,169 @@
+import os
+import shutil
+from tempfile import mkdtemp
+from unittest.mock import patch
+
+import h5py
+import numpy as np
+import pytest
+
+from deeprankcore.dataset import GraphDataset
+from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import nodestorage as Nfeat
+from deeprankcore.domain import targetstorage as targets
+from deeprankcore.utils.catalogue import (CATALOGUE_FILE_SUFFIX,
+                                          SIDECAR_DIRECTORY_VARIABLE,
+                                          EntryCatalogue, get_catalogue,
+                                          get_catalogues, get_sidecar_path,
+                                          write_catalogue)
+from deeprankcore.utils.community_pooling import precluster_dataset
+
+
+def test_catalogue():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_path = os.path.join(temp_dir, "1ATN_ppi.hdf5")
+        shutil.copy("tests/data/hdf5/1ATN_ppi.hdf5", hdf5_path)
+
+        assert EntryCatalogue.load(hdf5_path) is None
+        write_catalogue(hdf5_path)
+        catalogue = EntryCatalogue.load(hdf5_path)
+
+        with h5py.File(hdf5_path, 'r') as f5:
+            assert catalogue.entry_names == list(f5.keys())
+            for entry_index, entry_name in enumerate(catalogue.entry_names):
+                entry_group = f5[entry_name]
+                assert catalogue.node_counts[entry_index] == entry_group[f"{Nfeat.NODE}/{Nfeat.POSITION}"].shape[0]
+                assert catalogue.edge_counts[entry_index] == entry_group[f"{Efeat.EDGE}/{Efeat.INDEX}"].shape[0]
+                assert catalogue.get_target_column(targets.IRMSD)[entry_index] == entry_group[f"{targets.VALUES}/{targets.IRMSD}"][()]
+
+        assert catalogue.schema[Nfeat.NODE][Nfeat.PSSM] == [20]
+        assert catalogue.schema[Efeat.EDGE][Efeat.DISTANCE] == []
+        assert np.all(np.isnan(catalogue.get_target_column("unknown")))
+
+        # a changed file's catalogue is rebuilt
+        with h5py.File(hdf5_path, 'a') as f5:
+            del f5[catalogue.entry_names[0]]
+
+        assert EntryCatalogue.load(hdf5_path) is None
+        assert len(get_catalogue(hdf5_path)) == len(catalogue) - 1
+        assert len(EntryCatalogue.load(hdf5_path)) == len(catalogue) - 1
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_dataset_index_from_catalogue():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_path = os.path.join(temp_dir, "1ATN_ppi.hdf5")
+        shutil.copy("tests/data/hdf5/1ATN_ppi.hdf5", hdf5_path)
+
+        subset = ["residue-ppi-1ATN_3w:A-B", "unknown", "residue-ppi-1ATN_1w:A-B"]
+        dataset = GraphDataset(hdf5_path, subset=subset, target=targets.IRMSD)
+
+        assert os.path.isfile(get_sidecar_path(hdf5_path, CATALOGUE_FILE_SUFFIX))
+        assert [entry_name for _, entry_name in dataset.index_entries] == [subset[0], subset[2]]
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_catalogue_kept_by_preclustering():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_path = os.path.join(temp_dir, "test.hdf5")
+        shutil.copy("tests/data/hdf5/test.hdf5", hdf5_path)
+
+        dataset = GraphDataset(hdf5_path, target=targets.BINARY, clustering_method="mcl", tqdm=False)
+        catalogue = EntryCatalogue.load(hdf5_path)
+        signature = os.stat(hdf5_path).st_mtime_ns
+
+        precluster_dataset(dataset, "mcl")
+
+        # the file has changed, but the catalogue is still valid for it
+        assert os.stat(hdf5_path).st_mtime_ns != signature
+        assert EntryCatalogue.load(hdf5_path).entry_names == catalogue.entry_names
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_truncated_catalogue_rebuilt():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_path = os.path.join(temp_dir, "1ATN_ppi.hdf5")
+        shutil.copy("tests/data/hdf5/1ATN_ppi.hdf5", hdf5_path)
+        catalogue = get_catalogue(hdf5_path)
+
+        # the sidecar is replaced at once, without temporary files left behind
+        catalogue_path = get_sidecar_path(hdf5_path, CATALOGUE_FILE_SUFFIX)
+        assert not any(name.endswith(".tmp") for name in os.listdir(os.path.dirname(catalogue_path)))
+
+        # as if read while written
+        with open(catalogue_path, 'rb') as catalogue_file:
+            content = catalogue_file.read()
+        with open(catalogue_path, 'wb') as catalogue_file:
+            catalogue_file.write(content[:len(content) // 2])
+
+        assert EntryCatalogue.load(hdf5_path) is None
+        assert get_catalogue(hdf5_path).entry_names == catalogue.entry_names
+        assert EntryCatalogue.load(hdf5_path).entry_names == catalogue.entry_names
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_sidecar_path(monkeypatch):
+
+    temp_dir = mkdtemp()
+    try:
+        monkeypatch.delenv(SIDECAR_DIRECTORY_VARIABLE, raising=False)
+        assert get_sidecar_path("data/1ATN_ppi.hdf5", CATALOGUE_FILE_SUFFIX) == "data/1ATN_ppi.hdf5" + CATALOGUE_FILE_SUFFIX
+
+        monkeypatch.setenv(SIDECAR_DIRECTORY_VARIABLE, temp_dir)
+        sidecar_path = get_sidecar_path("data/1ATN_ppi.hdf5", CATALOGUE_FILE_SUFFIX)
+        assert os.path.dirname(sidecar_path) == temp_dir
+        assert os.path.basename(sidecar_path).startswith("1ATN_ppi.hdf5.")
+        assert sidecar_path != get_sidecar_path("other/1ATN_ppi.hdf5", CATALOGUE_FILE_SUFFIX)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_get_catalogues_of_unreadable_files():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_paths = [os.path.join(temp_dir, name) for name in ("1ATN_ppi.hdf5", "corrupted.hdf5", "empty.hdf5")]
+        shutil.copy("tests/data/hdf5/1ATN_ppi.hdf5", hdf5_paths[0])
+        with open(hdf5_paths[1], 'wt', encoding="utf-8") as corrupted_file:
+            corrupted_file.write("not hdf5")
+        with h5py.File(hdf5_paths[2], 'w'):
+            pass
+
+        # an unreadable sidecar doesn't make its .HDF5 file unreadable
+        with open(get_sidecar_path(hdf5_paths[0], CATALOGUE_FILE_SUFFIX), 'wb') as catalogue_file:
+            catalogue_file.write(b"not a catalogue")
+
+        catalogues = get_catalogues(hdf5_paths)
+
+        assert len(catalogues[0]) == len(get_catalogue(hdf5_paths[0]))
+        assert catalogues[1] is None
+        assert len(catalogues[2]) == 0
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_get_catalogues_raises_errors_of_readable_files():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_path = os.path.join(temp_dir, "1ATN_ppi.hdf5")
+        shutil.copy("tests/data/hdf5/1ATN_ppi.hdf5", hdf5_path)
+
+        # a file that opens isn't dropped as corrupted because building its catalogue failed
+        with patch.object(EntryCatalogue, "build", side_effect=RuntimeError("transient")):
+            with pytest.raises(RuntimeError):
+                get_catalogues([hdf5_path])
+    finally:
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+from shutil import rmtree
+
+import pytest
+import torch
+
+from deeprankcore.utils.checkpointing import (CheckpointWriter,
+                                              save_checkpoint, snapshot_state)
+
+
+def test_snapshot_state():
+
+    model = torch.nn.Linear(3, 2)
+    state = {"model_state": model.state_dict(), "epochs": [1, 2]}
+
+    snapshot = snapshot_state(state)
+    with torch.no_grad():
+        model.weight.add_(1.0)
+
+    assert not torch.equal(snapshot["model_state"]["weight"], model.weight)
+    assert torch.equal(snapshot["model_state"]["weight"] + 1.0, model.weight)
+    assert snapshot["epochs"] == [1, 2]
+
+
+def test_snapshot_optimizer():
+
+    model = torch.nn.Linear(3, 2)
+    optimizer = torch.optim.Adam(model.parameters())
+
+    # the optimizer holds the model's parameters, only its state is snapshotted
+    with pytest.raises(TypeError):
+        snapshot_state({"optimizer": optimizer})
+
+    snapshot = snapshot_state({"optimizer": type(optimizer), "optimizer_state": optimizer.state_dict()})
+    assert snapshot["optimizer"] is torch.optim.Adam
+
+
+def test_save_checkpoint():
+
+    work_directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(work_directory, "checkpoint.pth.tar")
+        save_checkpoint({"value": torch.ones(2)}, path)
+
+        assert os.listdir(work_directory) == ["checkpoint.pth.tar"]
+        assert torch.equal(torch.load(path)["value"], torch.ones(2))
+    finally:
+        rmtree(work_directory)
+
+
+def test_checkpoint_writer_rotation():
+
+    work_directory = tempfile.mkdtemp()
+    try:
+        with CheckpointWriter(keep_last=2) as writer:
+            for epoch in range(5):
+                writer.write({"epoch": epoch}, os.path.join(work_directory, f"checkpoint_{epoch}.pth.tar"), rotate=True)
+            writer.write({"epoch": 4}, os.path.join(work_directory, "best.pth.tar"))
+
+        assert sorted(os.listdir(work_directory)) == ["best.pth.tar", "checkpoint_3.pth.tar", "checkpoint_4.pth.tar"]
+        assert torch.load(os.path.join(work_directory, "checkpoint_4.pth.tar"))["epoch"] == 4
+    finally:
+        rmtree(work_directory)
+
+
+def test_checkpoint_writer_error():
+
+    work_directory = tempfile.mkdtemp()
+    try:
+        # a directory in the way of the checkpoint
+        os.mkdir(os.path.join(work_directory, "checkpoint.pth.tar"))
+
+        with pytest.raises(RuntimeError):
+            with CheckpointWriter() as writer:
+                writer.write({"epoch": 1}, os.path.join(work_directory, "checkpoint.pth.tar"))
+    finally:
+        rmtree(work_directory)
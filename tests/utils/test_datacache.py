@@ -0,0 +1,59 @@
+import pytest
+import torch
+from torch_geometric.data.data import Data
+
+from deeprankcore.utils.datacache import DataCache, get_data_size
+
+
+def _make_data(node_count: int) -> Data:
+    return Data(x=torch.zeros(node_count, 4), y=torch.tensor([1.0]))
+
+
+def test_lru_cache_evicts_least_recently_used():
+
+    item_size = get_data_size(_make_data(10))
+    cache = DataCache(2 * item_size, policy="lru")
+
+    cache.put("a", _make_data(10))
+    cache.put("b", _make_data(10))
+    assert cache.get("a") is not None
+
+    cache.put("c", _make_data(10))
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.nbytes == 2 * item_size
+    assert cache.evictions == 1
+
+
+def test_static_cache_keeps_first_items():
+
+    item_size = get_data_size(_make_data(10))
+    cache = DataCache(2 * item_size, policy="static")
+
+    assert cache.put("a", _make_data(10))
+    assert cache.put("b", _make_data(10))
+    assert not cache.put("c", _make_data(10))
+
+    assert len(cache) == 2
+    assert "c" not in cache
+
+
+def test_cache_gives_copies():
+
+    cache = DataCache(1 << 20, shared=True)
+
+    loaded = cache.get_or_load(("file", "entry"), lambda file_name, entry_name: _make_data(5))
+    loaded.entry_names = "other"
+
+    cached = cache.get(("file", "entry"))
+    assert "entry_names" not in cached
+    assert cached.x.is_shared()
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        DataCache(100, policy="random")
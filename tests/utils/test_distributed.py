@@ -0,0 +1,47 @@
+import torch
+from torch.utils.data.distributed import DistributedSampler
+
+from deeprankcore.utils.distributed import (gather_objects,
+                                            get_padding_count, get_rank,
+                                            get_world_size, is_main_process,
+                                            merge_shards)
+
+
+def test_merge_shards():
+
+    dataset = list(range(7))
+    sampler_kwargs = {"num_replicas": 3, "shuffle": True, "seed": 1}
+    shards = [[dataset[index] for index in DistributedSampler(dataset, rank=rank, **sampler_kwargs)] for rank in range(3)]
+
+    merged = merge_shards(shards, len(dataset))
+
+    assert sorted(merged) == dataset
+    generator = torch.Generator()
+    generator.manual_seed(1)
+    assert merged == torch.randperm(len(dataset), generator=generator).tolist()
+
+
+def test_single_process():
+
+    assert get_rank() == 0
+    assert get_world_size() == 1
+    assert is_main_process()
+    assert gather_objects("item") == ["item"]
+
+
+def test_padding_count():
+
+    dataset = list(range(7))
+    sampler_kwargs = {"num_replicas": 3, "shuffle": True, "seed": 1}
+    samplers = [DistributedSampler(dataset, rank=rank, **sampler_kwargs) for rank in range(3)]
+    shards = [[dataset[index] for index in sampler] for sampler in samplers]
+
+    padding_counts = [get_padding_count(sampler) for sampler in samplers]
+    assert padding_counts == [0, 1, 1]
+
+    # without the padding at their end, the shards hold every entry once
+    unpadded_shards = [shard[:len(shard) - padding_count] for shard, padding_count in zip(shards, padding_counts)]
+    assert merge_shards(unpadded_shards, len(dataset)) == merge_shards(shards, len(dataset))
+    assert sorted(entry for shard in unpadded_shards for entry in shard) == dataset
+
+    assert get_padding_count(DistributedSampler(dataset, rank=2, drop_last=True, **sampler_kwargs)) == 0
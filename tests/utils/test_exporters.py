@@ -9,8 +9,9 @@ import h5py
 import pandas as pd
 
 from deeprankcore.utils.exporters import (
-    HDF5OutputExporter, OutputExporterCollection, ScatterPlotExporter,
-    TensorboardBinaryClassificationExporter)
+    HDF5OutputExporter, OutputExporter, OutputExporterCollection,
+    ScatterPlotExporter, TensorboardBinaryClassificationExporter,
+    TensorboardProfileExporter, read_hdf5_output)
 
 logging.getLogger(__name__)
 
@@ -69,6 +70,22 @@ class TestOutputExporters(unittest.TestCase):
             )
         assert mock_add_scalar.called
 
+    @patch("torch.utils.tensorboard.SummaryWriter.add_scalar")
+    def test_tensorboard_profile(self, mock_add_scalar):
+        tensorboard_exporter = TensorboardProfileExporter(self._work_dir)
+
+        metrics = {"time/forward": 0.5, "samples_per_second": 100.0}
+
+        with tensorboard_exporter:
+            # outputs are left to other exporters
+            tensorboard_exporter.process("training", 1, ["entry1"], [[0.2, 0.8]], [1], 0.1)
+            tensorboard_exporter.process_profile("training", 1, metrics)
+
+        assert sorted(call.args for call in mock_add_scalar.call_args_list) == [
+            ("training profile/samples_per_second", 100.0, 1),
+            ("training profile/time/forward", 0.5, 1),
+        ]
+
     def test_scatter_plot(self):
         scatterplot_exporter = ScatterPlotExporter(self._work_dir)
 
@@ -119,10 +136,10 @@ class TestOutputExporters(unittest.TestCase):
                     pass_name_2, epoch_number, entry_names, outputs, targets, loss
                 )
 
-        df_test_1 = pd.read_hdf(
+        df_test_1 = read_hdf5_output(
             path_output_exporter,
             key=pass_name_1)
-        df_test_2 = pd.read_hdf(
+        df_test_2 = read_hdf5_output(
             path_output_exporter,
             key=pass_name_2)
 
@@ -147,3 +164,74 @@ class TestOutputExporters(unittest.TestCase):
         # assert there are 6 columns ('phase', 'epoch', 'entry', 'output', 'target', 'loss')
         assert df_test_1[df_test_1.phase == pass_name_1].shape[1] == 6
         assert df_test_2[df_test_2.phase == pass_name_2].shape[1] == 6
+        assert df_test_1.output.tolist() == outputs * n_epoch_1
+
+    def test_hdf5_output_chunks(self):
+        output_exporter = HDF5OutputExporter(self._work_dir)
+        path_output_exporter = os.path.join(self._work_dir, 'output_exporter.hdf5')
+        entry_names = [f"entry{index}" for index in range(10)]
+
+        for _ in range(2):  # the second session replaces the first
+            with output_exporter:
+                for epoch_number in range(3):
+                    for pass_name in ("training", "validation"):
+                        for start in range(0, len(entry_names), 4):
+                            output_exporter.process_chunk(
+                                pass_name, epoch_number, entry_names[start:start + 4], [0.5] * len(entry_names[start:start + 4]), [])
+                        output_exporter.end_pass(pass_name, epoch_number, float(epoch_number))
+
+        with h5py.File(path_output_exporter, 'r') as hdf5_file:
+            assert list(hdf5_file.keys()) == ["training"]
+
+        df = read_hdf5_output(path_output_exporter, key="training")
+        assert df.shape == (2 * 3 * len(entry_names), 6)
+        assert df.index.tolist() == list(range(df.shape[0]))
+        assert df.entry.tolist() == entry_names * 6
+        assert df.target.isna().all()
+
+        df_epoch = read_hdf5_output(path_output_exporter, key="training", where="epoch == 2 & phase == 'validation'")
+        assert df_epoch.entry.tolist() == entry_names
+        assert (df_epoch.loss == 2.0).all()
+
+    def test_hdf5_output_interrupted_pass(self):
+        output_exporter = HDF5OutputExporter(self._work_dir)
+        path_output_exporter = os.path.join(self._work_dir, 'output_exporter.hdf5')
+
+        with self.assertRaises(RuntimeError):
+            with output_exporter:
+                output_exporter.process("training", 0, ["entry1", "entry2"], [[0.2, 0.8], [0.6, 0.4]], [1, 0], 0.5)
+                output_exporter.process_chunk("training", 1, ["entry1"], [[0.3, 0.7]], [1])
+                raise RuntimeError("interrupted")
+
+        # the rows of the pass that didn't end are removed
+        df = read_hdf5_output(path_output_exporter, key="training")
+        assert df.epoch.tolist() == [0, 0]
+        assert (df.loss == 0.5).all()
+
+    def test_hdf5_output_earlier_version(self):
+        path_output_exporter = os.path.join(self._work_dir, 'output_exporter.hdf5')
+
+        # as written by earlier versions, in fixed format with lists of outputs
+        pd.DataFrame({'phase': ["training", "validation"], 'epoch': [1, 1], 'entry': ["entry1", "entry1"],
+                      'output': [[0.2, 0.8], [0.6, 0.4]], 'target': [1, 1], 'loss': [0.5, 0.7]}
+                     ).to_hdf(path_output_exporter, key="training", mode='a')
+
+        df = read_hdf5_output(path_output_exporter, key="training", where="phase == 'validation'")
+        assert df.output.tolist() == [[0.6, 0.4]]
+        assert df.loss.tolist() == [0.7]
+
+        with HDF5OutputExporter(self._work_dir) as output_exporter:
+            output_exporter.process("testing", 0, ["entry1"], [[0.3, 0.7]], [1], 0.4)
+
+        with pd.HDFStore(path_output_exporter, mode='r') as store:
+            assert store.get_storer("testing").attrs.deeprankcore_format_version == 2
+
+    def test_chunks_gathered_per_pass(self):
+        output_exporter = OutputExporter(self._work_dir)
+        with patch.object(output_exporter, "process") as mock_process:
+            output_exporter.process_chunk("training", 1, ["entry1"], [[0.2, 0.8]], [1])
+            output_exporter.process_chunk("training", 1, ["entry2", "entry3"], [[0.6, 0.4], [0.1, 0.9]], [0, 1])
+            output_exporter.end_pass("training", 1, 0.5)
+
+        mock_process.assert_called_once_with(
+            "training", 1, ["entry1", "entry2", "entry3"], [[0.2, 0.8], [0.6, 0.4], [0.1, 0.9]], [1, 0, 1], 0.5)
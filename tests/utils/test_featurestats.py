@@ -0,0 +1,95 @@
+import os
+import shutil
+from tempfile import mkdtemp
+
+import h5py
+import numpy as np
+
+from deeprankcore.dataset import GraphDataset
+from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import nodestorage as Nfeat
+from deeprankcore.domain import targetstorage as targets
+from deeprankcore.utils.catalogue import get_sidecar_path
+from deeprankcore.utils.community_pooling import precluster_dataset
+from deeprankcore.utils.featurestats import (STATS_FILE_SUFFIX, RunningStats,
+                                             _read_cached_stats,
+                                             compute_feature_stats)
+
+
+def test_running_stats_merge():
+
+    values = np.random.default_rng(0).normal(3.0, 2.0, 1000)
+
+    stats = RunningStats()
+    for chunk in np.array_split(values, 7):
+        stats.update(chunk)
+
+    other_stats = RunningStats()
+    other_stats.update(values[:10])
+    other_stats.merge(RunningStats())
+
+    assert stats.count == values.size
+    assert np.isclose(stats.mean, values.mean())
+    assert np.isclose(stats.std, values.std())
+    assert np.isclose(other_stats.mean, values[:10].mean())
+
+
+def test_compute_feature_stats():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_paths = []
+        for name in ("valid.hdf5", "test.hdf5"):
+            hdf5_paths.append(os.path.join(temp_dir, name))
+            shutil.copy(os.path.join("tests/data/hdf5", name), hdf5_paths[-1])
+
+        features_dict = {Nfeat.NODE: [Nfeat.BSA, Nfeat.PSSM], Efeat.EDGE: [Efeat.DISTANCE]}
+
+        expected_values = {}
+        for hdf5_path in hdf5_paths:
+            with h5py.File(hdf5_path, 'r') as f5:
+                for entry_group in f5.values():
+                    expected_values.setdefault(Nfeat.BSA, []).append(entry_group[f"{Nfeat.NODE}/{Nfeat.BSA}"][()])
+                    expected_values.setdefault(f"{Nfeat.PSSM}_3", []).append(entry_group[f"{Nfeat.NODE}/{Nfeat.PSSM}"][:, 3])
+                    expected_values.setdefault(Efeat.DISTANCE, []).append(entry_group[f"{Efeat.EDGE}/{Efeat.DISTANCE}"][()])
+
+        for _ in range(2):  # the second time, from the cache
+            stats = compute_feature_stats(hdf5_paths, features_dict, cpu_count=2)
+
+            assert len(stats) == 1 + 20 + 1
+            for column_name, values in expected_values.items():
+                values = np.concatenate(values)
+                assert stats[column_name].count == values.size
+                assert np.isclose(stats[column_name].mean, values.mean())
+                assert np.isclose(stats[column_name].std, values.std())
+
+            for hdf5_path in hdf5_paths:
+                assert os.path.isfile(get_sidecar_path(hdf5_path, STATS_FILE_SUFFIX))
+
+        # a changed file is not taken from the cache
+        with h5py.File(hdf5_paths[0], 'a') as f5:
+            del f5[list(f5.keys())[0]]
+
+        stats = compute_feature_stats(hdf5_paths, features_dict)
+        assert stats[Nfeat.BSA].count < np.concatenate(expected_values[Nfeat.BSA]).size
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_cached_stats_kept_by_preclustering():
+
+    temp_dir = mkdtemp()
+    try:
+        hdf5_path = os.path.join(temp_dir, "test.hdf5")
+        shutil.copy("tests/data/hdf5/test.hdf5", hdf5_path)
+
+        features_dict = {Nfeat.NODE: [Nfeat.BSA]}
+        stats = compute_feature_stats([hdf5_path], features_dict)
+
+        dataset = GraphDataset(hdf5_path, target=targets.BINARY, clustering_method="mcl", tqdm=False)
+        precluster_dataset(dataset, "mcl")
+
+        cached_stats = _read_cached_stats(hdf5_path) # pylint: disable=protected-access
+        assert cached_stats[f"{Nfeat.NODE}/{Nfeat.BSA}"][Nfeat.BSA].mean == stats[Nfeat.BSA].mean
+    finally:
+        shutil.rmtree(temp_dir)
@@ -1,9 +1,15 @@
+import os
+import shutil
+import tempfile
+
 import h5py
 import numpy as np
 
+from deeprankcore.domain import gridstorage
 from deeprankcore.query import (ProteinProteinInterfaceAtomicQuery,
                                 ProteinProteinInterfaceResidueQuery)
-from deeprankcore.utils.grid import Grid, GridSettings, MapMethod
+from deeprankcore.utils.grid import (Grid, GridSettings, MapMethod,
+                                     _get_relative_axes, read_grid_feature)
 
 
 def test_residue_grid_orientation():
@@ -100,3 +106,105 @@ def test_atomic_grid_orientation():
 
     assert grid.zs.shape == target_zs.shape
     assert np.all(np.abs(grid.zs - target_zs) < coord_error_margin), f"\n{grid.zs} != \n{target_zs}"
+
+
+def test_sparse_grid_storage():
+
+    points_counts = [20, 20, 20]
+    grid_sizes = [20.0, 20.0, 20.0]
+    center = [0.0, 0.0, 0.0]
+
+    positions = [np.array([-3.0, 1.0, 2.5]), np.array([4.0, -2.0, 0.5])]
+    values = [1.0, np.array([0.5, -2.0])]
+
+    tmp_dir_path = tempfile.mkdtemp()
+    try:
+        dense_path = os.path.join(tmp_dir_path, "dense.hdf5")
+        sparse_path = os.path.join(tmp_dir_path, "sparse.hdf5")
+
+        for hdf5_path, sparse in [(dense_path, False), (sparse_path, True)]:
+            grid = Grid("test_grid", center, GridSettings(points_counts, grid_sizes, sparse=sparse))
+            for position, value in zip(positions, values):
+                grid.map_feature(position, "feature", value, MapMethod.FAST_GAUSSIAN)
+            grid.to_hdf5(hdf5_path)
+
+        with h5py.File(dense_path, 'r') as dense_file, h5py.File(sparse_path, 'r') as sparse_file:
+            dense_group = dense_file[f"test_grid/{gridstorage.MAPPED_FEATURES}"]
+            sparse_group = sparse_file[f"test_grid/{gridstorage.MAPPED_FEATURES}"]
+
+            assert set(dense_group.keys()) == set(sparse_group.keys())
+            for feature_name in dense_group:
+                assert isinstance(sparse_group[feature_name], h5py.Group)
+
+                dense_data = read_grid_feature(dense_group[feature_name])
+                sparse_data = read_grid_feature(sparse_group[feature_name])
+
+                assert sparse_data.shape == tuple(points_counts)
+                assert np.count_nonzero(dense_data) < dense_data.size
+                assert sparse_group[feature_name][gridstorage.SPARSE_VALUES].shape[0] == np.count_nonzero(dense_data)
+                assert np.allclose(dense_data, sparse_data)
+    finally:
+        shutil.rmtree(tmp_dir_path)
+
+
+def test_grid_mesh_shared_between_grids():
+
+    settings = GridSettings([10, 12, 14], [20.0, 24.0, 28.0])
+
+    grid1 = Grid("grid1", [0.0, 0.0, 0.0], settings)
+    grid2 = Grid("grid2", [5.0, -3.0, 1.0], GridSettings([10, 12, 14], [20.0, 24.0, 28.0]))
+
+    # same settings, so the grids only differ by a translation
+    assert np.allclose(grid2.xs - grid1.xs, 5.0)
+    assert np.allclose(grid2.ys - grid1.ys, -3.0)
+    assert np.allclose(grid2.zs - grid1.zs, 1.0)
+
+    # the relative axes are computed only once
+    assert _get_relative_axes((10, 12, 14), (20.0, 24.0, 28.0)) is _get_relative_axes((10, 12, 14), (20.0, 24.0, 28.0))
+
+    # meshes are consistent with the axes, in x, y, z order
+    assert grid2.shape == (10, 12, 14)
+    assert grid2.xgrid.shape == grid2.ygrid.shape == grid2.zgrid.shape == (10, 12, 14)
+    assert grid2.xgrid[3, 4, 5] == grid2.xs[3]
+    assert grid2.ygrid[3, 4, 5] == grid2.ys[4]
+    assert grid2.zgrid[3, 4, 5] == grid2.zs[5]
+
+
+def test_nearest_neighbours_mapping():
+
+    settings = GridSettings([10, 10, 10], [10.0, 10.0, 10.0])
+    center = [0.0, 0.0, 0.0]
+
+    rng = np.random.default_rng(7)
+    positions = rng.uniform(-4.0, 4.0, size=(25, 3))
+    values = [rng.uniform(-1.0, 1.0, size=2) for _ in range(25)]
+
+    # all points at once
+    grid = Grid("grid", center, settings)
+    grid.map_features(positions, "feature", values, MapMethod.NEAREST_NEIGHBOURS)
+
+    # one point at a time
+    single_point_grid = Grid("grid", center, settings)
+    for position, value in zip(positions, values):
+        single_point_grid.map_feature(position, "feature", value, MapMethod.NEAREST_NEIGHBOURS)
+
+    assert set(grid.features.keys()) == {"feature_000", "feature_001"}
+    for feature_name, data in grid.features.items():
+        assert np.allclose(data, single_point_grid.features[feature_name], atol=1e-5)
+
+        # the values are divided over the grid points, not changed
+        channel = int(feature_name[-3:])
+        assert np.isclose(np.sum(data), np.sum([value[channel] for value in values]), atol=1e-4)
+
+    # a point on a grid point only maps to that grid point
+    grid = Grid("grid", center, settings)
+    position = np.array([grid.xs[2], grid.ys[5], grid.zs[7]])
+    grid.map_feature(position, "feature", 3.0, MapMethod.NEAREST_NEIGHBOURS)
+
+    assert np.isclose(grid.features["feature"][2, 5, 7], 3.0)
+    assert np.count_nonzero(grid.features["feature"]) == 1
+
+    # points outside of the grid are ignored
+    grid = Grid("grid", center, settings)
+    grid.map_feature(np.array([100.0, 0.0, 0.0]), "feature", 3.0, MapMethod.NEAREST_NEIGHBOURS)
+    assert np.count_nonzero(grid.features["feature"]) == 0
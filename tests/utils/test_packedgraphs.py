@@ -0,0 +1,68 @@
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import pytest
+import torch
+
+from deeprankcore.dataset import GraphDataset
+from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import nodestorage as Nfeat
+from deeprankcore.domain import targetstorage as targets
+from deeprankcore.utils.packedgraphs import PackedGraphs, pack_graphs
+
+
+def test_packed_graphs_equal_hdf5():
+
+    hdf5_path = "tests/data/hdf5/1ATN_ppi.hdf5"
+    node_features = [Nfeat.RESTYPE, Nfeat.POLARITY, Nfeat.BSA, Nfeat.RESDEPTH, Nfeat.HSE, Nfeat.INFOCONTENT, Nfeat.PSSM]
+    edge_features = [Efeat.DISTANCE, Efeat.VDW]
+
+    packed_path = mkdtemp()
+    try:
+        pack_graphs(hdf5_path, packed_path)
+
+        packed_graphs = PackedGraphs(packed_path)
+        assert packed_graphs.get_entry_index(hdf5_path, "residue-ppi-1ATN_1w:A-B") is not None
+        assert packed_graphs.get_entry_index(hdf5_path, "unknown") is None
+
+        dataset = GraphDataset(hdf5_path, node_features=node_features, edge_features=edge_features,
+                               target=targets.IRMSD, standardize=True)
+        packed_dataset = GraphDataset(hdf5_path, node_features=node_features, edge_features=edge_features,
+                                      target=targets.IRMSD, standardize=True, packed_path=packed_path)
+
+        for idx in range(len(dataset)):
+            data = dataset.get(idx)
+            packed_data = packed_dataset.get(idx)
+
+            assert torch.allclose(packed_data.x, data.x, atol=1e-5, equal_nan=True)
+            assert torch.equal(packed_data.edge_index, data.edge_index)
+            assert torch.allclose(packed_data.edge_attr, data.edge_attr, atol=1e-5, equal_nan=True)
+            assert torch.equal(packed_data.pos, data.pos)
+            assert torch.equal(packed_data.y, data.y)
+            assert packed_data.entry_names == data.entry_names
+    finally:
+        rmtree(packed_path)
+
+
+def test_packed_graphs_without_metafeatures():
+
+    hdf5_path = "tests/data/hdf5/1ATN_ppi.hdf5"
+    node_features = [Nfeat.RESTYPE, Nfeat.BSA, Nfeat.PSSM]
+    edge_features = [Efeat.DISTANCE]
+
+    packed_path = mkdtemp()
+    try:
+        pack_graphs(hdf5_path, packed_path, node_features=node_features, edge_features=edge_features)
+        packed_dataset = GraphDataset(hdf5_path, node_features=node_features, edge_features=edge_features,
+                                      target=targets.IRMSD, packed_path=packed_path)
+
+        # the metafeatures aren't loaded as features, so the packed graphs don't need them
+        packed_dataset.node_features = node_features + [Nfeat.POSITION]
+        packed_dataset.edge_features = edge_features + [Efeat.INDEX]
+        packed_dataset._check_packed_features() # pylint: disable=protected-access
+
+        packed_dataset.node_features = node_features + [Nfeat.HSE]
+        with pytest.raises(ValueError):
+            packed_dataset._check_packed_features() # pylint: disable=protected-access
+    finally:
+        rmtree(packed_path)
@@ -0,0 +1,89 @@
+import torch
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
+
+from deeprankcore.utils.profiling import PassProfile, get_peak_rss
+
+
+def _get_graphs(count: int):
+    return [Data(x=torch.rand(index + 2, 3), edge_index=torch.tensor([[0, 1], [1, 0]]), y=torch.tensor([index]))
+            for index in range(count)]
+
+
+def test_stages():
+    profile = PassProfile()
+    profile.start()
+    for _ in range(3):
+        with profile.stage("forward"):
+            torch.rand(100, 100).sum()
+        with profile.stage("backward"):
+            pass
+    profile.stop()
+
+    metrics = profile.summary()
+
+    assert set(profile.stage_times) == {"forward", "backward"}
+    assert metrics["time/total"] >= metrics["time/forward"] + metrics["time/backward"]
+    assert metrics["time/other"] >= 0.0
+    assert metrics["batches"] == 0
+
+
+def test_iterate_splits_loading():
+    graphs = _get_graphs(5)
+    loader = DataLoader(graphs, batch_size=2)
+    collate_fn = loader.collate_fn
+
+    profile = PassProfile()
+    profile.start()
+    batches = []
+    for data_batch in profile.iterate(loader):
+        profile.add_batch(data_batch)
+        batches.append(data_batch)
+    profile.stop()
+
+    metrics = profile.summary()
+
+    assert loader.collate_fn is collate_fn
+    assert [data_batch.num_graphs for data_batch in batches] == [2, 2, 1]
+    assert "time/load" not in metrics
+    assert metrics["time/read"] >= 0.0
+    assert metrics["time/collate"] > 0.0
+
+    assert metrics["batches"] == 3
+    assert metrics["samples"] == 5
+    assert metrics["samples_per_second"] > 0.0
+    assert metrics["mean_nodes_per_graph"] == sum(graph.num_nodes for graph in graphs) / 5
+    assert metrics["mean_edges_per_graph"] == 2
+    assert metrics["max_nodes_per_batch"] == 4 + 5
+    assert metrics["max_edges_per_batch"] == 4
+
+
+def test_disabled():
+    graphs = _get_graphs(3)
+    loader = DataLoader(graphs, batch_size=2)
+
+    profile = PassProfile(enabled=False)
+    profile.start()
+    for data_batch in profile.iterate(loader):
+        profile.add_batch(data_batch)
+        with profile.stage("forward"):
+            pass
+    profile.stop()
+
+    assert profile.stage_times == {}
+    assert profile.num_samples == 0
+
+
+def test_record_functions():
+    profile = PassProfile(record_functions=True)
+
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU]) as torch_profiler:
+        with profile.stage("forward"):
+            torch.rand(10, 10).sum()
+
+    assert "forward" in [event.key for event in torch_profiler.key_averages()]
+
+
+def test_peak_rss():
+    peak_rss = get_peak_rss()
+    assert peak_rss is None or peak_rss > 0.0
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import tempfile
+from shutil import rmtree
+
+import pytest
+import torch
+import torch.nn.functional as F
+from torch_geometric.loader import DataLoader
+
+from deeprankcore.dataset import GraphDataset
+from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import nodestorage as Nfeat
+from deeprankcore.domain import targetstorage as targets
+from deeprankcore.neuralnets.cnn.model3d import CnnClassification
+from deeprankcore.neuralnets.gnn.foutnet import FoutNet
+from deeprankcore.neuralnets.gnn.ginet import GINet
+from deeprankcore.neuralnets.gnn.naive_gnn import NaiveNetwork
+from deeprankcore.neuralnets.gnn.sgat import SGAT
+from deeprankcore.trainer import Trainer
+from deeprankcore.utils.scripting import script_model
+
+
+def _get_trained_batch(neuralnet):
+    "a trainer for the network, with its datasets preclustered, and a batch of its training set"
+
+    dataset = GraphDataset(
+        hdf5_path="tests/data/hdf5/test.hdf5",
+        node_features=[Nfeat.RESTYPE, Nfeat.POLARITY, Nfeat.BSA],
+        edge_features=[Efeat.DISTANCE],
+        target=targets.BINARY,
+        clustering_method="mcl",
+        tqdm=False,
+    )
+    trainer = Trainer(neuralnet, dataset, val_size=0, output_exporters=[])
+    batch = next(iter(DataLoader(dataset, batch_size=4)))
+
+    return trainer, batch
+
+
+@pytest.mark.parametrize("neuralnet", [GINet, FoutNet, SGAT, NaiveNetwork])
+def test_script_model(neuralnet):
+
+    trainer, batch = _get_trained_batch(neuralnet)
+    trainer.model.eval()
+
+    with torch.no_grad():
+        expected = F.softmax(trainer.model(batch.clone()), dim=1)
+
+    scripted_model = script_model(trainer.model, classification=True)
+    outputs = scripted_model(batch.x, batch.edge_index, batch.edge_attr, batch.batch, batch.cluster0, batch.cluster1)
+
+    assert torch.allclose(outputs, expected, atol=1e-6)
+
+    # the batch is left unchanged, so that running it again gives the same outputs
+    assert torch.allclose(scripted_model(batch.x, batch.edge_index, batch.edge_attr, batch.batch, batch.cluster0, batch.cluster1),
+                          outputs)
+
+
+@pytest.mark.parametrize("neuralnet", [GINet, NaiveNetwork])
+def test_compile_model(neuralnet):
+
+    trainer, batch = _get_trained_batch(neuralnet)
+    trainer.model.eval()
+
+    with torch.no_grad():
+        expected = trainer.model(batch.clone())
+        outputs = torch.compile(trainer.model, backend="eager")(batch.clone())
+
+    assert torch.allclose(outputs, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("neuralnet", [GINet, FoutNet, SGAT, NaiveNetwork])
+def test_compile_forward_tensors_without_graph_breaks(neuralnet):
+
+    trainer, batch = _get_trained_batch(neuralnet)
+    trainer.model.eval()
+    inputs = (batch.x, batch.edge_index, batch.edge_attr, batch.batch, batch.cluster0, batch.cluster1)
+
+    # the number of clusters and of pooled edges depends on the data, which dynamo traces as unbacked sizes
+    with torch.no_grad(), torch._dynamo.config.patch( # pylint: disable=protected-access
+        capture_scalar_outputs=True, capture_dynamic_output_shape_ops=True
+    ):
+        expected = trainer.model.forward_tensors(*inputs)
+        # fullgraph fails on any graph break
+        outputs = torch.compile(trainer.model.forward_tensors, backend="eager", fullgraph=True)(*inputs)
+
+    assert torch.allclose(outputs, expected, atol=1e-6)
+
+
+def test_load_scripted_model_without_deeprankcore():
+
+    trainer, batch = _get_trained_batch(GINet)
+
+    work_directory = tempfile.mkdtemp()
+    try:
+        scripted_path = os.path.join(work_directory, "model.pt")
+        inputs_path = os.path.join(work_directory, "inputs.pt")
+        trainer.save_model(os.path.join(work_directory, "model.pth.tar"), scripted_filename=scripted_path)
+
+        inputs = [batch.x, batch.edge_index, batch.edge_attr, batch.batch, batch.cluster0, batch.cluster1]
+        torch.save(inputs, inputs_path)
+
+        script = ("import sys, torch, torch_scatter\n"
+                  f"outputs = torch.jit.load({scripted_path!r})(*torch.load({inputs_path!r}))\n"
+                  "assert not any(name.split('.')[0] in ('deeprankcore', 'torch_geometric') for name in sys.modules)\n"
+                  "print(outputs.shape[0], outputs.shape[1])\n")
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=False, cwd=work_directory)
+
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.split() == [str(batch.num_graphs), "2"]
+    finally:
+        rmtree(work_directory)
+
+
+def test_script_model_without_forward_tensors():
+
+    with pytest.raises(TypeError):
+        script_model(CnnClassification(1, (10, 10, 10)), classification=True)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from deeprankcore.utils.splits import split_indices
+
+
+def test_random_split():
+
+    main_indices, split_off_indices = split_indices(10, 3)
+
+    assert len(split_off_indices) == 3
+    assert sorted(np.concatenate([main_indices, split_off_indices]).tolist()) == list(range(10))
+
+
+def test_stratified_split():
+
+    labels = np.array([0] * 12 + [1] * 6 + [2] * 2)
+
+    for _ in range(10):
+        main_indices, split_off_indices = split_indices(len(labels), 5, labels=labels)
+
+        assert sorted(np.concatenate([main_indices, split_off_indices]).tolist()) == list(range(len(labels)))
+        assert np.bincount(labels[split_off_indices], minlength=3).tolist() == [3, 1, 1]
+
+
+def test_grouped_split():
+
+    groups = ["a", "a", "b", "b", "b", "c", "d", "d"]
+
+    for _ in range(10):
+        main_indices, split_off_indices = split_indices(len(groups), 3, groups=groups)
+
+        assert len(split_off_indices) >= 3
+        assert sorted(np.concatenate([main_indices, split_off_indices]).tolist()) == list(range(len(groups)))
+        assert not {groups[index] for index in main_indices} & {groups[index] for index in split_off_indices}
+
+
+def test_invalid_split():
+
+    with pytest.raises(ValueError):
+        split_indices(4, 1, labels=np.zeros(4), groups=["a"] * 4)
+
+    with pytest.raises(ValueError):
+        split_indices(4, 1, labels=np.zeros(3))
+
+    # a single group can't be split
+    with pytest.raises(ValueError):
+        split_indices(4, 1, groups=["a"] * 4)
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from shutil import rmtree
+
+import pytest
+
+from deeprankcore.dataset import GraphDataset
+from deeprankcore.domain import edgestorage as Efeat
+from deeprankcore.domain import nodestorage as Nfeat
+from deeprankcore.domain import targetstorage as targets
+from deeprankcore.neuralnets.gnn.naive_gnn import NaiveNetwork
+from deeprankcore.utils.datacache import DataCache
+from deeprankcore.utils.sweep import SweepConfiguration, run_sweep
+
+
+def _get_dataset(cache=None):
+    return GraphDataset(
+        hdf5_path="tests/data/hdf5/test.hdf5",
+        node_features=[Nfeat.RESTYPE, Nfeat.POLARITY, Nfeat.BSA],
+        edge_features=[Efeat.DISTANCE],
+        target=targets.BINARY,
+        tqdm=False,
+        cache=cache,
+    )
+
+
+def _get_configurations():
+    return [
+        SweepConfiguration(f"lr{lr}", NaiveNetwork, optimizer_options={"lr": lr},
+                           train_options={"nepoch": 2, "batch_size": 4, "validate": True})
+        for lr in (0.01, 0.001)
+    ]
+
+
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_run_sweep(num_processes):
+
+    cache = DataCache(max_bytes=2**30, policy="static", shared=True)
+    dataset = _get_dataset(cache)
+
+    output_directory = tempfile.mkdtemp()
+    try:
+        results = run_sweep(_get_configurations(), dataset, dataset, num_processes=num_processes, num_threads=1,
+                            output_directory=output_directory)
+
+        assert [result.name for result in results] == ["lr0.01", "lr0.001"]
+        for result in results:
+            assert result.error is None, result.error
+            assert sorted(result.losses) == ["training", "validation"]
+            assert sorted(result.losses["validation"]) == [0, 1, 2]
+            assert result.best_validation_loss == min(result.losses["validation"][1], result.losses["validation"][2])
+            assert result.epoch_saved_model in (1, 2)
+
+            assert os.path.isfile(os.path.join(output_directory, result.name, "output_exporter.hdf5"))
+            assert any(name.startswith("model") for name in os.listdir(os.path.join(output_directory, result.name)))
+    finally:
+        rmtree(output_directory)
+
+    # the graphs were cached before the configurations ran
+    assert len(cache) == len(dataset)
+
+
+def test_failed_configuration():
+
+    dataset = _get_dataset()
+    configurations = _get_configurations() + [
+        SweepConfiguration("invalid", NaiveNetwork, train_options={"nepoch": 1, "max_batch_nodes": 0}),
+    ]
+
+    output_directory = tempfile.mkdtemp()
+    try:
+        results = run_sweep(configurations, dataset, dataset, output_directory=output_directory)
+    finally:
+        rmtree(output_directory)
+
+    assert [result.error is None for result in results] == [True, True, False]
+    assert "ValueError" in results[2].error
+
+
+def test_invalid_configurations():
+
+    with pytest.raises(ValueError):
+        SweepConfiguration("a/b", NaiveNetwork)
+
+    with pytest.raises(ValueError):
+        SweepConfiguration("a", NaiveNetwork, trainer_options={"output_exporters": []})
+
+    with pytest.raises(ValueError):
+        run_sweep([SweepConfiguration("a", NaiveNetwork), SweepConfiguration("a", NaiveNetwork)], _get_dataset())
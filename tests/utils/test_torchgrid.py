@@ -0,0 +1,57 @@
+import numpy as np
+import torch
+from torch_geometric.data.data import Data
+from torch.utils.data import DataLoader
+
+from deeprankcore.utils.grid import Grid, GridSettings, MapMethod
+from deeprankcore.utils.torchgrid import GridCollater, map_to_grid
+
+
+def _map_with_numpy(positions, values, center, settings, method):
+
+    grid = Grid("test", center, settings)
+    grid.map_features(positions, "feature", list(values), method)
+
+    return np.stack([grid.features[f"feature_{index:03d}"] for index in range(values.shape[1])])
+
+
+def test_map_to_grid_equals_numpy_grid():
+
+    settings = GridSettings([8, 10, 12], [14.0, 16.0, 18.0], dtype=np.float64)
+
+    rng = np.random.default_rng(0)
+    centers = np.array([[1.0, -2.0, 3.0], [10.0, 0.0, -5.0]])
+    positions = [center + rng.uniform(-6.0, 6.0, (count, 3)) for center, count in zip(centers, (7, 5))]
+    values = [rng.uniform(0.0, 1.0, (len(points), 2)) for points in positions]
+    batch = np.concatenate([np.full(len(points), index) for index, points in enumerate(positions)])
+
+    for method in (MapMethod.GAUSSIAN, MapMethod.FAST_GAUSSIAN, MapMethod.BSP_LINE, MapMethod.NEAREST_NEIGHBOURS):
+
+        grids = map_to_grid(torch.tensor(np.concatenate(positions)), torch.tensor(np.concatenate(values)),
+                            torch.tensor(batch), torch.tensor(centers), settings, method)
+
+        assert grids.shape == (2, 2, 8, 10, 12)
+
+        for index, center in enumerate(centers):
+            expected = _map_with_numpy(positions[index], values[index], center, settings, method)
+            assert np.allclose(grids[index].numpy(), expected), method
+
+
+def test_grid_collater():
+
+    settings = GridSettings([6, 6, 6], [10.0, 10.0, 10.0])
+
+    data_list = []
+    for index in range(3):
+        data = Data(x=torch.rand(4, 3), edge_index=torch.tensor([[0, 1, 2], [1, 2, 3]]),
+                    edge_attr=torch.rand(3, 1), pos=torch.rand(4, 3) * 5.0, y=torch.tensor([float(index)]))
+        data.entry_names = f"entry-{index}"
+        data_list.append(data)
+
+    loader = DataLoader(data_list, batch_size=3, collate_fn=GridCollater(settings, MapMethod.GAUSSIAN))
+    batch = next(iter(loader))
+
+    assert batch.x.shape == (3, 4, 6, 6, 6)
+    assert batch.x.dtype == torch.float32
+    assert torch.equal(batch.y, torch.tensor([0.0, 1.0, 2.0]))
+    assert batch.entry_names == ["entry-0", "entry-1", "entry-2"]